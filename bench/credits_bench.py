@@ -0,0 +1,114 @@
+"""
+Нагрузочный бенчмарк core.credits: параллельные пополнения и списания на временной БД.
+
+Сравнивает прежнюю схему (соединение на операцию, списание «прочитали — записали»)
+с CreditsStore (одно соединение, атомарное условное списание, пачки пополнений) и
+проверяет инварианты: итоговый баланс = пополнения − успешные списания, в минус
+никто не ушёл.
+
+    python -m bench.credits_bench [--users 50] [--ops 5000] [--concurrency 200]
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+import aiosqlite
+
+from core.credits import CREATE_SQL, CreditsStore
+
+
+class LegacyStore:
+    """Прежняя реализация core.credits — для сравнения."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    async def init(self):
+        async with aiosqlite.connect(self.path) as db:
+            await db.execute(CREATE_SQL)
+            await db.commit()
+
+    async def get_balance(self, user_id: int) -> int:
+        async with aiosqlite.connect(self.path) as db:
+            async with db.execute("SELECT balance FROM credits WHERE user_id=?", (user_id,)) as cur:
+                row = await cur.fetchone()
+                return row[0] if row else 0
+
+    async def add(self, user_id: int, amount: int = 1):
+        async with aiosqlite.connect(self.path) as db:
+            await db.execute(
+                "INSERT INTO credits(user_id, balance) VALUES(?, ?) "
+                "ON CONFLICT(user_id) DO UPDATE SET balance=balance+excluded.balance",
+                (user_id, amount),
+            )
+            await db.commit()
+
+    async def consume(self, user_id: int) -> bool:
+        async with aiosqlite.connect(self.path) as db:
+            async with db.execute("SELECT balance FROM credits WHERE user_id=?", (user_id,)) as cur:
+                row = await cur.fetchone()
+                if (row[0] if row else 0) <= 0:
+                    return False
+            await db.execute("UPDATE credits SET balance=balance-1 WHERE user_id=?", (user_id,))
+            await db.commit()
+            return True
+
+    async def close(self):
+        pass
+
+
+async def workload(store, users: int, ops: int, concurrency: int, seed: int = 1):
+    rnd = random.Random(seed)
+    plan = [("add" if rnd.random() < 0.4 else "consume", rnd.randrange(users)) for _ in range(ops)]
+    added = [0] * users
+    consumed = [0] * users
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(kind: str, user: int):
+        async with sem:
+            if kind == "add":
+                await store.add(user, 1)
+                added[user] += 1
+            elif await store.consume(user):
+                consumed[user] += 1
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one(k, u) for k, u in plan))
+    elapsed = time.perf_counter() - t0
+    balances = [await store.get_balance(u) for u in range(users)]
+    lost = sum(1 for u in range(users) if balances[u] != added[u] - consumed[u])
+    negative = sum(1 for b in balances if b < 0)
+    return ops / elapsed, lost, negative
+
+
+async def bench(name: str, store, args) -> None:
+    if isinstance(store, LegacyStore):
+        await store.init()
+    rate, lost, negative = await workload(store, args.users, args.ops, args.concurrency)
+    await store.close()
+    print(
+        f"{name:8s} {rate:9.0f} ops/s   users with mismatched balance: {lost:3d}   "
+        f"negative: {negative}"
+    )
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--users", type=int, default=50)
+    ap.add_argument("--ops", type=int, default=5000)
+    ap.add_argument("--concurrency", type=int, default=200)
+    ap.add_argument("--skip-legacy", action="store_true")
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as d:
+        if not args.skip_legacy:
+            asyncio.run(bench("legacy", LegacyStore(os.path.join(d, "legacy.db")), args))
+        asyncio.run(bench("store", CreditsStore(os.path.join(d, "store.db")), args))
+
+
+if __name__ == "__main__":
+    main()
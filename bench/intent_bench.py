@@ -0,0 +1,63 @@
+"""
+Микробенчмарк эвристик classify_intent: прежний цикл re.search по каждому шаблону
+против скомпилированных альтернаций (nlp.intent.match_intent).
+
+    python -m bench.intent_bench [--rounds 200]
+"""
+
+import argparse
+import os
+import re
+import time
+
+from nlp.intent import (
+    LEGAL_KEYWORDS,
+    LEGAL_SHORT_TRIGGERS,
+    OFFTOPIC_PATTERNS,
+    PARALEGAL_HINTS,
+    match_intent,
+)
+
+CORPUS = os.path.join(os.path.dirname(__file__), "..", "tests", "data", "intent_samples.txt")
+
+
+def legacy(text: str):
+    def m(patterns):
+        t = (text or "").lower()
+        return any(re.search(p, t) for p in patterns)
+
+    t = (text or "").strip()
+    if not t or m(OFFTOPIC_PATTERNS):
+        return "OFFTOPIC"
+    if m(LEGAL_KEYWORDS) or m(LEGAL_SHORT_TRIGGERS):
+        return "LEGAL"
+    if m(PARALEGAL_HINTS):
+        return "PARALEGAL"
+    return None
+
+
+def run(fn, samples, rounds: int) -> float:
+    t0 = time.perf_counter()
+    for _ in range(rounds):
+        for s in samples:
+            fn(s)
+    return (time.perf_counter() - t0) / (rounds * len(samples)) * 1e6
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rounds", type=int, default=200)
+    args = ap.parse_args()
+
+    with open(CORPUS, encoding="utf-8") as f:
+        samples = [ln.strip() for ln in f if ln.strip() and not ln.startswith("#")]
+
+    old = run(legacy, samples, args.rounds)
+    new = run(match_intent, samples, args.rounds)
+    print(f"samples={len(samples)} rounds={args.rounds}")
+    print(f"legacy re.search loop : {old:8.2f} us/msg")
+    print(f"compiled alternations : {new:8.2f} us/msg  (x{old / new:.1f})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+"""
+Бенчмарк полного конвейера handle_question без сети (запись / воспроизведение, bench/replay.py).
+
+Из коробки replay берёт bench/fixtures/sample.jsonl — небольшой синтетический набор
+(выдача DDG/Startpage, страницы статей, ответы OpenAI на классификацию, план и ответ;
+реальных вопросов пользователей и ключей в нём нет). Вопросы сопоставляются с ним
+loose-подбором по эндпоинту, задержки — типовые. Для замеров на живых данных один раз
+записываем свой набор с настоящими ключами:
+
+    python -m bench.pipeline_bench record --out bench/fixtures/pipeline.jsonl
+
+потом гоняем сколько угодно офлайн, с нужной параллельностью, задержками и отказами:
+
+    python -m bench.pipeline_bench replay [--fixtures bench/fixtures/pipeline.jsonl] \\
+        [--concurrency 8] [--rounds 3] [--cold] [--latency 0.2 | --latency-scale 0.5] \\
+        [--fail-rate 0.1 --failure error|503|timeout --fail-host html.duckduckgo.com]
+
+Отчёт — p50/p95/p99 по этапам (span-ы core.metrics) и по вопросу целиком, пропускная
+способность, ошибки и счётчики транспорта. Кэш страниц и индекс кодексов на время
+прогона отключены; --cold ещё и чистит кэши в памяти перед каждым раундом.
+"""
+
+import argparse
+import asyncio
+import os
+import time
+from collections import defaultdict
+from typing import Dict, List
+
+QUESTIONS = os.path.join(os.path.dirname(__file__), "questions.txt")
+SAMPLE_FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures", "sample.jsonl")
+
+
+def _prepare_env(replay: bool) -> None:
+    # до импорта bot/core.config: офлайн-прогону не нужны диск и настоящие ключи
+    os.environ["PAGE_CACHE_PATH"] = ""
+    os.environ["STATUTE_INDEX_PATH"] = ""
+    os.environ["SEARCH_CACHE_PATH"] = ""
+    os.environ["ANSWER_CACHE_PATH"] = ""
+    os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123456:AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA")
+    if replay:
+        os.environ["OPENAI_API_KEY"] = "replay"
+
+
+def percentile(values: List[float], p: float) -> float:
+    """Ближайший ранг (как в отчётах нагрузочных тестов)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * p // 100))
+    return ordered[int(rank) - 1]
+
+
+def load_questions(path: str) -> List[str]:
+    with open(path, encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith("#")]
+
+
+async def drive(questions: List[str], concurrency: int, rounds: int, cold: bool) -> Dict:
+    import bot
+    from core.cache import clear_caches
+    from core.metrics import trace
+
+    samples: Dict[str, List[float]] = defaultdict(list)
+    errors = 0
+    sem = asyncio.Semaphore(max(1, concurrency))
+
+    async def one(q: str) -> None:
+        nonlocal errors
+        async with sem:
+            with trace() as spans:
+                started = time.perf_counter()
+                try:
+                    await bot.handle_question(q)
+                except Exception as e:
+                    errors += 1
+                    print(f"  error: {q[:40]!r}: {e!r}")
+                samples["total"].append(time.perf_counter() - started)
+            for stage, seconds in spans.items():
+                samples[stage].append(seconds)
+
+    started = time.perf_counter()
+    for _ in range(rounds):
+        if cold:
+            clear_caches()
+        await asyncio.gather(*(one(q) for q in questions))
+    elapsed = time.perf_counter() - started
+    return {
+        "samples": samples,
+        "errors": errors,
+        "elapsed": elapsed,
+        "count": len(questions) * rounds,
+    }
+
+
+def report(result: Dict) -> None:
+    samples = result["samples"]
+    print(
+        f"{result['count']} questions in {result['elapsed']:.2f}s "
+        f"({result['count'] / result['elapsed']:.2f} q/s), errors: {result['errors']}"
+    )
+    print(f"{'stage':16s} {'n':>5s} {'p50 ms':>9s} {'p95 ms':>9s} {'p99 ms':>9s}")
+    order = [
+        "intent",
+        "plan",
+        "statute_index",
+        "search",
+        "fetch",
+        "rank",
+        "answer",
+        "handle_question",
+        "total",
+    ]
+    for stage in sorted(samples, key=lambda s: (order.index(s) if s in order else len(order), s)):
+        v = samples[stage]
+        print(
+            f"{stage:16s} {len(v):5d} {percentile(v, 50) * 1000:9.1f} "
+            f"{percentile(v, 95) * 1000:9.1f} {percentile(v, 99) * 1000:9.1f}"
+        )
+
+
+async def _record(args) -> None:
+    from bench.replay import FixtureStore, RecordingTransport
+    from core.http import aclose_clients, set_transport_wrapper
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    store = FixtureStore(args.out)
+    set_transport_wrapper(lambda inner: RecordingTransport(inner, store))
+    try:
+        result = await drive(load_questions(args.questions), args.concurrency, 1, cold=True)
+    finally:
+        set_transport_wrapper(None)
+        await aclose_clients()
+    report(result)
+    print(f"recorded {len(store)} responses -> {args.out}")
+
+
+async def _replay(args) -> None:
+    from bench.replay import FixtureStore, ReplayTransport
+    from core.http import aclose_clients, set_transport_wrapper
+
+    store = FixtureStore.load(args.fixtures)
+    replay = ReplayTransport(
+        store,
+        latency=args.latency,
+        latency_scale=args.latency_scale,
+        fail_rate=args.fail_rate,
+        failure=args.failure,
+        fail_hosts=args.fail_host,
+        loose=not args.strict,
+    )
+    set_transport_wrapper(lambda inner: replay)
+    try:
+        result = await drive(
+            load_questions(args.questions), args.concurrency, args.rounds, args.cold
+        )
+    finally:
+        set_transport_wrapper(None)
+        await aclose_clients()
+    report(result)
+    print("transport:", dict(replay.stats))
+
+
+def main():
+    ap = argparse.ArgumentParser(prog="python -m bench.pipeline_bench")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    rec = sub.add_parser("record", help="прогнать вопросы по живым сервисам и записать ответы")
+    rec.add_argument("--out", default="bench/fixtures/pipeline.jsonl")
+    rec.add_argument("--questions", default=QUESTIONS)
+    rec.add_argument("--concurrency", type=int, default=2)
+
+    rep = sub.add_parser("replay", help="воспроизвести записанное без сети и замерить этапы")
+    rep.add_argument("--fixtures", default=SAMPLE_FIXTURES)
+    rep.add_argument("--questions", default=QUESTIONS)
+    rep.add_argument("--concurrency", type=int, default=8)
+    rep.add_argument("--rounds", type=int, default=3)
+    rep.add_argument(
+        "--cold", action="store_true", help="чистить кэши в памяти перед каждым раундом"
+    )
+    rep.add_argument("--latency", type=float, default=None, help="фиксированная задержка ответа, с")
+    rep.add_argument(
+        "--latency-scale", type=float, default=1.0, help="множитель записанной задержки"
+    )
+    rep.add_argument("--fail-rate", type=float, default=0.0)
+    rep.add_argument("--failure", choices=("error", "503", "timeout"), default="error")
+    rep.add_argument("--fail-host", action="append", default=[])
+    rep.add_argument("--strict", action="store_true", help="только точные совпадения запросов")
+    args = ap.parse_args()
+
+    _prepare_env(replay=args.cmd == "replay")
+    asyncio.run(_record(args) if args.cmd == "record" else _replay(args))
+
+
+if __name__ == "__main__":
+    main()
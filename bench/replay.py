@@ -0,0 +1,228 @@
+"""
+Запись и воспроизведение внешних HTTP-ответов на уровне транспорта httpx.
+
+Поиск (DDG/Google CSE/SearXNG/Startpage), загрузка страниц и OpenAI ходят через
+async-клиенты httpx (core.http, nlp.openai_client), поэтому одна обёртка транспорта
+(core.http.set_transport_wrapper) покрывает весь конвейер handle_question:
+
+  - RecordingTransport пропускает запросы в сеть и пишет ответы в FixtureStore (JSONL);
+  - ReplayTransport отдаёт записанные ответы без сети: задержка — как при записи
+    (× latency_scale) или фиксированная, с инъекцией отказов (обрыв, 503, таймаут)
+    с заданной вероятностью.
+
+Ключ записи — метод + URL без секретов (key/api_key) + отпечаток тела. Для JSON-запросов
+к OpenAI системное сообщение в отпечаток не входит: в промпте текущая дата, а записи
+должны воспроизводиться и завтра.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import base64
+import hashlib
+import json
+import random
+import threading
+import time
+from collections import defaultdict
+from typing import Sequence
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import httpx
+
+SECRET_PARAMS = {"key", "api_key", "apikey", "token"}
+KEEP_HEADERS = ("content-type", "etag", "last-modified", "cache-control")
+FAILURES = ("error", "503", "timeout")
+
+
+def _clean_url(url: httpx.URL) -> str:
+    parts = urlsplit(str(url))
+    query = sorted(
+        (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if k not in SECRET_PARAMS
+    )
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(query), ""))
+
+
+def _body_fingerprint(request: httpx.Request, body: bytes) -> str:
+    if not body:
+        return ""
+    if request.headers.get("content-type", "").startswith("application/json"):
+        try:
+            data = json.loads(body)
+            if isinstance(data.get("messages"), list):
+                data["messages"] = [m for m in data["messages"] if m.get("role") != "system"]
+            body = json.dumps(data, sort_keys=True, ensure_ascii=False).encode()
+        except (ValueError, AttributeError):
+            pass
+    return hashlib.sha1(body).hexdigest()
+
+
+def _endpoint(request: httpx.Request, body: bytes) -> str:
+    """Грубый ключ для loose-подбора: метод + хост + путь, у OpenAI ещё и вид вызова."""
+    shape = ""
+    if body and request.headers.get("content-type", "").startswith("application/json"):
+        try:
+            data = json.loads(body)
+            fmt = (data.get("response_format") or {}).get("type", "")
+            shape = (
+                f" stream={bool(data.get('stream'))} format={fmt}"
+                f" max_tokens={data.get('max_tokens')}"
+            )
+        except (ValueError, AttributeError):
+            pass
+    return f"{request.method} {request.url.host}{request.url.path}{shape}"
+
+
+def request_key(request: httpx.Request, body: bytes) -> str:
+    return f"{request.method} {_clean_url(request.url)} {_body_fingerprint(request, body)}"
+
+
+class FixtureStore:
+    """Записанные ответы: key -> список (повторы одного запроса отдаются по кругу)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._by_key: dict[str, list[dict]] = defaultdict(list)
+        self._by_endpoint: dict[str, list[dict]] = defaultdict(list)
+        self._next: dict[str, int] = defaultdict(int)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path: str) -> FixtureStore:
+        store = cls(path)
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    store._index(json.loads(line))
+        return store
+
+    def __len__(self) -> int:
+        return sum(len(v) for v in self._by_key.values())
+
+    def _index(self, rec: dict) -> None:
+        self._by_key[rec["key"]].append(rec)
+        self._by_endpoint[rec["endpoint"]].append(rec)
+
+    def add(self, rec: dict) -> None:
+        with self._lock:
+            self._index(rec)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+
+    def _pick(self, table: dict[str, list[dict]], key: str) -> dict | None:
+        recs = table.get(key)
+        if not recs:
+            return None
+        with self._lock:
+            i = self._next[key]
+            self._next[key] = i + 1
+        return recs[i % len(recs)]
+
+    def find(self, key: str, endpoint: str, loose: bool = False) -> dict | None:
+        """Точное совпадение; при loose — любой ответ того же эндпоинта (см. _endpoint)."""
+        rec = self._pick(self._by_key, key)
+        if rec is None and loose:
+            rec = self._pick(self._by_endpoint, endpoint)
+        return rec
+
+
+class RecordingTransport(httpx.AsyncBaseTransport):
+    def __init__(self, inner: httpx.AsyncBaseTransport, store: FixtureStore):
+        self.inner = inner
+        self.store = store
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        body = await request.aread()
+        started = time.perf_counter()
+        response = await self.inner.handle_async_request(request)
+        content = await response.aread()
+        await response.aclose()
+        self.store.add(
+            {
+                "key": request_key(request, body),
+                "endpoint": _endpoint(request, body),
+                "url": _clean_url(request.url),
+                "status": response.status_code,
+                "headers": {k: v for k, v in response.headers.items() if k.lower() in KEEP_HEADERS},
+                "body": base64.b64encode(content).decode("ascii"),
+                "elapsed": round(time.perf_counter() - started, 4),
+            }
+        )
+        # тело уже прочитано: отдаём копию без content-encoding (httpx его раскодировал)
+        headers = [
+            (k, v)
+            for k, v in response.headers.items()
+            if k.lower() not in ("content-encoding", "content-length", "transfer-encoding")
+        ]
+        return httpx.Response(
+            response.status_code, headers=headers, content=content, request=request
+        )
+
+    async def aclose(self) -> None:
+        await self.inner.aclose()
+
+
+class ReplayTransport(httpx.AsyncBaseTransport):
+    """
+    latency: None — задержка как при записи × latency_scale, число — фиксированная (секунды).
+    fail_rate — доля запросов с отказом вида failure ("error" | "503" | "timeout");
+    fail_hosts — ограничить отказы этими хостами. Незаписанный запрос — 404 (или loose-подбор).
+    """
+
+    def __init__(
+        self,
+        store: FixtureStore,
+        latency: float | None = None,
+        latency_scale: float = 1.0,
+        fail_rate: float = 0.0,
+        failure: str = "error",
+        fail_hosts: Sequence[str] = (),
+        loose: bool = True,
+        seed: int = 1,
+    ):
+        if failure not in FAILURES:
+            raise ValueError(f"failure must be one of {FAILURES}")
+        self.store = store
+        self.latency = latency
+        self.latency_scale = latency_scale
+        self.fail_rate = fail_rate
+        self.failure = failure
+        self.fail_hosts = set(fail_hosts)
+        self.loose = loose
+        self.rnd = random.Random(seed)
+        self.stats: dict[str, int] = defaultdict(int)
+
+    def _delay(self, rec: dict | None) -> float:
+        if self.latency is not None:
+            return self.latency
+        return (rec or {}).get("elapsed", 0.0) * self.latency_scale
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        body = await request.aread()
+        rec = self.store.find(
+            request_key(request, body), _endpoint(request, body), loose=self.loose
+        )
+        host = request.url.host
+        if (
+            self.fail_rate
+            and (not self.fail_hosts or host in self.fail_hosts)
+            and self.rnd.random() < self.fail_rate
+        ):
+            self.stats["injected_" + self.failure] += 1
+            if self.failure == "timeout":
+                await asyncio.sleep(self._delay(rec))
+                raise httpx.ReadTimeout("injected timeout", request=request)
+            if self.failure == "error":
+                raise httpx.ConnectError("injected connection error", request=request)
+            return httpx.Response(503, request=request)
+        await asyncio.sleep(self._delay(rec))
+        if rec is None:
+            self.stats["missing"] += 1
+            return httpx.Response(404, request=request, text="not recorded")
+        self.stats["replayed"] += 1
+        return httpx.Response(
+            rec["status"],
+            headers=rec["headers"],
+            content=base64.b64decode(rec["body"]),
+            request=request,
+        )
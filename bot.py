@@ -1,7 +1,7 @@
 # coding: utf-8
 import asyncio
 import datetime
-import tempfile
+from typing import Awaitable, Callable
 
 from aiogram import Bot, Dispatcher, F
 from aiogram.types import Message, LabeledPrice, PreCheckoutQuery, ContentType
@@ -15,25 +15,55 @@ from core.config import (
     POSTPAY_MODE,
     STRICT_VALIDATION,
     REQUIRE_SOURCES_TO_ANSWER,
+    INTENT_PLAN_FUSED,
+    STREAM_ANSWERS,
+    USE_VOSK,
+    VOSK_PRELOAD,
+    WEBHOOK_MODE,
+    SHARD_WORKERS,
 )
+from core.credits import (
+    add_credit,
+    close_db as close_credits_db,
+    consume_credit,
+    init_db as init_credits_db,
+)
+from core.http import aclose_clients
 from core.logger import log
+from core.metrics import counter, format_trace, span, start_metrics_server, trace
+from core.workers import shutdown_workers
 
 from services.rate_limit import clamp_text
-from services.voice import transcribe as transcribe_voice
-from nlp.openai_client import chat_answer, transcribe_ogg_pcm16
-from nlp.query_planner import plan_queries
-from nlp.intent import classify_intent
-
-from legal.law_search import multi_query_search
-from legal.law_fetcher import fetch_page
+from services.voice import check_ffmpeg
+from services.voice import preload as preload_voice
+from services.voice import transcribe_async as transcribe_voice
+from services.telegram_stream import StreamingReply
+from services.answer_cache import answer_key, get_answer, put_answer
+from services.webhook import run_webhook
+from services.sharding import run_sharded
+from services.scheduler import PRIORITY_PAID, SchedulerBusy, scheduler, user_priority
+from nlp.openai_client import chat_answer_async, chat_answer_stream, transcribe_ogg_async
+from nlp.query_planner import plan_queries_async, plan_with_intent_async
+from nlp.intent import classify_intent_async, match_intent
+
+from legal.law_search import multi_query_search_async
+from legal.law_fetcher import fetch_pages
 from legal.answer_formatter import format_answer
 from legal.validator import has_strict_legal_quality
+from legal.statute_index import statute_index, targets_from_qual
 
 # ---------- PROMPT ----------
 with open("nlp/prompt_legal_ru.txt", "r", encoding="utf-8") as f:
-    SYSTEM_PROMPT = f.read().replace(
-        "__TODAY__", datetime.date.today().strftime("%d.%m.%Y")
-    )
+    PROMPT_TEMPLATE = f.read()
+
+_prompt: dict = {}
+
+def system_prompt() -> tuple[str, str]:
+    """(дата, системный промпт); __TODAY__ перерисовываем при смене даты, а не только на старте."""
+    today = datetime.date.today().strftime("%d.%m.%Y")
+    if _prompt.get("date") != today:
+        _prompt.update(date=today, text=PROMPT_TEMPLATE.replace("__TODAY__", today))
+    return today, _prompt["text"]
 
 # ---------- BOT ----------
 bot = Bot(token=TELEGRAM_BOT_TOKEN)
@@ -79,21 +109,94 @@ async def process_pre_checkout_q(pre_q: PreCheckoutQuery):
 
 @dp.message(F.successful_payment)
 async def successful_payment_handler(m: Message):
+    # оплаченная справка — кредит на балансе: следующий вопрос идёт в приоритетной полосе
+    user_id = m.from_user.id if m.from_user else m.chat.id
+    try:
+        await add_credit(user_id)
+    except Exception as e:
+        log.error("credit top-up failed for %s: %s", user_id, e)
     await m.answer("Спасибо за оплату ✅")
 
 # ---------- CORE ANSWER ----------
-async def handle_question(text: str) -> str:
+async def _search_and_fetch(queries: list[str], qual: list[str]) -> list[dict]:
+    from legal.relevance import filter_and_rank_pages  # локальный импорт, чтобы не тянуть лишнее на старте
+
+    with span("search"):
+        results = await multi_query_search_async(queries)
+
+    # сбор страниц (параллельно, с лимитами на хост и общим дедлайном);
+    # сниппет — фрагмент целевой статьи/части из QUAL, а не начало страницы
+    pages_raw = []
+    targets = targets_from_qual(qual)
+    with span("fetch"):
+        fetched = await fetch_pages([r["url"] for r in results[:10]], targets=targets)
+    for page in fetched:
+        snippet = page.get("snippet") or page["text"][:1800]
+        if not snippet or len(snippet) < 120:
+            continue
+        pages_raw.append({"source": page["url"], "title": page["title"], "snippet": snippet})
+
+    # строгий фильтр по QUAL
+    with span("rank"):
+        return filter_and_rank_pages(
+            pages_raw,
+            qual,
+            min_keep=2,
+            max_keep=6,
+            strict=True,
+        )
+
+async def _intent_and_plan(q_raw: str, q: str) -> tuple[str, dict | None]:
+    """
+    Намерение (и, в совмещённом режиме, сразу план поиска).
+    Эвристики решают без сети; иначе при INTENT_PLAN_FUSED — один LLM-вызов на метку и план,
+    без него — LLM-классификатор, а план строится позже отдельно.
+    """
+    hit = match_intent(q_raw)
+    if hit:
+        return hit[0], None
+    if INTENT_PLAN_FUSED:
+        plan = await plan_with_intent_async(q)
+        intent = plan.pop("INTENT")
+        return intent, (plan if intent == "LEGAL" else None)
+    return await classify_intent_async(q_raw), None
+
+answers_total = counter("bot_answers_total", "Replies by kind", ("kind",))
+
+async def handle_question(
+    text: str,
+    on_progress: Callable[[str], Awaitable[None]] | None = None,
+    outcome: dict | None = None,
+) -> str:
     """
     Фильтр намерения → если LEGAL — полный цикл, если PARALEGAL — коротко,
     если OFFTOPIC — вежливое пояснение про специализацию.
+    on_progress — колбэк для потокового режима: получает накопленный текст ответа LLM.
+    outcome — если передан, получает {"intent", "billable"}: billable — выдан юридический
+    ответ (сгенерированный или из кэша), за него списывается оплаченная справка.
+    Длительности этапов — в метрики и одной строкой TRACE в лог.
     """
-    from legal.relevance import filter_and_rank_pages  # локальный импорт, чтобы не тянуть лишнее на старте
-
+    outcome = {} if outcome is None else outcome
+    outcome.update(intent=None, billable=False)
+    with trace() as spans:
+        try:
+            with span("handle_question"):
+                return await _handle_question(text, on_progress, outcome)
+        finally:
+            log.info("TRACE %s", format_trace(spans))
+
+async def _handle_question(
+    text: str, on_progress: Callable[[str], Awaitable[None]] | None, outcome: dict
+) -> str:
     q_raw = (text or "").strip()
     q = clamp_text(q_raw)
 
-    intent = classify_intent(q_raw)
+    with span("intent"):
+        intent, plan = await _intent_and_plan(q_raw, q)
     log.info("INTENT decided: %s | text='%s'", intent, q_raw[:200])
+    outcome["intent"] = intent
+    if intent != "LEGAL":
+        answers_total.inc(kind=intent.lower())
 
     # --- OFFTOPIC: сухо, без поиска ---
     if intent == "OFFTOPIC":
@@ -110,7 +213,9 @@ async def handle_question(text: str) -> str:
                 "Если подскажете юридический контекст (норма/статья/ситуация), дам точные нормы и шаги.")
 
     # --- LEGAL: полный цикл ---
-    plan = plan_queries(q, force=False)
+    if plan is None:
+        with span("plan"):
+            plan = await plan_queries_async(q, force=False)
     queries: list[str] = []
     for k in ("Q_STRICT", "Q_SEMI", "Q_BROAD"):
         if plan.get(k):
@@ -121,32 +226,43 @@ async def handle_question(text: str) -> str:
     if not queries:
         queries = [q]
 
-    results = multi_query_search(queries)
-
-    # сбор страниц
-    pages_raw = []
-    for r in results[:10]:
-        try:
-            page = fetch_page(r["url"])
-            snippet = page.get("snippet") or page["text"][:1800]
-            if not snippet or len(snippet) < 120:
-                continue
-            pages_raw.append({"source": page["url"], "title": page["title"], "snippet": snippet})
-        except Exception as e:
-            log.warning("fetch failed %s: %s", r["url"], e)
-
-    # строгий фильтр по QUAL
-    pages = filter_and_rank_pages(
-        pages_raw,
-        plan.get("QUAL", []),
-        min_keep=2,
-        max_keep=6,
-        strict=True,
-    )
+    qual = plan.get("QUAL", [])
+
+    # локальный индекс кодексов: если все нормы из QUAL есть офлайн — веб-поиск не нужен
+    with span("statute_index"):
+        index = statute_index()
+        pages = index.resolve_targets(targets_from_qual(qual)) if index else None
+
+    # готовый ответ на тот же вопрос по тем же нормам (и той же дате/модели) — до поиска;
+    # источники из индекса сверяем по отпечатку
+    prompt_date, prompt = system_prompt()
+    # ключ — по тому же тексту, по которому генерируется ответ (q_raw, не обрезанный q)
+    cache_key = answer_key(q_raw, qual, prompt_date, OPENAI_MODEL)
+    cached = get_answer(cache_key, pages or None)
+    if cached is not None:
+        answers_total.inc(kind="cached")
+        outcome["billable"] = True
+        return cached
+    answers_total.inc(kind="legal")
+
+    if pages:
+        log.info("Statute index covered all QUAL targets: %d pages", len(pages))
+    else:
+        pages = await _search_and_fetch(queries, qual)
     used = [{"url": p["source"], "title": p["title"]} for p in pages]
 
     # генерация ответа (даже если источников мало — даём справку)
-    answer = chat_answer(SYSTEM_PROMPT, q_raw, pages)
+    with span("answer"):
+        if on_progress is not None:
+            parts: list[str] = []
+            async for delta in chat_answer_stream(prompt, q_raw, pages):
+                parts.append(delta)
+                await on_progress("".join(parts))
+            answer = "".join(parts).strip()
+        else:
+            answer = await chat_answer_async(prompt, q_raw, pages)
+    generated = bool(answer)
+    outcome["billable"] = generated
 
     # индикатор уверенности
     try:
@@ -159,19 +275,68 @@ async def handle_question(text: str) -> str:
         answer = "Предварительная справка (источники не подтверждены мгновенно):\n" + answer
 
     answer = f"Уровень уверенности: {conf}.\n\n{answer}"
-    return format_answer(answer, used)
+    reply = format_answer(answer, used)
+    # без источников — предварительная справка, её не закрепляем
+    if used and generated:
+        put_answer(cache_key, reply, pages)
+    return reply
 
 # ---------- MESSAGE HANDLERS ----------
+BUSY_QUEUED = (
+    "Сейчас много вопросов — ваш в очереди (позиция {position}). Ответ придёт автоматически."
+)
+BUSY_REJECTED = "Сейчас бот перегружен. Пожалуйста, повторите вопрос через пару минут."
+
+async def _send_reply(m: Message, reply: str, stream: StreamingReply | None) -> None:
+    if stream is not None:
+        await stream.finish(reply)
+    else:
+        await m.answer(reply)
+
+async def _scheduled(m: Message, fn: Callable[[dict], Awaitable[str]]) -> str:
+    """
+    handle_question через планировщик: лимиты, приоритет оплативших, «вы в очереди».
+    fn(outcome) — outcome заполняет handle_question; справку списываем только за
+    юридический ответ (billable), не за OFFTOPIC/PARALEGAL и не за ошибки.
+    """
+    user_id = m.from_user.id if m.from_user else m.chat.id
+
+    async def notify(position: int) -> None:
+        await m.answer(BUSY_QUEUED.format(position=position))
+
+    priority = await user_priority(user_id)
+    outcome: dict = {}
+    reply = await scheduler.run(user_id, priority, lambda: fn(outcome), on_queued=notify)
+    if priority == PRIORITY_PAID and outcome.get("billable"):
+        # приоритет оплачен одной справкой — списываем за полученный юридический ответ
+        try:
+            await consume_credit(user_id)
+        except Exception as e:
+            log.warning("credit consume failed for %s: %s", user_id, e)
+    return reply
+
 @dp.message(F.text)
 async def text_message(m: Message):
+    stream = StreamingReply(m) if STREAM_ANSWERS else None
+    answered = True
     try:
-        reply = await handle_question(m.text or "")
+        if stream is not None:
+            await stream.start()
+        reply = await _scheduled(
+            m,
+            lambda outcome: handle_question(
+                m.text or "", on_progress=stream.update if stream else None, outcome=outcome
+            ),
+        )
+    except SchedulerBusy:
+        answered = False
+        reply = BUSY_REJECTED
     except Exception as e:
         log.exception("handle_question failed (text): %s", e)
         reply = ("Не получилось быстро получить выдержки из баз. "
                  "Могу дать предварительную правовую оценку — сформулируйте ситуацию (кодекс/статья/часть — если знаете).")
-    await m.answer(reply)
-    if POSTPAY_MODE and PAYMENT_PROVIDER_TOKEN:
+    await _send_reply(m, reply, stream)
+    if answered and POSTPAY_MODE and PAYMENT_PROVIDER_TOKEN:
         # мягкий пинг на оплату после ответа
         try:
             await buy_cmd(m)
@@ -180,32 +345,72 @@ async def text_message(m: Message):
 
 @dp.message(F.voice | F.audio)
 async def voice_message(m: Message):
+    stream = StreamingReply(m) if STREAM_ANSWERS else None
+    recognized = True
     try:
-        file = await m.bot.get_file(m.voice.file_id if m.voice else m.audio.file_id)
-        ogg_path = tempfile.mktemp(suffix=".ogg")
-        await m.bot.download_file(file.file_path, ogg_path)
-
-        text = transcribe_voice(ogg_path)
+        if stream is not None:
+            await stream.start()
+        with span("voice_download"):
+            file = await m.bot.get_file(m.voice.file_id if m.voice else m.audio.file_id)
+            ogg = (await m.bot.download_file(file.file_path)).getvalue()
+
+        with span("stt_vosk"):
+            text = await transcribe_voice(ogg)
         if text == "__USE_OPENAI_WHISPER__":
-            text = transcribe_ogg_pcm16(ogg_path)
+            with span("stt_whisper"):
+                text = await transcribe_ogg_async(ogg)
 
         if not text.strip():
-            await m.answer("Не удалось распознать речь. Попробуйте ещё раз.")
-            return
-
-        reply = await handle_question(text)
+            recognized = False
+            reply = "Не удалось распознать речь. Попробуйте ещё раз."
+        else:
+            reply = await _scheduled(
+                m,
+                lambda outcome: handle_question(
+                    text, on_progress=stream.update if stream else None, outcome=outcome
+                ),
+            )
+    except SchedulerBusy:
+        recognized = False
+        reply = BUSY_REJECTED
     except Exception as e:
         log.exception("handle_question failed (voice): %s", e)
         reply = ("Не получилось распознать/обработать голос. "
                  "Пришлите, пожалуйста, коротким текстом (до 500 символов).")
-    await m.answer(reply)
-    if POSTPAY_MODE and PAYMENT_PROVIDER_TOKEN:
+    await _send_reply(m, reply, stream)
+    if recognized and POSTPAY_MODE and PAYMENT_PROVIDER_TOKEN:
         try:
             await buy_cmd(m)
         except Exception as e:
             log.warning("buy_cmd failed: %s", e)
 
 # ---------- ENTRY ----------
+_metrics_runner = None
+
+@dp.startup()
+async def on_startup():
+    global _metrics_runner
+    await init_credits_db()
+    try:
+        _metrics_runner = await start_metrics_server()
+    except OSError as e:
+        log.warning("metrics server not started: %s", e)
+    if USE_VOSK and not await asyncio.to_thread(check_ffmpeg):
+        log.warning("ffmpeg not found in PATH: local voice recognition (Vosk) will fail")
+    if USE_VOSK and VOSK_PRELOAD:
+        try:
+            await asyncio.to_thread(preload_voice)
+        except Exception as e:
+            log.warning("Vosk preload failed: %s", e)
+
+@dp.shutdown()
+async def on_shutdown():
+    if _metrics_runner is not None:
+        await _metrics_runner.cleanup()
+    await aclose_clients()
+    await close_credits_db()
+    shutdown_workers()
+
 def main():
     if not TELEGRAM_BOT_TOKEN:
         raise RuntimeError("TELEGRAM_BOT_TOKEN not set")
@@ -213,7 +418,12 @@ def main():
         "Starting bot with model=%s | STRICT_VALIDATION=%s | REQUIRE_SOURCES_TO_ANSWER=%s | POSTPAY=%s",
         OPENAI_MODEL, STRICT_VALIDATION, REQUIRE_SOURCES_TO_ANSWER, POSTPAY_MODE
     )
-    asyncio.run(dp.start_polling(bot))
+    if SHARD_WORKERS > 1:
+        run_sharded(dp, bot, SHARD_WORKERS, webhook=WEBHOOK_MODE)
+    elif WEBHOOK_MODE:
+        run_webhook(dp, bot)
+    else:
+        asyncio.run(dp.start_polling(bot))
 
 if __name__ == "__main__":
     main()
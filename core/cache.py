@@ -0,0 +1,130 @@
+"""
+TTL + LRU кэш в памяти с опциональной персистентностью в SQLite.
+
+Значения должны сериализоваться в JSON (если задан path). Кэш отдаёт сохранённый объект
+как есть — вызывающий не должен его мутировать.
+"""
+
+from __future__ import annotations
+
+import json
+import sqlite3
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from typing import Any
+
+from core.logger import log
+
+CREATE_SQL = """
+CREATE TABLE IF NOT EXISTS kv (
+  ns TEXT NOT NULL,
+  key TEXT NOT NULL,
+  expires_at REAL NOT NULL,
+  value TEXT NOT NULL,
+  PRIMARY KEY (ns, key)
+);
+"""
+
+
+_caches: weakref.WeakSet[TTLCache] = weakref.WeakSet()
+
+
+class TTLCache:
+    def __init__(self, name: str, maxsize: int, ttl: float, path: str = ""):
+        self.name = name
+        self.maxsize = max(1, maxsize)
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._db: sqlite3.Connection | None = None
+        _caches.add(self)
+        if path:
+            try:
+                self._db = sqlite3.connect(path, check_same_thread=False)
+                self._db.execute("PRAGMA journal_mode=WAL")
+                self._db.execute(CREATE_SQL)
+                self._db.execute("DELETE FROM kv WHERE ns=? AND expires_at<?", (name, time.time()))
+                self._db.commit()
+            except Exception as e:
+                log.warning("%s cache: persistence disabled: %s", name, e)
+                self._db = None
+
+    def get(self, key: str) -> Any:
+        """Значение или None (нет / истекло)."""
+        now = time.time()
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and item[0] > now:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return item[1]
+            if item is not None:
+                del self._data[key]
+            value = self._disk_get_locked(key, now)
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return value
+
+    def set(self, key: str, value: Any) -> None:
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._put_locked(key, expires_at, value)
+            if self._db is not None:
+                try:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO kv(ns, key, expires_at, value) VALUES(?, ?, ?, ?)",
+                        (self.name, key, expires_at, json.dumps(value, ensure_ascii=False)),
+                    )
+                    self._db.commit()
+                except Exception as e:
+                    log.warning("%s cache: write failed: %s", self.name, e)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM kv WHERE ns=?", (self.name,))
+                self._db.commit()
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._data)}
+
+    def _put_locked(self, key: str, expires_at: float, value: Any) -> None:
+        self._data[key] = (expires_at, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def _disk_get_locked(self, key: str, now: float) -> Any:
+        if self._db is None:
+            return None
+        try:
+            row = self._db.execute(
+                "SELECT expires_at, value FROM kv WHERE ns=? AND key=?", (self.name, key)
+            ).fetchone()
+        except Exception as e:
+            log.warning("%s cache: read failed: %s", self.name, e)
+            return None
+        if not row or row[0] <= now:
+            return None
+        value = json.loads(row[1])
+        self._put_locked(key, row[0], value)
+        return value
+
+
+def cache_stats() -> dict[str, dict[str, int]]:
+    """Статистика всех живых кэшей процесса по имени (для /metrics)."""
+    return {c.name: c.stats() for c in list(_caches)}
+
+
+def clear_caches() -> None:
+    """Очистить все кэши процесса (бенчмарки «с холодного старта»)."""
+    for c in list(_caches):
+        c.clear()
@@ -3,9 +3,31 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+# Каталог данных (кэши на диске); абсолютный, чтобы не зависеть от текущего каталога процесса
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.path.abspath(os.getenv("DATA_DIR", os.path.join(_ROOT, "data")))
+
 # --- Telegram ---
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN", "")
 
+# Webhook вместо long polling (services/webhook.py): публичный адрес, путь, секрет и локальный порт
+WEBHOOK_MODE = os.getenv("WEBHOOK_MODE", "false").lower() in ("1", "true", "yes", "on")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+# Одновременно обрабатываемые обновления; сверх WEBHOOK_MAX_PENDING — 503 (Telegram повторит)
+WEBHOOK_CONCURRENCY = int(os.getenv("WEBHOOK_CONCURRENCY", "32"))
+WEBHOOK_MAX_PENDING = int(os.getenv("WEBHOOK_MAX_PENDING", "500"))
+# Процессы-воркеры (services/sharding.py): обновления раскладываются по хэшу chat_id;
+# 0/1 — один процесс
+SHARD_WORKERS = int(os.getenv("SHARD_WORKERS", "0"))
+SHARD_WORKER_CONCURRENCY = int(os.getenv("SHARD_WORKER_CONCURRENCY", "16"))
+# Prometheus /metrics (core/metrics.py); 0 — выключен. Воркеры шардов: METRICS_PORT + 1 + номер
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+
 # --- OpenAI ---
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
 OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4.1-mini")
@@ -19,6 +41,13 @@ POSTPAY_MODE = os.getenv("POSTPAY_MODE", "true").lower() in ("1", "true", "yes",
 STRICT_VALIDATION = os.getenv("STRICT_VALIDATION", "false").lower() in ("1", "true", "yes", "on")
 REQUIRE_SOURCES_TO_ANSWER = os.getenv("REQUIRE_SOURCES_TO_ANSWER", "false").lower() in ("1", "true", "yes", "on")
 
+# --- Planner ---
+# Один LLM-вызов на «намерение + план поиска» для вопросов, которые не решили эвристики
+INTENT_PLAN_FUSED = os.getenv("INTENT_PLAN_FUSED", "false").lower() in ("1", "true", "yes", "on")
+# Кэш планов поиска по нормализованному вопросу
+PLAN_CACHE_TTL_SECONDS = int(os.getenv("PLAN_CACHE_TTL_SECONDS", str(12 * 3600)))
+PLAN_CACHE_SIZE = int(os.getenv("PLAN_CACHE_SIZE", "1000"))
+
 # --- Search ---
 SOURCE_SITES = [
     s.strip() for s in os.getenv(
@@ -28,6 +57,54 @@ SOURCE_SITES = [
 ]
 SEARCH_MAX_RESULTS = int(os.getenv("SEARCH_MAX_RESULTS", "8"))
 
+# Параллельный опрос провайдеров/тиров запросов (fan-out): сразу SEARCH_FANOUT_CONCURRENCY запросов,
+# хедж — ещё один сверх окна, если никто не ответил за SEARCH_HEDGE_DELAY_SECONDS (0 — без хеджа)
+SEARCH_FANOUT = os.getenv("SEARCH_FANOUT", "true").lower() in ("1", "true", "yes", "on")
+SEARCH_FANOUT_CONCURRENCY = int(os.getenv("SEARCH_FANOUT_CONCURRENCY", "4"))
+SEARCH_HEDGE_DELAY_SECONDS = float(os.getenv("SEARCH_HEDGE_DELAY_SECONDS", "2.0"))
+
+# Кэш выдачи провайдеров (in-memory LRU; SEARCH_CACHE_PATH — опциональная персистентность)
+SEARCH_CACHE_TTL_SECONDS = int(os.getenv("SEARCH_CACHE_TTL_SECONDS", str(6 * 3600)))
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "2000"))
+SEARCH_CACHE_PATH = os.getenv("SEARCH_CACHE_PATH", "")
+# Здоровье провайдеров (legal/provider_health.py): окно статистики, пороги предохранителя и пауза
+PROVIDER_ADAPTIVE_ORDER = os.getenv("PROVIDER_ADAPTIVE_ORDER", "true").lower() in (
+    "1", "true", "yes", "on"
+)
+PROVIDER_HEALTH_WINDOW = int(os.getenv("PROVIDER_HEALTH_WINDOW", "20"))
+PROVIDER_MIN_CALLS = int(os.getenv("PROVIDER_MIN_CALLS", "5"))
+PROVIDER_ERROR_RATE = float(os.getenv("PROVIDER_ERROR_RATE", "0.5"))
+PROVIDER_MIN_USEFUL_RATE = float(os.getenv("PROVIDER_MIN_USEFUL_RATE", "0.1"))
+PROVIDER_OPEN_SECONDS = float(os.getenv("PROVIDER_OPEN_SECONDS", "60"))
+PROVIDER_OPEN_MAX_SECONDS = float(os.getenv("PROVIDER_OPEN_MAX_SECONDS", "900"))
+
+# --- HTTP client ---
+# Общий пул соединений для поиска и загрузки страниц (core/http.py);
+# HTTP/2 — через h2 (httpx[http2])
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "40"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+HTTP_KEEPALIVE_EXPIRY_SECONDS = float(os.getenv("HTTP_KEEPALIVE_EXPIRY_SECONDS", "30"))
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "true").lower() in ("1", "true", "yes", "on")
+DNS_CACHE_TTL_SECONDS = float(os.getenv("DNS_CACHE_TTL_SECONDS", "300"))
+
+# --- Fetch ---
+# Пакетная загрузка страниц: общий лимит параллельности, лимит на хост и общий дедлайн пакета
+FETCH_CONCURRENCY = int(os.getenv("FETCH_CONCURRENCY", "6"))
+FETCH_PER_HOST_LIMIT = int(os.getenv("FETCH_PER_HOST_LIMIT", "2"))
+FETCH_DEADLINE_SECONDS = float(os.getenv("FETCH_DEADLINE_SECONDS", "12"))
+# Потоковая загрузка: таймаут страницы, лимит байт и «достаточный» объём текста (дальше не читаем)
+FETCH_TIMEOUT_SECONDS = float(os.getenv("FETCH_TIMEOUT_SECONDS", "25"))
+FETCH_MAX_BYTES = int(os.getenv("FETCH_MAX_BYTES", str(3 * 1024 * 1024)))
+FETCH_TEXT_BUDGET_CHARS = int(os.getenv("FETCH_TEXT_BUDGET_CHARS", "60000"))
+
+# Персистентный кэш страниц (пустой путь — отключить); общий для процессов-шардов
+PAGE_CACHE_PATH = os.getenv("PAGE_CACHE_PATH", os.path.join(DATA_DIR, "page_cache.db"))
+PAGE_CACHE_TTL_SECONDS = int(os.getenv("PAGE_CACHE_TTL_SECONDS", str(3 * 24 * 3600)))
+PAGE_CACHE_MAX_MB = int(os.getenv("PAGE_CACHE_MAX_MB", "200"))
+
+# Локальный индекс кодексов (SQLite FTS5, см. legal/statute_index.py); нет файла — не используется
+STATUTE_INDEX_PATH = os.getenv("STATUTE_INDEX_PATH", "statutes.db")
+
 # Google CSE (fallback)
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY", "")
 GOOGLE_CSE_ID = os.getenv("GOOGLE_CSE_ID", "")
@@ -39,9 +116,47 @@ SEARXNG_ENABLED = os.getenv("SEARXNG_ENABLED", "false").lower() in ("1", "true",
 # Startpage fallback
 STARTPAGE_ENABLED = os.getenv("STARTPAGE_ENABLED", "true").lower() in ("1", "true", "yes", "on")
 
+# --- Answer cache ---
+# Готовые ответы по (вопрос, QUAL, источники, дата промпта, модель);
+# ANSWER_CACHE_PATH — персистентность
+ANSWER_CACHE_TTL_SECONDS = int(os.getenv("ANSWER_CACHE_TTL_SECONDS", str(6 * 3600)))
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1000"))
+ANSWER_CACHE_PATH = os.getenv("ANSWER_CACHE_PATH", "")
+
+# --- Scheduler ---
+# Допуск вопросов (services/scheduler.py): всего / на пользователя; «вы в очереди» с глубины
+# SCHED_NOTIFY_DEPTH, бесплатные вопросы сверх SCHED_QUEUE_MAX отклоняются
+SCHED_MAX_ACTIVE = int(os.getenv("SCHED_MAX_ACTIVE", "8"))
+SCHED_PER_USER_ACTIVE = int(os.getenv("SCHED_PER_USER_ACTIVE", "1"))
+SCHED_NOTIFY_DEPTH = int(os.getenv("SCHED_NOTIFY_DEPTH", "4"))
+SCHED_QUEUE_MAX = int(os.getenv("SCHED_QUEUE_MAX", "50"))
+# Одновременные внешние вызовы по стадиям (core/limits.py)
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "8"))
+SEARCH_CONCURRENCY = int(os.getenv("SEARCH_CONCURRENCY", "8"))
+FETCH_GLOBAL_CONCURRENCY = int(os.getenv("FETCH_GLOBAL_CONCURRENCY", "16"))
+
+# --- Workers ---
+# Пулы вне event loop (core/workers.py): разбор HTML — thread|process, аудио и I/O кэша — потоки;
+# WORKER_QUEUE_SIZE — сколько задач может ждать сверх размера пула
+WORKER_PARSE_KIND = os.getenv("WORKER_PARSE_KIND", "thread").lower()
+WORKER_PARSE_SIZE = int(os.getenv("WORKER_PARSE_SIZE", "2"))
+WORKER_AUDIO_SIZE = int(os.getenv("WORKER_AUDIO_SIZE", "2"))
+# потоки для SQLite-кэша страниц (чтение/запись), отдельно от разбора
+WORKER_IO_SIZE = int(os.getenv("WORKER_IO_SIZE", "4"))
+WORKER_QUEUE_SIZE = int(os.getenv("WORKER_QUEUE_SIZE", "32"))
+WORKER_SLOW_TASK_SECONDS = float(os.getenv("WORKER_SLOW_TASK_SECONDS", "1.0"))
+
+# --- Streaming answers ---
+# Ответ LLM показываем по мере генерации, правя сообщение не чаще раза в N секунд
+STREAM_ANSWERS = os.getenv("STREAM_ANSWERS", "true").lower() in ("1", "true", "yes", "on")
+STREAM_EDIT_INTERVAL_SECONDS = float(os.getenv("STREAM_EDIT_INTERVAL_SECONDS", "1.5"))
+
 # --- Voice (опционально) ---
 USE_VOSK = os.getenv("USE_VOSK", "false").lower() in ("1", "true", "yes", "on")
 VOSK_MODEL_PATH = os.getenv("VOSK_MODEL_PATH", "")
+# Модель грузится один раз (при VOSK_PRELOAD — на старте); распознаватели переиспользуются пулом
+VOSK_PRELOAD = os.getenv("VOSK_PRELOAD", "true").lower() in ("1", "true", "yes", "on")
+VOSK_POOL_SIZE = int(os.getenv("VOSK_POOL_SIZE", "2"))
 MAX_USER_CHARS = int(os.getenv("MAX_USER_CHARS", "500"))
 
 # --- Disclaimer ---
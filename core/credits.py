@@ -1,6 +1,27 @@
+"""
+Баланс оплаченных справок (SQLite через aiosqlite).
+
+Одно долгоживущее соединение на процесс (WAL, synchronous=NORMAL) в режиме автокоммита:
+каждая запись — один SQL-оператор, т. е. отдельная атомарная транзакция, и операции
+разных корутин на общем соединении не смешиваются в одну транзакцию. SQL-тексты
+постоянные — sqlite3 переиспользует подготовленные операторы из своего кэша.
+
+  - consume_credit — одно условное списание (UPDATE ... WHERE balance > 0), без гонки
+    «прочитали — записали»;
+  - add_credit — пополнения, пришедшие одновременно, копятся и пишутся пачкой одним
+    INSERT ... ON CONFLICT; вызов возвращается, когда его пачка записана.
+"""
+
+import asyncio
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
 import aiosqlite
 
+from core.logger import log
+
 DB_PATH = "bot.db"
+TOPUP_BATCH_MAX = 500  # строк в одном INSERT (лимит переменных SQLite с запасом)
 
 CREATE_SQL = """
 CREATE TABLE IF NOT EXISTS credits (
@@ -9,29 +30,107 @@ CREATE TABLE IF NOT EXISTS credits (
 );
 """
 
-async def init_db():
-    async with aiosqlite.connect(DB_PATH) as db:
+SELECT_BALANCE_SQL = "SELECT balance FROM credits WHERE user_id=?"
+CONSUME_SQL = "UPDATE credits SET balance=balance-1 WHERE user_id=? AND balance>0"
+TOPUP_SQL = (
+    "INSERT INTO credits(user_id, balance) VALUES {values} "
+    "ON CONFLICT(user_id) DO UPDATE SET balance=balance+excluded.balance"
+)
+
+
+class CreditsStore:
+    def __init__(self, path: str):
+        self.path = path
+        self._db: Optional[aiosqlite.Connection] = None
+        self._opening: Optional[asyncio.Future] = None
+        self._pending: List[Tuple[int, int, asyncio.Future]] = []
+        self._flush_task: Optional[asyncio.Task] = None
+
+    async def _conn(self) -> aiosqlite.Connection:
+        if self._db is not None:
+            return self._db
+        if self._opening is None or self._opening.get_loop() is not asyncio.get_running_loop():
+            self._opening = asyncio.ensure_future(self._open())
+        self._db = await asyncio.shield(self._opening)
+        return self._db
+
+    async def _open(self) -> aiosqlite.Connection:
+        conn = aiosqlite.connect(self.path, isolation_level=None)
+        conn.daemon = True  # соединение живёт весь процесс — не держим выход, если не закрыли
+        db = await conn
+        await db.execute("PRAGMA journal_mode=WAL")
+        await db.execute("PRAGMA synchronous=NORMAL")
+        await db.execute("PRAGMA busy_timeout=5000")
         await db.execute(CREATE_SQL)
-        await db.commit()
+        return db
 
-async def get_balance(user_id: int) -> int:
-    async with aiosqlite.connect(DB_PATH) as db:
-        async with db.execute("SELECT balance FROM credits WHERE user_id=?", (user_id,)) as cur:
+    async def get_balance(self, user_id: int) -> int:
+        db = await self._conn()
+        async with db.execute(SELECT_BALANCE_SQL, (user_id,)) as cur:
             row = await cur.fetchone()
-            return row[0] if row else 0
+        return row[0] if row else 0
+
+    async def consume(self, user_id: int) -> bool:
+        """Списать одну справку. False — на балансе ничего нет."""
+        db = await self._conn()
+        async with db.execute(CONSUME_SQL, (user_id,)) as cur:
+            return cur.rowcount == 1
+
+    async def add(self, user_id: int, amount: int = 1) -> None:
+        fut = asyncio.get_running_loop().create_future()
+        self._pending.append((user_id, amount, fut))
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.ensure_future(self._flush())
+        await fut
+
+    async def _flush(self) -> None:
+        # даём накопиться пополнениям, пришедшим в этой же итерации loop
+        await asyncio.sleep(0)
+        while self._pending:
+            batch, self._pending = self._pending, []
+            merged: Dict[int, int] = defaultdict(int)
+            for user_id, amount, _ in batch:
+                merged[user_id] += amount
+            try:
+                db = await self._conn()
+                rows = list(merged.items())
+                for i in range(0, len(rows), TOPUP_BATCH_MAX):
+                    chunk = rows[i:i + TOPUP_BATCH_MAX]
+                    sql = TOPUP_SQL.format(values=", ".join(["(?, ?)"] * len(chunk)))
+                    await db.execute(sql, [v for row in chunk for v in row])
+            except Exception as e:
+                log.warning("credits top-up batch failed (%d ops): %s", len(batch), e)
+                for _, _, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+                continue
+            for _, _, fut in batch:
+                if not fut.done():
+                    fut.set_result(None)
+
+    async def close(self) -> None:
+        if self._flush_task is not None and not self._flush_task.done():
+            await self._flush_task
+        if self._db is not None:
+            await self._db.close()
+        self._db = None
+        self._opening = None
+
+
+_store = CreditsStore(DB_PATH)
+
+
+async def init_db():
+    await _store._conn()
+
+async def close_db():
+    await _store.close()
+
+async def get_balance(user_id: int) -> int:
+    return await _store.get_balance(user_id)
 
 async def add_credit(user_id: int, amount: int = 1):
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute("INSERT INTO credits(user_id, balance) VALUES(?, ?) ON CONFLICT(user_id) DO UPDATE SET balance=balance+excluded.balance", (user_id, amount))
-        await db.commit()
+    await _store.add(user_id, amount)
 
 async def consume_credit(user_id: int) -> bool:
-    async with aiosqlite.connect(DB_PATH) as db:
-        async with db.execute("SELECT balance FROM credits WHERE user_id=?", (user_id,)) as cur:
-            row = await cur.fetchone()
-            bal = row[0] if row else 0
-            if bal <= 0:
-                return False
-        await db.execute("UPDATE credits SET balance=balance-1 WHERE user_id=?", (user_id,))
-        await db.commit()
-        return True
+    return await _store.consume(user_id)
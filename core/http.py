@@ -0,0 +1,388 @@
+"""
+Общие HTTP-клиенты процесса (httpx) с пулом соединений.
+
+Поиск и загрузка страниц ходят на несколько одних и тех же хостов — отдельный клиент
+на запрос платил бы за TCP + TLS рукопожатие каждый раз. Здесь:
+  - один AsyncClient на event loop и один синхронный Client на процесс;
+  - keep-alive и лимиты пула (HTTP_MAX_CONNECTIONS / HTTP_MAX_KEEPALIVE);
+  - HTTP/2, если включён HTTP2_ENABLED и установлен пакет h2;
+  - прокси из окружения (HTTP(S)_PROXY, NO_PROXY) — как у httpx по умолчанию;
+  - кэш DNS (DNS_CACHE_TTL_SECONDS) на уровне сетевого бэкенда httpcore —
+    SNI и заголовок Host остаются исходными. httpx не даёт передать бэкенд в транспорт,
+    поэтому он подменяется в пуле транспорта (httpcore закреплён в requirements; если
+    внутреннее устройство поменяется — работаем без кэша DNS, с предупреждением в лог);
+  - клиент event loop закрывается вместе с loop (или при переходе на другой loop), а
+    не бросается с открытыми сокетами;
+  - pool_stats() — загрузка пула для подбора лимитов;
+  - aclose_clients() — закрытие при остановке бота;
+  - set_transport_wrapper() — обёртка над транспортом async-клиентов (bench/replay.py
+    пишет и воспроизводит ответы на этом уровне).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import ipaddress
+import socket
+import threading
+import time
+import urllib.request
+from typing import Any, Callable
+
+import httpcore
+import httpx
+
+import core.config as cfg
+from core.logger import log
+
+HTTP_TIMEOUT_SECONDS = float(getattr(cfg, "HTTP_TIMEOUT_SECONDS", 15))
+HTTP_MAX_CONNECTIONS = int(getattr(cfg, "HTTP_MAX_CONNECTIONS", 40))
+HTTP_MAX_KEEPALIVE = int(getattr(cfg, "HTTP_MAX_KEEPALIVE", 20))
+HTTP_KEEPALIVE_EXPIRY_SECONDS = float(getattr(cfg, "HTTP_KEEPALIVE_EXPIRY_SECONDS", 30))
+HTTP2_ENABLED = bool(getattr(cfg, "HTTP2_ENABLED", True))
+DNS_CACHE_TTL_SECONDS = float(getattr(cfg, "DNS_CACHE_TTL_SECONDS", 300))
+
+try:
+    import h2  # noqa: F401
+
+    HAS_H2 = True
+except ImportError:
+    HAS_H2 = False
+
+
+# ---------------- DNS cache ----------------
+class DNSCache:
+    """host:port -> адреса, с TTL. IP-литералы не кэшируем."""
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: dict[tuple[str, int], tuple[float, list[str]]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _is_ip(host: str) -> bool:
+        try:
+            ipaddress.ip_address(host)
+            return True
+        except ValueError:
+            return False
+
+    def _get(self, host: str, port: int) -> list[str] | None:
+        with self._lock:
+            item = self._data.get((host, port))
+            if item is not None and item[0] > time.monotonic():
+                self.hits += 1
+                return item[1]
+            self.misses += 1
+            return None
+
+    def _put(self, host: str, port: int, infos: list) -> list[str]:
+        # все адреса в порядке резолвера: если первый (например, IPv6) недоступен — следующий
+        addrs = list(dict.fromkeys(info[4][0] for info in infos))
+        with self._lock:
+            self._data[(host, port)] = (time.monotonic() + self.ttl, addrs)
+        return addrs
+
+    def resolve(self, host: str, port: int) -> list[str]:
+        if self.ttl <= 0 or self._is_ip(host):
+            return [host]
+        addrs = self._get(host, port)
+        if addrs is None:
+            addrs = self._put(host, port, socket.getaddrinfo(host, port, type=socket.SOCK_STREAM))
+        return addrs
+
+    async def resolve_async(self, host: str, port: int) -> list[str]:
+        if self.ttl <= 0 or self._is_ip(host):
+            return [host]
+        addrs = self._get(host, port)
+        if addrs is None:
+            infos = await asyncio.get_running_loop().getaddrinfo(
+                host, port, type=socket.SOCK_STREAM
+            )
+            addrs = self._put(host, port, infos)
+        return addrs
+
+    def forget(self, host: str) -> None:
+        with self._lock:
+            for key in [k for k in self._data if k[0] == host]:
+                del self._data[key]
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._data)}
+
+
+dns_cache = DNSCache(DNS_CACHE_TTL_SECONDS)
+
+
+class _AsyncBackend(httpcore.AsyncNetworkBackend):
+    """
+    Бэкенд httpcore: резолв через DNSCache, соединение — штатным AnyIO-бэкендом;
+    адреса хоста пробуем по очереди, пока один не ответит.
+    """
+
+    def __init__(self, dns: DNSCache):
+        self._dns = dns
+        self._inner = httpcore.AnyIOBackend()
+        self.connects = 0
+
+    async def connect_tcp(self, host, port, timeout=None, local_address=None, socket_options=None):
+        addrs = await self._dns.resolve_async(host, port)
+        self.connects += 1
+        for i, addr in enumerate(addrs):
+            try:
+                return await self._inner.connect_tcp(
+                    addr,
+                    port,
+                    timeout=timeout,
+                    local_address=local_address,
+                    socket_options=socket_options,
+                )
+            except Exception:
+                if i + 1 == len(addrs):
+                    self._dns.forget(host)
+                    raise
+
+    async def connect_unix_socket(self, path, timeout=None, socket_options=None):
+        return await self._inner.connect_unix_socket(
+            path, timeout=timeout, socket_options=socket_options
+        )
+
+    async def sleep(self, seconds: float) -> None:
+        await self._inner.sleep(seconds)
+
+
+class _SyncBackend(httpcore.NetworkBackend):
+    def __init__(self, dns: DNSCache):
+        self._dns = dns
+        self._inner = httpcore.SyncBackend()
+        self.connects = 0
+
+    def connect_tcp(self, host, port, timeout=None, local_address=None, socket_options=None):
+        addrs = self._dns.resolve(host, port)
+        self.connects += 1
+        for i, addr in enumerate(addrs):
+            try:
+                return self._inner.connect_tcp(
+                    addr,
+                    port,
+                    timeout=timeout,
+                    local_address=local_address,
+                    socket_options=socket_options,
+                )
+            except Exception:
+                if i + 1 == len(addrs):
+                    self._dns.forget(host)
+                    raise
+
+    def connect_unix_socket(self, path, timeout=None, socket_options=None):
+        return self._inner.connect_unix_socket(path, timeout=timeout, socket_options=socket_options)
+
+    def sleep(self, seconds: float) -> None:
+        self._inner.sleep(seconds)
+
+
+def _use_backend(transport, backend) -> bool:
+    """Подставить бэкенд с кэшем DNS в пул транспорта httpx (приватный атрибут httpcore)."""
+    pool = getattr(transport, "_pool", None)
+    if not hasattr(pool, "_network_backend"):
+        log.warning("HTTP: unsupported httpcore %s, DNS cache disabled", httpcore.__version__)
+        return False
+    pool._network_backend = backend
+    return True
+
+
+def env_proxies() -> dict[str, str | None]:
+    """
+    Прокси из окружения (HTTP_PROXY / HTTPS_PROXY / ALL_PROXY, NO_PROXY) как шаблоны
+    mounts httpx: {"https://": url, "all://*host": None (напрямую)}. Клиент с явным
+    transport= сам окружение не читает, поэтому прокси монтируем рядом с нашим транспортом.
+    """
+    env = urllib.request.getproxies()
+    out: dict[str, str | None] = {}
+    for scheme in ("http", "https", "all"):
+        url = env.get(scheme)
+        if url:
+            out[f"{scheme}://"] = url if "://" in url else f"http://{url}"
+    if not out:
+        return {}
+    for host in (h.strip() for h in env.get("no", "").split(",")):
+        if host == "*":
+            return {}
+        if host:
+            out[f"all://*{host.lstrip('.')}"] = None
+    return out
+
+
+def _proxy_mounts(make: Callable[[str], Any]) -> dict[str, Any]:
+    return {pattern: (make(url) if url else None) for pattern, url in env_proxies().items()}
+
+
+# ---------------- clients ----------------
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY_SECONDS,
+    )
+
+
+def _http2() -> bool:
+    return HTTP2_ENABLED and HAS_H2
+
+
+_async_client: httpx.AsyncClient | None = None
+_async_loop: asyncio.AbstractEventLoop | None = None
+_async_backend: _AsyncBackend | None = None
+_async_guard: asyncio.Task | None = None
+_sync_client: httpx.Client | None = None
+_sync_backend: _SyncBackend | None = None
+_sync_lock = threading.Lock()
+_transport_wrapper: Callable[[httpx.AsyncBaseTransport], httpx.AsyncBaseTransport] | None = None
+
+
+def set_transport_wrapper(
+    wrap: Callable[[httpx.AsyncBaseTransport], httpx.AsyncBaseTransport] | None,
+) -> None:
+    """Оборачивать транспорт новых async-клиентов (None — снять); текущий клиент пересоздаётся."""
+    global _transport_wrapper, _async_client
+    _transport_wrapper = wrap
+    _retire_async_client()
+    _async_client = None
+
+
+def transport_wrapper() -> Callable[[httpx.AsyncBaseTransport], httpx.AsyncBaseTransport] | None:
+    return _transport_wrapper
+
+
+async def _close_with_loop(client: httpx.AsyncClient) -> None:
+    """
+    Сторож клиента: ждёт отмены и закрывает клиент в его же loop. asyncio.run (и aiohttp
+    run_app) при завершении отменяют оставшиеся задачи, пока loop ещё работает, — так
+    keep-alive соединения закрываются до закрытия loop; после него aclose() уже невозможен.
+    """
+    try:
+        await asyncio.get_running_loop().create_future()
+    finally:
+        if not client.is_closed:
+            await client.aclose()
+
+
+def _retire_async_client() -> None:
+    """Закрыть текущий async-клиент: отменяем его сторожа в loop клиента."""
+    guard, loop = _async_guard, _async_loop
+    if guard is None or guard.done() or loop is None or loop.is_closed():
+        return
+    try:
+        current = asyncio.get_running_loop()
+    except RuntimeError:
+        current = None
+    if loop is current:
+        guard.cancel()
+    else:
+        loop.call_soon_threadsafe(guard.cancel)
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """
+    Общий AsyncClient текущего event loop. Соединения привязаны к loop, поэтому при
+    смене loop (тесты, повторный asyncio.run) создаём новый клиент, а старый закрываем.
+    """
+    global _async_client, _async_loop, _async_backend, _async_guard
+    loop = asyncio.get_running_loop()
+    if _async_client is None or _async_client.is_closed or _async_loop is not loop:
+        _retire_async_client()
+        transport = httpx.AsyncHTTPTransport(limits=_limits(), http2=_http2())
+        _async_backend = _AsyncBackend(dns_cache)
+        if not _use_backend(transport, _async_backend):
+            _async_backend = None
+        wrap = _transport_wrapper or (lambda t: t)
+        mounts = _proxy_mounts(
+            lambda url: wrap(httpx.AsyncHTTPTransport(proxy=url, limits=_limits(), http2=_http2()))
+        )
+        _async_client = httpx.AsyncClient(
+            transport=wrap(transport),
+            mounts=mounts,
+            timeout=HTTP_TIMEOUT_SECONDS,
+            follow_redirects=True,
+        )
+        _async_loop = loop
+        _async_guard = loop.create_task(_close_with_loop(_async_client))
+        log.info(
+            "HTTP async client: pool=%d keepalive=%d http2=%s proxies=%s",
+            HTTP_MAX_CONNECTIONS,
+            HTTP_MAX_KEEPALIVE,
+            _http2(),
+            sorted(mounts) or "-",
+        )
+    return _async_client
+
+
+def get_client() -> httpx.Client:
+    """Общий синхронный клиент (для синхронных путей поиска/загрузки)."""
+    global _sync_client, _sync_backend
+    with _sync_lock:
+        if _sync_client is None or _sync_client.is_closed:
+            transport = httpx.HTTPTransport(limits=_limits(), http2=_http2())
+            _sync_backend = _SyncBackend(dns_cache)
+            if not _use_backend(transport, _sync_backend):
+                _sync_backend = None
+            mounts = _proxy_mounts(
+                lambda url: httpx.HTTPTransport(proxy=url, limits=_limits(), http2=_http2())
+            )
+            _sync_client = httpx.Client(
+                transport=transport,
+                mounts=mounts,
+                timeout=HTTP_TIMEOUT_SECONDS,
+                follow_redirects=True,
+            )
+        return _sync_client
+
+
+def _pool_stats(client, backend) -> dict[str, int]:
+    if client is None or client.is_closed:
+        return {}
+    pool = getattr(client._transport, "_pool", None)
+    if pool is None:  # транспорт обёрнут (bench/replay)
+        return {}
+    conns = pool.connections
+    stats = {
+        "connections": len(conns),
+        "idle": sum(1 for c in conns if c.is_idle()),
+        "max_connections": HTTP_MAX_CONNECTIONS,
+        "max_keepalive": HTTP_MAX_KEEPALIVE,
+        "connects_total": backend.connects if backend else 0,
+    }
+    # очередь запросов httpcore наружу не отдаёт — только если внутреннее устройство то же
+    requests = getattr(pool, "_requests", None)
+    if isinstance(requests, list) and all(hasattr(r, "is_queued") for r in requests):
+        queued = sum(1 for r in requests if r.is_queued())
+        stats.update(active_requests=len(requests) - queued, queued_requests=queued)
+    return stats
+
+
+def pool_stats() -> dict[str, dict[str, int]]:
+    """Загрузка пулов: соединения (всего/простаивают), запросы (в работе/в очереди), DNS-кэш."""
+    return {
+        "async": _pool_stats(_async_client, _async_backend),
+        "sync": _pool_stats(_sync_client, _sync_backend),
+        "dns": dns_cache.stats(),
+    }
+
+
+async def aclose_clients() -> None:
+    """Закрыть общие клиенты (вызывается при остановке бота)."""
+    global _async_client, _sync_client
+    log.info("HTTP pool stats at shutdown: %s", pool_stats())
+    if _async_client is not None and _async_loop is asyncio.get_running_loop():
+        _async_guard.cancel()
+        await _async_client.aclose()
+    else:
+        _retire_async_client()
+    _async_client = None
+    with _sync_lock:
+        if _sync_client is not None:
+            _sync_client.close()
+        _sync_client = None
@@ -0,0 +1,59 @@
+"""
+Лимиты одновременных внешних вызовов по стадиям конвейера: LLM, поиск, загрузка страниц.
+Планировщик (services/scheduler.py) ограничивает число вопросов целиком, а эти семафоры —
+всплески внутри них (один вопрос = несколько запросов к поиску и страницам).
+
+    async with llm_limit:
+        resp = await aclient().chat.completions.create(...)
+"""
+
+from __future__ import annotations
+
+import asyncio
+
+import core.config as cfg
+
+
+class StageLimit:
+    def __init__(self, name: str, limit: int):
+        self.name = name
+        self.limit = max(1, limit)
+        self.active = 0
+        self.waiting = 0
+        self._sem: asyncio.Semaphore | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    def _get_sem(self) -> asyncio.Semaphore:
+        # семафор привязан к loop — при смене loop (тесты) создаём заново
+        loop = asyncio.get_running_loop()
+        if self._sem is None or self._loop is not loop:
+            self._sem = asyncio.Semaphore(self.limit)
+            self._loop = loop
+            self.active = self.waiting = 0
+        return self._sem
+
+    async def __aenter__(self) -> StageLimit:
+        sem = self._get_sem()
+        self.waiting += 1
+        try:
+            await sem.acquire()
+        finally:
+            self.waiting -= 1
+        self.active += 1
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        self.active -= 1
+        self._get_sem().release()
+
+    def stats(self) -> dict[str, int]:
+        return {"limit": self.limit, "active": self.active, "waiting": self.waiting}
+
+
+llm_limit = StageLimit("llm", int(getattr(cfg, "LLM_CONCURRENCY", 8)))
+search_limit = StageLimit("search", int(getattr(cfg, "SEARCH_CONCURRENCY", 8)))
+fetch_limit = StageLimit("fetch", int(getattr(cfg, "FETCH_GLOBAL_CONCURRENCY", 16)))
+
+
+def limits_stats() -> dict[str, dict[str, int]]:
+    return {s.name: s.stats() for s in (llm_limit, search_limit, fetch_limit)}
@@ -0,0 +1,339 @@
+"""
+Метрики в формате Prometheus (без внешних зависимостей) и span-замеры этапов.
+
+  - counter()/histogram() — метрики с метками; значения копятся в памяти процесса;
+  - span("stage") — замер этапа в stage_seconds{stage,status}; внутри trace() длительности
+    этапов ещё и собираются в словарь — handle_question пишет их одной строкой в лог;
+  - на каждом запросе /metrics дополнительно снимаются состояния пулов HTTP, воркеров,
+    лимитов этапов, планировщика и кэшей (gauge);
+  - start_metrics_server() — отдельный aiohttp-сервер на METRICS_HOST:METRICS_PORT
+    (0 — выключен). В режиме шардирования воркер i слушает METRICS_PORT + 1 + i.
+"""
+
+from __future__ import annotations
+
+import abc
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, Sequence, Tuple
+
+import core.config as cfg
+from core.logger import log
+
+METRICS_HOST = getattr(cfg, "METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(getattr(cfg, "METRICS_PORT", 0))
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 80)
+
+# (имя, help, метки, значение) — gauge, снятый в момент запроса /metrics
+Sample = Tuple[str, str, Dict[str, str], float]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(labels: dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(str(v))}"' for k, v in labels.items()) + "}"
+
+
+def _num(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return (
+        repr(float(value))
+        if isinstance(value, float) and not value.is_integer()
+        else str(int(value))
+    )
+
+
+class _Metric(abc.ABC):
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._values: dict[tuple, Any] = {}
+
+    def _key(self, labels: dict[str, Any]) -> tuple:
+        return tuple(str(labels.get(name, "")) for name in self.labels)
+
+    @abc.abstractmethod
+    def _lines(self) -> Iterator[str]:
+        """Строки экспозиции Prometheus для значений метрики (без HELP/TYPE)."""
+
+    def render(self) -> str:
+        head = f"# HELP {self.name} {self.help}\n# TYPE {self.name} {self.kind}\n"
+        return head + "".join(line + "\n" for line in self._lines())
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: Any) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def _lines(self) -> Iterator[str]:
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield f"{self.name}{_labels(dict(zip(self.labels, key)))} {_num(value)}"
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key) or ([0] * len(self.buckets), 0.0)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value)
+
+    def count(self, **labels: Any) -> int:
+        with self._lock:
+            item = self._values.get(self._key(labels))
+        return item[0][-1] if item else 0
+
+    def _lines(self) -> Iterator[str]:
+        with self._lock:
+            items = [(key, list(counts), total) for key, (counts, total) in self._values.items()]
+        for key, counts, total in items:
+            labels = dict(zip(self.labels, key))
+            for bound, n in zip(self.buckets, counts):
+                yield f"{self.name}_bucket{_labels({**labels, 'le': _num(bound)})} {n}"
+            yield f"{self.name}_sum{_labels(labels)} {_num(total)}"
+            yield f"{self.name}_count{_labels(labels)} {counts[-1]}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: dict[str, _Metric] = {}
+        self._collectors: list[Callable[[], Iterable[Sample]]] = []
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name: str, *args, **kwargs) -> Any:
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            return metric
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        return self._get(Counter, name, help, labels)
+
+    def histogram(
+        self,
+        name: str,
+        help: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self._get(Histogram, name, help, labels, buckets)
+
+    def collector(self, fn: Callable[[], Iterable[Sample]]) -> Callable[[], Iterable[Sample]]:
+        self._collectors.append(fn)
+        return fn
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        parts = [m.render() for m in metrics]
+        gauges: dict[str, tuple[str, list[str]]] = {}
+        for fn in self._collectors:
+            try:
+                for name, help, labels, value in fn():
+                    gauges.setdefault(name, (help, []))[1].append(
+                        f"{name}{_labels(labels)} {_num(value)}"
+                    )
+            except Exception as e:
+                log.warning("metrics collector %s failed: %s", getattr(fn, "__name__", fn), e)
+        for name, (help, lines) in gauges.items():
+            parts.append(
+                f"# HELP {name} {help}\n# TYPE {name} gauge\n"
+                + "".join(line + "\n" for line in lines)
+            )
+        return "".join(parts)
+
+
+registry = Registry()
+counter = registry.counter
+histogram = registry.histogram
+
+stage_seconds = histogram("bot_stage_seconds", "Stage latency", ("stage", "status"))
+llm_ttft_seconds = histogram("bot_llm_ttft_seconds", "Time to first streamed token", ("model",))
+llm_tokens = counter("bot_llm_tokens_total", "OpenAI token usage", ("call", "kind"))
+
+# ---------------- spans ----------------
+_trace: contextvars.ContextVar[dict[str, float] | None] = contextvars.ContextVar(
+    "trace", default=None
+)
+
+
+@contextmanager
+def trace() -> Iterator[dict[str, float]]:
+    """
+    Собрать длительности span-ов текущей задачи (и созданных внутри неё) в словарь.
+    Вложенный trace() пишет во внешний (так bench/replay.py получает этапы handle_question).
+    """
+    outer = _trace.get()
+    if outer is not None:
+        yield outer
+        return
+    spans: dict[str, float] = {}
+    token = _trace.set(spans)
+    try:
+        yield spans
+    finally:
+        _trace.reset(token)
+
+
+@contextmanager
+def span(stage: str) -> Iterator[None]:
+    started = time.perf_counter()
+    status = "ok"
+    try:
+        yield
+    except asyncio.CancelledError:
+        status = "cancelled"
+        raise
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        stage_seconds.observe(elapsed, stage=stage, status=status)
+        spans = _trace.get()
+        if spans is not None:
+            spans[stage] = spans.get(stage, 0.0) + elapsed
+
+
+@contextmanager
+def timed(metric: Histogram, **labels: Any) -> Iterator[dict[str, Any]]:
+    """Замер в произвольную гистограмму; метки можно дописать внутри блока (например, status)."""
+    started = time.perf_counter()
+    labels = dict(labels)
+    try:
+        yield labels
+    finally:
+        metric.observe(time.perf_counter() - started, **labels)
+
+
+def record_usage(call: str, usage: Any) -> None:
+    """Токены из resp.usage OpenAI (или последнего чанка стрима с include_usage)."""
+    if usage is None:
+        return
+    llm_tokens.inc(getattr(usage, "prompt_tokens", 0) or 0, call=call, kind="prompt")
+    llm_tokens.inc(getattr(usage, "completion_tokens", 0) or 0, call=call, kind="completion")
+
+
+def format_trace(spans: dict[str, float]) -> str:
+    return " ".join(f"{k}={v:.3f}" for k, v in spans.items())
+
+
+# ---------------- состояния пулов/лимитов/кэшей ----------------
+@registry.collector
+def _runtime_samples() -> Iterator[Sample]:
+    from core.cache import cache_stats
+    from core.http import pool_stats
+    from core.limits import limits_stats
+    from core.workers import worker_stats
+
+    for pool, stats in pool_stats().items():
+        for key, value in stats.items():
+            yield "bot_http_pool", "HTTP pool and DNS cache state", {
+                "pool": pool,
+                "stat": key,
+            }, value
+    for pool, tasks in worker_stats().items():
+        for task, stats in tasks.items():
+            for key, value in stats.items():
+                yield "bot_worker_tasks", "Worker pool task stats", {
+                    "pool": pool,
+                    "task": task,
+                    "stat": key,
+                }, value
+    for stage, stats in limits_stats().items():
+        for key, value in stats.items():
+            yield "bot_stage_limit", "Stage concurrency limits", {
+                "stage": stage,
+                "stat": key,
+            }, value
+    for name, stats in cache_stats().items():
+        for key, value in stats.items():
+            yield "bot_cache", "In-memory cache hits/misses/size", {
+                "cache": name,
+                "stat": key,
+            }, value
+
+
+@registry.collector
+def _scheduler_samples() -> Iterator[Sample]:
+    from services.scheduler import scheduler
+
+    for key, value in scheduler.stats().items():
+        yield "bot_scheduler", "Admission scheduler state", {"stat": key}, value
+
+
+# ---------------- /metrics ----------------
+async def metrics_handler(request) -> Any:
+    from aiohttp import web
+
+    return web.Response(
+        text=registry.render(),
+        content_type="text/plain",
+        charset="utf-8",
+        headers={"X-Content-Type-Options": "nosniff"},
+    )
+
+
+def metrics_port() -> int:
+    shard = os.getenv("SHARD_INDEX")
+    if METRICS_PORT and shard is not None:
+        return METRICS_PORT + 1 + int(shard)
+    return METRICS_PORT
+
+
+async def start_metrics_server(host: str = METRICS_HOST, port: int | None = None):
+    """
+    Поднять /metrics; возвращает AppRunner (закрыть через runner.cleanup())
+    или None, если выключено.
+    """
+    from aiohttp import web
+
+    port = metrics_port() if port is None else port
+    if not port:
+        return None
+    app = web.Application()
+    app.router.add_get("/metrics", metrics_handler)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    log.info("metrics: http://%s:%d/metrics", host, port)
+    return runner
@@ -0,0 +1,65 @@
+"""
+Single-flight: одинаковая работа, запущенная одновременно, выполняется один раз.
+
+Первый вызов с ключом запускает вычисление отдельной задачей, остальные ждут её же
+результат (или то же исключение). Отмена одного ожидающего не отменяет работу для
+других; если отменились все — задача отменяется. После завершения ключ освобождается
+(кэшированием результата занимаются TTLCache/page_cache, не этот слой).
+"""
+
+from __future__ import annotations
+
+import asyncio
+from typing import Any, Awaitable, Callable
+
+from core.logger import log
+
+
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self.calls = 0
+        self.shared = 0
+        # key -> (задача, число ожидающих)
+        self._inflight: dict[str, tuple[asyncio.Task, list]] = {}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        self.calls += 1
+        entry = self._inflight.get(key)
+        if (
+            entry is not None
+            and entry[0].get_loop() is asyncio.get_running_loop()
+            and not entry[0].done()
+        ):
+            self.shared += 1
+            log.info("%s single-flight: joined in-flight %r", self.name, key[:120])
+        else:
+            task = asyncio.ensure_future(fn())
+            entry = (task, [0])
+            self._inflight[key] = entry
+            task.add_done_callback(lambda t, k=key: self._forget(k, t))
+        task, waiters = entry
+        waiters[0] += 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if not task.done() and waiters[0] == 1:
+                # ключ освобождаем сразу: новый вызов не должен присоединиться к отменяемой
+                # задаче (до done-callback) и получить чужой CancelledError
+                if self._inflight.get(key) is entry:
+                    del self._inflight[key]
+                task.cancel()
+            raise
+        finally:
+            waiters[0] -= 1
+
+    def _forget(self, key: str, task: asyncio.Task) -> None:
+        entry = self._inflight.get(key)
+        if entry is not None and entry[0] is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            # исключение уже получили ожидающие; гасим «never retrieved», если их не осталось
+            task.exception()
+
+    def stats(self) -> dict[str, int]:
+        return {"calls": self.calls, "shared": self.shared, "inflight": len(self._inflight)}
@@ -0,0 +1,129 @@
+"""
+Пулы исполнителей для CPU-работы, чтобы она не занимала поток event loop.
+
+  - "parse": разбор HTML выдачи поиска (BeautifulSoup) и страниц (lxml). Функции без
+    состояния можно отдать в процессы (WORKER_PARSE_KIND=process), потоковый разбор
+    страницы держит состояние и всегда идёт в потоки (run(..., threads_only=True));
+  - "audio": распознавание Vosk — всегда потоки (модель Vosk одна на процесс, cffi-вызовы
+    распознавателя отпускают GIL). Декодирование голоса ffmpeg идёт отдельным процессом
+    (asyncio.create_subprocess_exec в services/voice.py) и пул не занимает;
+  - "io": блокирующий ввод-вывод кэша страниц (SQLite) — свои потоки, чтобы чтение и
+    запись кэша не стояли в очереди за разбором HTML (размер — WORKER_IO_SIZE).
+
+Очередь ограничена: не больше size + WORKER_QUEUE_SIZE задач на пул, остальные ждут
+слота в event loop. По каждой задаче замеряем ожидание в очереди и время выполнения
+(stats(), медленные — в лог).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import multiprocessing
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable
+
+import core.config as cfg
+from core.logger import log
+
+WORKER_PARSE_KIND = getattr(cfg, "WORKER_PARSE_KIND", "thread")
+WORKER_PARSE_SIZE = int(getattr(cfg, "WORKER_PARSE_SIZE", 2))
+WORKER_AUDIO_SIZE = int(getattr(cfg, "WORKER_AUDIO_SIZE", 2))
+WORKER_IO_SIZE = int(getattr(cfg, "WORKER_IO_SIZE", 4))
+WORKER_QUEUE_SIZE = int(getattr(cfg, "WORKER_QUEUE_SIZE", 32))
+WORKER_SLOW_TASK_SECONDS = float(getattr(cfg, "WORKER_SLOW_TASK_SECONDS", 1.0))
+
+
+class WorkerPool:
+    def __init__(self, name: str, kind: str, size: int, queue_size: int):
+        self.name = name
+        self.kind = kind if kind in ("thread", "process") else "thread"
+        self.size = max(1, size)
+        self.queue_size = max(0, queue_size)
+        self._executor: Executor | None = None
+        self._threads: ThreadPoolExecutor | None = None
+        self._slots: asyncio.Semaphore | None = None
+        self._slots_loop: asyncio.AbstractEventLoop | None = None
+        self._stats: dict[str, dict[str, float]] = {}
+
+    def _get_executor(self, threads_only: bool) -> Executor:
+        if threads_only or self.kind == "thread":
+            if self._threads is None:
+                self._threads = ThreadPoolExecutor(
+                    self.size, thread_name_prefix=f"{self.name}-worker"
+                )
+            return self._threads
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                self.size, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor
+
+    def _get_slots(self) -> asyncio.Semaphore:
+        # семафор привязан к loop — при смене loop (тесты) создаём заново
+        loop = asyncio.get_running_loop()
+        if self._slots is None or self._slots_loop is not loop:
+            self._slots = asyncio.Semaphore(self.size + self.queue_size)
+            self._slots_loop = loop
+        return self._slots
+
+    async def run(self, fn: Callable, *args: Any, threads_only: bool = False) -> Any:
+        """
+        Выполнить fn(*args) в пуле. threads_only=True — fn/аргументы с состоянием или не
+        сериализуются: только поток, даже если пул процессный.
+        """
+        task = getattr(fn, "__qualname__", repr(fn))
+        queued_at = time.monotonic()
+        async with self._get_slots():
+            # ожидание — до получения слота; время выполнения включает очередь самого executor
+            started = time.monotonic()
+            executor = self._get_executor(threads_only)
+            result = await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+        self._record(task, started - queued_at, time.monotonic() - started)
+        return result
+
+    def _record(self, task: str, wait: float, run: float) -> None:
+        s = self._stats.setdefault(
+            task, {"count": 0, "wait_total": 0.0, "run_total": 0.0, "run_max": 0.0}
+        )
+        s["count"] += 1
+        s["wait_total"] += wait
+        s["run_total"] += run
+        s["run_max"] = max(s["run_max"], run)
+        if run >= WORKER_SLOW_TASK_SECONDS:
+            log.warning("%s pool: slow task %s %.2fs (queued %.2fs)", self.name, task, run, wait)
+
+    def stats(self) -> dict[str, dict[str, float]]:
+        return {task: dict(s) for task, s in self._stats.items()}
+
+    def shutdown(self) -> None:
+        for ex in (self._executor, self._threads):
+            if ex is not None:
+                ex.shutdown(wait=False, cancel_futures=True)
+        self._executor = self._threads = None
+
+
+parse_pool = WorkerPool("parse", WORKER_PARSE_KIND, WORKER_PARSE_SIZE, WORKER_QUEUE_SIZE)
+audio_pool = WorkerPool("audio", "thread", WORKER_AUDIO_SIZE, WORKER_QUEUE_SIZE)
+io_pool = WorkerPool("io", "thread", WORKER_IO_SIZE, WORKER_QUEUE_SIZE)
+
+
+async def run_parse(fn: Callable, *args: Any, threads_only: bool = False) -> Any:
+    return await parse_pool.run(fn, *args, threads_only=threads_only)
+
+
+async def run_audio(fn: Callable, *args: Any) -> Any:
+    return await audio_pool.run(fn, *args)
+
+
+async def run_io(fn: Callable, *args: Any) -> Any:
+    return await io_pool.run(fn, *args)
+
+
+def worker_stats() -> dict[str, dict[str, dict[str, float]]]:
+    return {p.name: p.stats() for p in (parse_pool, audio_pool, io_pool)}
+
+
+def shutdown_workers() -> None:
+    for p in (parse_pool, audio_pool, io_pool):
+        p.shutdown()
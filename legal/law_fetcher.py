@@ -1,8 +1,23 @@
-from typing import Dict
+from typing import Dict, Iterable, List, Sequence, Tuple
+from urllib.parse import urlsplit
+import asyncio
+import codecs
 import httpx
-from bs4 import BeautifulSoup
+from lxml import etree
 import re
 
+import core.config as cfg
+from core.http import get_async_client, get_client
+from core.limits import fetch_limit
+from core.logger import log
+from core.metrics import histogram, timed
+from core.singleflight import SingleFlight
+from core.workers import run_io, run_parse
+from legal.page_cache import CachedPage, canonical_url, page_cache
+from legal.passage import extract_passage, passage_is_enough
+
+Targets = Sequence[Tuple[str, str, str]]
+
 FZ_EDIT_RE = re.compile(r"(ФЗ[\--]\d{1,4}[\--]ФЗ\s+от\s+\d{2}\.\d{2}\.\d{4})")
 
 UA = (
@@ -10,21 +25,369 @@ UA = (
     "AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Safari/537.36"
 )
 
-def fetch_page(url: str) -> Dict:
-    r = httpx.get(url, timeout=25, follow_redirects=True, headers={
-        "User-Agent": UA,
-        "Accept-Language": "ru,en;q=0.9",
-    })
-    r.raise_for_status()
-    soup = BeautifulSoup(r.text, "lxml")
-    for s in soup(["script", "style", "noscript"]):
-        s.extract()
-    text = soup.get_text(" ", strip=True)
-    title = soup.title.get_text(strip=True) if soup.title else url
+FETCH_CONCURRENCY = max(1, int(getattr(cfg, "FETCH_CONCURRENCY", 6)))
+FETCH_PER_HOST_LIMIT = max(1, int(getattr(cfg, "FETCH_PER_HOST_LIMIT", 2)))
+FETCH_DEADLINE_SECONDS = float(getattr(cfg, "FETCH_DEADLINE_SECONDS", 12))
+FETCH_TIMEOUT_SECONDS = float(getattr(cfg, "FETCH_TIMEOUT_SECONDS", 25))
+FETCH_MAX_BYTES = int(getattr(cfg, "FETCH_MAX_BYTES", 3 * 1024 * 1024))
+FETCH_TEXT_BUDGET_CHARS = int(getattr(cfg, "FETCH_TEXT_BUDGET_CHARS", 60000))
+# куски тела копим до FEED_BATCH_BYTES на один заход в пул разбора;
+# целевую статью ищем не на каждом куске, а по приросту текста на TARGET_CHECK_CHARS
+FEED_BATCH_BYTES = 64 * 1024
+TARGET_CHECK_CHARS = 4000
+
+fetch_flight = SingleFlight("fetch")
+# outcome: cache (свежая из кэша), revalidated (304), fetched, stale (сбой — отдали старую), error
+fetch_seconds = histogram("bot_fetch_seconds", "Page fetch latency by host", ("host", "outcome"))
+
+HTML_TYPES = ("text/html", "application/xhtml+xml")
+META_CHARSET_RE = re.compile(rb"""<meta[^>]+charset\s*=\s*["']?([\w-]+)""", re.IGNORECASE)
+TEXT_TYPES = ("text/plain",)
+
+HEADERS = {
+    "User-Agent": UA,
+    "Accept-Language": "ru,en;q=0.9",
+}
+
+class _TextCollector:
+    """
+    Цель (target) для потокового lxml-парсера: собирает видимый текст и <title>,
+    не строя дерево. Текст внутри script/style/noscript пропускаем.
+    """
+    SKIP = {"script", "style", "noscript"}
+
+    def __init__(self):
+        self.parts: List[str] = []
+        self.text_len = 0
+        self.title = ""
+        self._buf: List[str] = []
+        self._skip = 0
+        self._in_title = False
+
+    def _flush(self):
+        t = " ".join("".join(self._buf).split())
+        self._buf = []
+        if not t or self._skip:
+            return
+        if self._in_title and not self.title:
+            self.title = t
+        self.parts.append(t)
+        self.text_len += len(t) + 1
+
+    def start(self, tag, attrib):
+        self._flush()
+        if tag in self.SKIP:
+            self._skip += 1
+        elif tag == "title":
+            self._in_title = True
+
+    def end(self, tag):
+        self._flush()
+        if tag in self.SKIP:
+            self._skip = max(0, self._skip - 1)
+        elif tag == "title":
+            self._in_title = False
+
+    def data(self, data):
+        self._buf.append(data)
+
+    def comment(self, text):
+        pass
+
+    def close(self):
+        self._flush()
+        return self
+
+
+class _StreamExtractor:
+    """
+    Потоковое извлечение текста страницы: режем по байтовому бюджету (FETCH_MAX_BYTES)
+    и прекращаем чтение, как только набрали FETCH_TEXT_BUDGET_CHARS символов текста
+    или (если заданы целевые нормы) уже собрали фрагмент нужной статьи.
+    """
+
+    def __init__(self, url: str, content_type: str, encoding: str | None, targets: Targets = ()):
+        ctype = (content_type or "text/html").split(";")[0].strip().lower()
+        if ctype not in HTML_TYPES + TEXT_TYPES:
+            raise ValueError(f"unsupported content-type {ctype!r} for {url}")
+        self.url = url
+        self.targets = targets
+        self.received = 0
+        self.truncated = False
+        self.stopped = False
+        self._checked_len = 0
+        self._plain = ctype in TEXT_TYPES
+        self._encoding = encoding
+        self._raw: List[bytes] = []
+        self._rest = b""
+        self._collector = _TextCollector()
+        self._parser = None
+
+    @classmethod
+    def for_response(cls, url: str, r: httpx.Response, targets: Targets = ()) -> "_StreamExtractor":
+        return cls(url, r.headers.get("content-type", ""), r.charset_encoding, targets)
+
+    def feed(self, chunk: bytes) -> bool:
+        """Скормить очередной кусок. True — данных достаточно, дальше не читаем."""
+        room = FETCH_MAX_BYTES - self.received
+        if len(chunk) > room:
+            chunk = chunk[:max(0, room)]
+            self.truncated = True
+        self.received += len(chunk)
+        if self._plain:
+            self._raw.append(chunk)
+            self.stopped = self.truncated or self.received >= FETCH_TEXT_BUDGET_CHARS * 2
+            return self.stopped
+        # режем только после '>', чтобы не разорвать закрывающий тег (libxml2 push-парсер
+        # иначе «проглатывает» остаток документа внутри <script>)
+        buf = self._rest + chunk
+        if self._parser is None:
+            self._parser = self._new_parser(buf)
+        cut = buf.rfind(b">") + 1
+        if cut:
+            self._parser.feed(buf[:cut])
+            self._rest = buf[cut:]
+        else:
+            self._rest = buf
+        self.stopped = (
+            self.truncated
+            or self._collector.text_len >= FETCH_TEXT_BUDGET_CHARS
+            or (bool(self.targets) and cut > 0 and self._target_found())
+        )
+        return self.stopped
+
+    def _target_found(self) -> bool:
+        # extract_passage идёт по всему собранному тексту — только после заметного прироста
+        if self._collector.text_len - self._checked_len < TARGET_CHECK_CHARS:
+            return False
+        self._checked_len = self._collector.text_len
+        return passage_is_enough(extract_passage(" ".join(self._collector.parts), self.targets))
+
+    def _new_parser(self, head: bytes) -> etree.HTMLParser:
+        return etree.HTMLParser(target=self._collector, encoding=self._sniff_encoding(head))
+
+    def _sniff_encoding(self, head: bytes) -> str:
+        """Кодировка: из заголовка, иначе из <meta charset> в начале документа, иначе utf-8."""
+        if self._encoding:
+            return self._encoding
+        m = META_CHARSET_RE.search(head[:4096])
+        enc = m.group(1).decode("ascii") if m else "utf-8"
+        try:
+            codecs.lookup(enc)
+        except LookupError:
+            enc = "utf-8"
+        return enc
+
+    def page(self) -> Dict:
+        if self._plain:
+            raw = b"".join(self._raw).decode(self._encoding or "utf-8", errors="replace")
+            text = " ".join(raw.split())
+            title = ""
+        else:
+            # при досрочной остановке хвост после последнего '>' отбрасываем: он может
+            # обрываться посреди многобайтного символа
+            if self._parser is None:
+                self._parser = self._new_parser(self._rest)
+            if self._rest and not self.stopped:
+                self._parser.feed(self._rest)
+            try:
+                self._parser.close()
+            except (etree.XMLSyntaxError, UnicodeDecodeError):
+                pass
+            text = " ".join(self._collector.parts)
+            title = self._collector.title
+        if self.truncated:
+            log.info("fetch %s: byte cap %d reached", self.url, FETCH_MAX_BYTES)
+        return _make_page(self.url, title or self.url, text, self.targets)
+
+
+def _make_page(url: str, title: str, text: str, targets: Targets = ()) -> Dict:
+    # фрагмент под целевые статьи/части; если их на странице нет — начало текста
+    passage = extract_passage(text, targets) if targets else None
+    if passage:
+        return {"url": url, "title": title, "text": text, "snippet": passage["snippet"],
+                "edition": passage["edition"]}
 
     edit_match = FZ_EDIT_RE.search(text)
     snippet = text[:1800]
     if edit_match:
         snippet = f"{edit_match.group(1)} — {snippet}"
 
-    return {"url": url, "title": title, "text": text, "snippet": snippet}
\ No newline at end of file
+    return {"url": url, "title": title, "text": text, "snippet": snippet}
+
+def _cache_lookup(url: str) -> CachedPage | None:
+    cache = page_cache()
+    if cache is None:
+        return None
+    try:
+        return cache.get(url)
+    except Exception as e:
+        log.warning("page cache read failed %s: %s", url, e)
+        return None
+
+def _cache_usable(cached: CachedPage | None, targets: Targets) -> bool:
+    """Неполная копия (чтение остановили досрочно) годится только для тех же целей."""
+    if cached is None:
+        return False
+    partial = cached.page.get("partial")
+    return partial is None or partial == [list(t) for t in targets]
+
+def _cache_store(url: str, page: Dict, r: httpx.Response, ex: _StreamExtractor) -> None:
+    cache = page_cache()
+    if cache is None:
+        return
+    if ex.stopped or ex.truncated:
+        # без ETag/Last-Modified: 304 не должен продлевать обрезанную копию, по TTL перекачаем
+        page, etag, last_modified = {**page, "partial": [list(t) for t in ex.targets]}, "", ""
+    else:
+        etag, last_modified = r.headers.get("ETag", ""), r.headers.get("Last-Modified", "")
+    try:
+        cache.put(url, page, etag, last_modified)
+    except Exception as e:
+        log.warning("page cache write failed %s: %s", url, e)
+
+def _from_cache(url: str, cached: CachedPage, targets: Targets = ()) -> Dict:
+    # в кэше лежит текст — сниппет пересобираем под текущие цели
+    p = cached.page
+    return _make_page(url, p.get("title") or url, p.get("text") or "", targets)
+
+def _revalidated(
+    url: str, r: httpx.Response, cached: CachedPage | None, targets: Targets = ()
+) -> Dict | None:
+    """304 на условный запрос — отдаём закэшированную страницу, иначе None."""
+    if r.status_code != 304 or cached is None:
+        return None
+    cache = page_cache()
+    if cache is not None:
+        cache.touch(url)
+    return _from_cache(url, cached, targets)
+
+def fetch_page(url: str, targets: Targets = ()) -> Dict:
+    cached = _cache_lookup(url)
+    usable = _cache_usable(cached, targets)
+    if usable and cached.fresh:
+        return _from_cache(url, cached, targets)
+    headers = {**HEADERS, **(cached.validators() if usable else {})}
+    try:
+        with get_client().stream("GET", url, timeout=FETCH_TIMEOUT_SECONDS, headers=headers) as r:
+            page = _revalidated(url, r, cached if usable else None, targets)
+            if page is not None:
+                return page
+            r.raise_for_status()
+            ex = _StreamExtractor.for_response(url, r, targets)
+            for chunk in r.iter_bytes():
+                if ex.feed(chunk):
+                    break
+        page = ex.page()
+        _cache_store(url, page, r, ex)
+        return page
+    except Exception as e:
+        if cached is None:
+            raise
+        log.warning("fetch failed %s, serving stale cache: %s", url, e)
+        return _from_cache(url, cached, targets)
+
+async def fetch_page_async(url: str, targets: Targets = ()) -> Dict:
+    """
+    Страница из кэша, если свежая; устаревшая — условный запрос (ETag/Last-Modified),
+    при 304 отдаём закэшированную. При сетевой ошибке — устаревшая копия, если она есть.
+    Тело читается потоком с лимитом байт и ранней остановкой (см. _StreamExtractor);
+    разбор и сниппеты — в пуле разбора, чтение/запись кэша — в пуле io (core.workers),
+    не в event loop.
+    targets [(code, article, part)] — под них выбирается сниппет (legal.passage).
+    Одновременные загрузки той же страницы (канонический URL + цели) сливаются в одну.
+    """
+    key = canonical_url(url) + "|" + ";".join(":".join(t) for t in targets)
+    return dict(await fetch_flight.do(key, lambda: _fetch_page_async(url, targets)))
+
+async def _fetch_page_async(url: str, targets: Targets) -> Dict:
+    with timed(fetch_seconds, host=urlsplit(url).hostname or "", outcome="error") as m:
+        cached = await run_io(_cache_lookup, url)
+        usable = _cache_usable(cached, targets)
+        if usable and cached.fresh:
+            m["outcome"] = "cache"
+            return await run_parse(_from_cache, url, cached, targets, threads_only=True)
+        headers = {**HEADERS, **(cached.validators() if usable else {})}
+        prior = cached if usable else None
+        try:
+            request = get_async_client().stream(
+                "GET", url, timeout=FETCH_TIMEOUT_SECONDS, headers=headers
+            )
+            async with fetch_limit, request as r:
+                page = await run_parse(_revalidated, url, r, prior, targets, threads_only=True)
+                if page is not None:
+                    m["outcome"] = "revalidated"
+                    return page
+                r.raise_for_status()
+                ex = _StreamExtractor.for_response(url, r, targets)
+                batch: List[bytes] = []
+                size = 0
+                async for chunk in r.aiter_bytes():
+                    batch.append(chunk)
+                    size += len(chunk)
+                    if size >= FEED_BATCH_BYTES or ex.received + size >= FETCH_MAX_BYTES:
+                        if await run_parse(ex.feed, b"".join(batch), threads_only=True):
+                            break
+                        batch, size = [], 0
+                else:
+                    if batch:
+                        await run_parse(ex.feed, b"".join(batch), threads_only=True)
+            page = await run_parse(ex.page, threads_only=True)
+            await run_io(_cache_store, url, page, r, ex)
+            m["outcome"] = "fetched"
+            return page
+        except Exception as e:
+            if cached is None:
+                raise
+            log.warning("fetch failed %s, serving stale cache: %s", url, e)
+            m["outcome"] = "stale"
+            return await run_parse(_from_cache, url, cached, targets, threads_only=True)
+
+async def fetch_pages(
+    urls: Iterable[str],
+    concurrency: int = FETCH_CONCURRENCY,
+    per_host: int = FETCH_PER_HOST_LIMIT,
+    deadline: float = FETCH_DEADLINE_SECONDS,
+    targets: Targets = (),
+) -> List[Dict]:
+    """
+    Параллельная загрузка пакета страниц.
+    Не более `concurrency` запросов всего и `per_host` на один хост (consultant/garant не долбим).
+    Через `deadline` секунд возвращаем то, что успело прийти, остальное отменяем.
+    Порядок результатов — как во входном списке; упавшие/не успевшие страницы пропускаются.
+    """
+    urls = list(dict.fromkeys(u for u in urls if u))
+    if not urls:
+        return []
+
+    total = asyncio.Semaphore(max(1, concurrency))
+    hosts: Dict[str, asyncio.Semaphore] = {}
+
+    async def one(url: str) -> Dict:
+        host = urlsplit(url).hostname or ""
+        host_sem = hosts.setdefault(host, asyncio.Semaphore(max(1, per_host)))
+        async with host_sem, total:
+            return await fetch_page_async(url, targets)
+
+    tasks = [asyncio.create_task(one(u)) for u in urls]
+    done, pending = await asyncio.wait(tasks, timeout=deadline)
+    for t in pending:
+        t.cancel()
+    if pending:
+        await asyncio.gather(*pending, return_exceptions=True)
+        log.warning(
+            "fetch deadline %.1fs: %d of %d pages not fetched", deadline, len(pending), len(urls)
+        )
+
+    pages: List[Dict] = []
+    for url, t in zip(urls, tasks):
+        if t not in done:
+            continue
+        if t.cancelled():
+            log.warning("fetch cancelled %s", url)
+            continue
+        if t.exception() is not None:
+            log.warning("fetch failed %s: %s", url, t.exception())
+            continue
+        pages.append(t.result())
+    return pages
@@ -1,10 +1,19 @@
 # coding: utf-8
 from typing import List, Dict, Iterable
-import httpx
+import asyncio
+import re
+import time
 from bs4 import BeautifulSoup
 
 import core.config as cfg
+from core.cache import TTLCache
+from core.http import get_async_client, get_client
+from core.limits import search_limit
 from core.logger import log
+from core.metrics import counter, histogram, timed
+from core.singleflight import SingleFlight
+from core.workers import run_parse
+from legal.provider_health import provider_health
 
 # ---------------- Const / Config ----------------
 UA = (
@@ -32,98 +41,161 @@ DISABLE_DDG = bool(getattr(cfg, "DISABLE_DDG", False))
 
 HTTP_TIMEOUT_SECONDS = int(getattr(cfg, "HTTP_TIMEOUT_SECONDS", 15))
 
+SEARCH_FANOUT = bool(getattr(cfg, "SEARCH_FANOUT", False))
+SEARCH_FANOUT_CONCURRENCY = max(1, int(getattr(cfg, "SEARCH_FANOUT_CONCURRENCY", 4)))
+SEARCH_HEDGE_DELAY_SECONDS = float(getattr(cfg, "SEARCH_HEDGE_DELAY_SECONDS", 2.0))
+
+search_cache = TTLCache(
+    "search",
+    maxsize=int(getattr(cfg, "SEARCH_CACHE_SIZE", 2000)),
+    ttl=int(getattr(cfg, "SEARCH_CACHE_TTL_SECONDS", 6 * 3600)),
+    path=getattr(cfg, "SEARCH_CACHE_PATH", ""),
+)
+search_flight = SingleFlight("search")
+
+provider_seconds = histogram(
+    "bot_search_provider_seconds", "Search provider latency", ("provider", "outcome")
+)
+search_fallbacks = counter(
+    "bot_search_fallbacks_total", "Search fallbacks: next phase, DDG lite, hedge", ("kind",)
+)
+search_empty = counter("bot_search_empty_total", "Questions whose search returned no results")
+
 
 # ---------------- HTTP helper ----------------
-def _http_get(url: str, params: Dict | None = None, headers: Dict | None = None) -> str:
+def _headers(headers: Dict | None = None) -> Dict:
     h = {"User-Agent": UA, "Accept-Language": "ru,en;q=0.9"}
     if headers:
         h.update(headers)
-    r = httpx.get(
+    return h
+
+
+def _http_get(url: str, params: Dict | None = None, headers: Dict | None = None) -> str:
+    h = _headers(headers)
+    r = get_client().get(
         url,
         params=params or {},
         headers=h,
         timeout=HTTP_TIMEOUT_SECONDS,
-        follow_redirects=True,
+    )
+    r.raise_for_status()
+    return r.text
+
+
+async def _http_get_async(url: str, params: Dict | None = None, headers: Dict | None = None) -> str:
+    r = await get_async_client().get(
+        url, params=params or {}, headers=_headers(headers), timeout=HTTP_TIMEOUT_SECONDS
     )
     r.raise_for_status()
     return r.text
 
 
 # ---------------- Google Custom Search JSON API ----------------
+GOOGLE_CSE_URL = "https://www.googleapis.com/customsearch/v1"
+
+
+def _google_cse_params(q: str) -> Dict:
+    return {"key": GOOGLE_API_KEY, "cx": GOOGLE_CSE_ID, "q": q, "hl": "ru"}
+
+
+def _parse_google_cse(j: Dict) -> List[Dict]:
+    out: List[Dict] = []
+    for item in j.get("items", []) or []:
+        out.append({
+            "title": item.get("title") or "",
+            "url": item.get("link") or "",
+            "snippet": item.get("snippet") or "",
+        })
+        if len(out) >= SEARCH_MAX_RESULTS:
+            break
+    log.info("Google CSE results: %d", len(out))
+    return out
+
+
 def _google_cse_query(q: str) -> List[Dict]:
     if not (GOOGLE_API_KEY and GOOGLE_CSE_ID):
         return []
     try:
-        params = {"key": GOOGLE_API_KEY, "cx": GOOGLE_CSE_ID, "q": q, "hl": "ru"}
-        r = httpx.get(
-            "https://www.googleapis.com/customsearch/v1",
-            params=params,
-            timeout=HTTP_TIMEOUT_SECONDS,
+        r = get_client().get(
+            GOOGLE_CSE_URL, params=_google_cse_params(q), timeout=HTTP_TIMEOUT_SECONDS
         )
         r.raise_for_status()
-        j = r.json()
-        out: List[Dict] = []
-        for item in j.get("items", []) or []:
-            out.append({
-                "title": item.get("title") or "",
-                "url": item.get("link") or "",
-                "snippet": item.get("snippet") or "",
-            })
-            if len(out) >= SEARCH_MAX_RESULTS:
-                break
-        log.info("Google CSE results: %d", len(out))
-        return out
+        return _parse_google_cse(r.json())
     except Exception as e:
         log.warning("Google CSE failed: %s", e)
         return []
 
 
+async def _google_cse_query_async(q: str) -> List[Dict]:
+    # ошибки не глотаем: их считает _query_provider_async (здоровье провайдера)
+    if not (GOOGLE_API_KEY and GOOGLE_CSE_ID):
+        return []
+    r = await get_async_client().get(
+        GOOGLE_CSE_URL, params=_google_cse_params(q), timeout=HTTP_TIMEOUT_SECONDS
+    )
+    r.raise_for_status()
+    return _parse_google_cse(r.json())
+
+
 # ---------------- SearXNG (JSON) ----------------
+def _searxng_request(q: str) -> tuple[str, Dict, Dict]:
+    headers = {
+        "User-Agent": UA,
+        "Accept": "application/json",
+        # ниже — чтобы пройти локальный botdetection/trusted_proxies
+        "X-Real-IP": "127.0.0.1",
+        # "X-Forwarded-For": "127.0.0.1",  # при необходимости
+    }
+    params = {
+        "q": q,
+        "format": "json",
+        "language": "ru",
+        # можно добавить категории/диапазон по желанию:
+        # "categories": "general",
+        # "time_range": "year",
+        # "safesearch": 0,
+    }
+    return f"{SEARXNG_URL.rstrip('/')}/search", params, headers
+
+
+def _parse_searxng(j: Dict) -> List[Dict]:
+    out: List[Dict] = []
+    for item in j.get("results", []) or []:
+        out.append({
+            "title": item.get("title") or "",
+            "url": item.get("url") or "",
+            "snippet": item.get("content") or "",
+        })
+        if len(out) >= SEARCH_MAX_RESULTS:
+            break
+    log.info("SearXNG results: %d", len(out))
+    return out
+
+
 def _searxng_query(q: str) -> List[Dict]:
     if not (SEARXNG_ENABLED and SEARXNG_URL):
         return []
     try:
-        headers = {
-            "User-Agent": UA,
-            "Accept": "application/json",
-            # ниже — чтобы пройти локальный botdetection/trusted_proxies
-            "X-Real-IP": "127.0.0.1",
-            # "X-Forwarded-For": "127.0.0.1",  # при необходимости
-        }
-        params = {
-            "q": q,
-            "format": "json",
-            "language": "ru",
-            # можно добавить категории/диапазон по желанию:
-            # "categories": "general",
-            # "time_range": "year",
-            # "safesearch": 0,
-        }
-        r = httpx.get(
-            f"{SEARXNG_URL.rstrip('/')}/search",
-            params=params,
-            headers=headers,
-            timeout=HTTP_TIMEOUT_SECONDS,
-            follow_redirects=True,
-        )
+        url, params, headers = _searxng_request(q)
+        r = get_client().get(url, params=params, headers=headers, timeout=HTTP_TIMEOUT_SECONDS)
         r.raise_for_status()
-        j = r.json()
-        out: List[Dict] = []
-        for item in j.get("results", []) or []:
-            out.append({
-                "title": item.get("title") or "",
-                "url": item.get("url") or "",
-                "snippet": item.get("content") or "",
-            })
-            if len(out) >= SEARCH_MAX_RESULTS:
-                break
-        log.info("SearXNG results: %d", len(out))
-        return out
+        return _parse_searxng(r.json())
     except Exception as e:
         log.warning("SearXNG failed: %s", e)
         return []
 
 
+async def _searxng_query_async(q: str) -> List[Dict]:
+    if not (SEARXNG_ENABLED and SEARXNG_URL):
+        return []
+    url, params, headers = _searxng_request(q)
+    r = await get_async_client().get(
+        url, params=params, headers=headers, timeout=HTTP_TIMEOUT_SECONDS
+    )
+    r.raise_for_status()
+    return _parse_searxng(r.json())
+
+
 # ---------------- DuckDuckGo (HTML + Lite) fallback ----------------
 def _parse_ddg_html(text: str) -> List[Dict]:
     soup = BeautifulSoup(text, "lxml")
@@ -188,34 +260,72 @@ def _ddg_query_any(q: str) -> List[Dict]:
     return []
 
 
+async def _ddg_query_any_async(q: str) -> List[Dict]:
+    """HTML, при пустой/упавшей — Lite. Ошибка наружу, только если упали обе."""
+    if DISABLE_DDG:
+        return []
+    html_failed = False
+    try:
+        html = await _http_get_async(DUCKDUCKGO_HTML_BASE, params={"q": q})
+        out = await run_parse(_parse_ddg_html, html)
+        if out:
+            return out[:SEARCH_MAX_RESULTS]
+    except Exception as e:
+        html_failed = True
+        log.warning("DDG html failed: %s", e)
+    search_fallbacks.inc(kind="ddg_lite")
+    try:
+        lite = await _http_get_async(DDG_LITE_BASE, params={"q": q})
+    except Exception:
+        if html_failed:
+            raise
+        return []
+    return (await run_parse(_parse_ddg_lite, lite))[:SEARCH_MAX_RESULTS]
+
+
 # ---------------- Startpage (HTML) fallback ----------------
+STARTPAGE_HEADERS = {"Referer": "https://www.startpage.com/"}
+
+
+def _startpage_params(q: str) -> Dict:
+    return {"query": q, "cat": "web", "language": "ru_RU"}
+
+
+def _parse_startpage(html: str) -> List[Dict]:
+    soup = BeautifulSoup(html, "lxml")
+    out: List[Dict] = []
+    for res in soup.select("a.result-link"):
+        title = res.get_text(" ", strip=True)
+        url = res.get("href") or ""
+        if not url:
+            continue
+        out.append({"title": title, "url": url, "snippet": ""})
+        if len(out) >= SEARCH_MAX_RESULTS:
+            break
+    log.info("Startpage results: %d", len(out))
+    return out
+
+
 def _startpage_query(q: str) -> List[Dict]:
     if not STARTPAGE_ENABLED:
         return []
     try:
-        params = {"query": q, "cat": "web", "language": "ru_RU"}
-        html = _http_get(
-            STARTPAGE_HTML,
-            params=params,
-            headers={"Referer": "https://www.startpage.com/"},
-        )
-        soup = BeautifulSoup(html, "lxml")
-        out: List[Dict] = []
-        for res in soup.select("a.result-link"):
-            title = res.get_text(" ", strip=True)
-            url = res.get("href") or ""
-            if not url:
-                continue
-            out.append({"title": title, "url": url, "snippet": ""})
-            if len(out) >= SEARCH_MAX_RESULTS:
-                break
-        log.info("Startpage results: %d", len(out))
-        return out
+        html = _http_get(STARTPAGE_HTML, params=_startpage_params(q), headers=STARTPAGE_HEADERS)
+        return _parse_startpage(html)
     except Exception as e:
         log.warning("Startpage failed: %s", e)
         return []
 
 
+async def _startpage_query_async(q: str) -> List[Dict]:
+    if not STARTPAGE_ENABLED:
+        return []
+    html = await _http_get_async(
+        STARTPAGE_HTML, params=_startpage_params(q), headers=STARTPAGE_HEADERS
+    )
+    return await run_parse(_parse_startpage, html)
+
+
 # ---------------- Utilities ----------------
 def _with_sites(q: str) -> str:
     if not SOURCE_SITES:
@@ -224,6 +334,20 @@ def _with_sites(q: str) -> str:
     return f"{q} {sites}".strip()
 
 
+_SITE_RE = re.compile(r"\bsite:(\S+)", re.IGNORECASE)
+_NOISE_RE = re.compile(r"[^\w\s.:/-]+")
+
+
+def _search_key(provider: str, q: str) -> str:
+    """Ключ кэша: провайдер | нормализованный запрос | отсортированный site-фильтр."""
+    sites = sorted({s.lower() for s in _SITE_RE.findall(q)})
+    base = _SITE_RE.sub(" ", q)
+    if sites:
+        base = re.sub(r"\bOR\b", " ", base)
+    base = " ".join(_NOISE_RE.sub(" ", base.lower()).split())
+    return f"{provider}|{base}|{','.join(sites)}"
+
+
 def _dedup(results: List[Dict]) -> List[Dict]:
     seen = set()
     out: List[Dict] = []
@@ -291,4 +415,176 @@ def multi_query_search(queries: Iterable[str]) -> List[Dict]:
 
     out = _dedup(all_results)
     log.info("Search total results (dedup): %d", len(out))
+    if not out:
+        search_empty.inc()
+    return out
+
+
+def _providers() -> List[tuple]:
+    """Включённые провайдеры в исходном приоритете: [(provider, label, async_fn)]."""
+    out: List[tuple] = []
+    if GOOGLE_API_KEY and GOOGLE_CSE_ID:
+        out.append(("google", "Google CSE", _google_cse_query_async))
+    if SEARXNG_ENABLED and SEARXNG_URL:
+        out.append(("searxng", "SearXNG", _searxng_query_async))
+    if not DISABLE_DDG:
+        out.append(("ddg", "DDG any", _ddg_query_any_async))
+    if STARTPAGE_ENABLED:
+        out.append(("startpage", "Startpage", _startpage_query_async))
+    return out
+
+
+def _query_phases(q: str) -> List[tuple]:
+    """
+    Фазы поиска для одного запроса: [(label, provider, async_fn, query)], у каждого
+    провайдера strict (с site:) и broad. Порядок провайдеров и пропуск выключенных —
+    по их здоровью (legal.provider_health).
+    """
+    strict_q = _with_sites(q)
+    providers = {name: (label, fn) for name, label, fn in _providers()}
+    phases: List[tuple] = []
+    for name in provider_health.order(list(providers)):
+        label, fn = providers[name]
+        phases += [(f"{label} strict", name, fn, strict_q), (f"{label} broad", name, fn, q)]
+    return phases
+
+
+async def _run_phase_async(label: str, provider: str, fn, query: str) -> List[Dict]:
+    key = _search_key(provider, query)
+    cached = search_cache.get(key)
+    if cached is not None:
+        log.info("%s hits: %d (cache)", label, len(cached))
+        return list(cached)
+    # тот же запрос к тому же провайдеру уже летит (другой вопрос/пользователь) — ждём его
+    res = await search_flight.do(
+        key, lambda: _query_provider_async(label, provider, key, fn, query)
+    )
+    return list(res)
+
+
+async def _query_provider_async(label: str, provider: str, key: str, fn, query: str) -> List[Dict]:
+    res: List[Dict] = []
+    async with search_limit:
+        # предохранитель: выключенного провайдера не ждём (в полуоткрытом — один пробный запрос)
+        if not provider_health.acquire(provider):
+            log.info("%s skipped: provider circuit open", label)
+            return []
+        started = time.monotonic()
+        with timed(provider_seconds, provider=provider, outcome="error") as m:
+            try:
+                res = await fn(query) or []
+                m["outcome"] = "hit" if res else "empty"
+            except asyncio.CancelledError:
+                provider_health.release(provider)
+                raise
+            except Exception as e:
+                log.warning("%s failed: %s", label, e)
+        provider_health.record(provider, time.monotonic() - started, m["outcome"])
+    if res:
+        log.info("%s hits: %d", label, len(res))
+        # пустую выдачу не кэшируем: это может быть сбой/бан провайдера
+        search_cache.set(key, res)
+    return res
+
+
+async def _sequential_search(queries: Iterable[str]) -> List[Dict]:
+    all_results: List[Dict] = []
+
+    ran = 0
+    for q in queries:
+        for phase in _query_phases(q):
+            if len(all_results) >= SEARCH_MAX_RESULTS:
+                break
+            if ran:
+                search_fallbacks.inc(kind="phase")
+            ran += 1
+            all_results += await _run_phase_async(*phase)
+
+        if len(all_results) >= SEARCH_MAX_RESULTS:
+            break
+
+    return all_results
+
+
+async def _fanout_search(queries: Iterable[str]) -> List[Dict]:
+    """
+    Fan-out: сразу стартуют SEARCH_FANOUT_CONCURRENCY фаз (запрос × провайдер × strict/broad);
+    в окне сначала strict у разных провайдеров, затем broad, запросы (тиры) — по очереди.
+    Завершившаяся фаза, пока хитов не хватает, освобождает место следующей. Хедж: если за
+    SEARCH_HEDGE_DELAY_SECONDS никто из окна не ответил, сверх окна стартует ещё одна фаза
+    (не больше SEARCH_FANOUT_CONCURRENCY хеджей одновременно). Как только набралось
+    SEARCH_MAX_RESULTS уникальных URL — остальные отменяем.
+    Порядок выдачи — по исходному приоритету фаз, а не по времени ответа.
+    """
+    phases: List[tuple] = []
+    launch_keys: List[tuple] = []
+    for tier, q in enumerate(queries):
+        for j, ph in enumerate(_query_phases(q)):
+            launch_keys.append((tier, j % 2, j))  # j % 2: 0 — strict, 1 — broad
+            phases.append(ph)
+    pending = sorted(range(len(phases)), key=launch_keys.__getitem__)
+    done_results: Dict[int, List[Dict]] = {}
+    running: Dict[asyncio.Task, int] = {}
+    window = SEARCH_FANOUT_CONCURRENCY
+    hedge = SEARCH_HEDGE_DELAY_SECONDS if SEARCH_HEDGE_DELAY_SECONDS > 0 else None
+
+    def launch() -> None:
+        idx = pending.pop(0)
+        running[asyncio.create_task(_run_phase_async(*phases[idx]))] = idx
+
+    def collected() -> List[Dict]:
+        return [r for i in sorted(done_results) for r in done_results[i]]
+
+    try:
+        while pending and len(running) < window:
+            launch()
+
+        while running:
+            done, _ = await asyncio.wait(
+                running.keys(), timeout=hedge, return_when=asyncio.FIRST_COMPLETED
+            )
+            if not done:
+                # окно целиком висит дольше hedge-задержки — подстраховываемся следующей фазой
+                if pending and len(running) < 2 * window:
+                    log.info("Search hedge: starting %s", phases[pending[0]][0])
+                    search_fallbacks.inc(kind="hedge")
+                    launch()
+                continue
+
+            for t in done:
+                idx = running.pop(t)
+                # отменённая фаза (например, общая single-flight задача) — как пустая
+                done_results[idx] = [] if t.cancelled() else t.result()
+
+            if len(_dedup(collected())) >= SEARCH_MAX_RESULTS:
+                break
+
+            while pending and len(running) < window:
+                search_fallbacks.inc(kind="phase")
+                launch()
+    finally:
+        for t in running:
+            t.cancel()
+        if running:
+            await asyncio.gather(*running, return_exceptions=True)
+
+    return collected()
+
+
+async def multi_query_search_async(queries: Iterable[str]) -> List[Dict]:
+    """
+    Асинхронный вариант multi_query_search: тот же приоритет провайдеров,
+    но сетевые запросы не блокируют event loop. При SEARCH_FANOUT — параллельный
+    опрос с хеджированием (см. _fanout_search).
+    """
+    queries = list(queries)
+    if SEARCH_FANOUT:
+        all_results = await _fanout_search(queries)
+    else:
+        all_results = await _sequential_search(queries)
+
+    out = _dedup(all_results)
+    log.info("Search total results (dedup): %d", len(out))
+    if not out:
+        search_empty.inc()
     return out
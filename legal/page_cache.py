@@ -0,0 +1,181 @@
+"""
+Персистентный кэш загруженных страниц (fetch_page) на SQLite.
+
+- ключ — канонический URL (без фрагмента, utm-меток, с нормализованным хостом);
+- payload — JSON страницы ({url,title,text,snippet}), сжатый zlib;
+- TTL: свежая запись отдаётся без сети; устаревшая — ревалидируется по ETag / Last-Modified;
+- объём ограничен: при превышении выкидываем давно не читанные записи (LRU по accessed_at).
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import core.config as cfg
+from core.logger import log
+
+PAGE_CACHE_PATH = getattr(cfg, "PAGE_CACHE_PATH", "")
+PAGE_CACHE_TTL_SECONDS = int(getattr(cfg, "PAGE_CACHE_TTL_SECONDS", 3 * 24 * 3600))
+PAGE_CACHE_MAX_BYTES = int(getattr(cfg, "PAGE_CACHE_MAX_MB", 200)) * 1024 * 1024
+
+TRACKING_PARAMS = ("utm_", "yclid", "gclid", "fbclid", "_openstat")
+
+CREATE_SQL = """
+CREATE TABLE IF NOT EXISTS pages (
+  key TEXT PRIMARY KEY,
+  etag TEXT,
+  last_modified TEXT,
+  fetched_at REAL NOT NULL,
+  accessed_at REAL NOT NULL,
+  size INTEGER NOT NULL,
+  payload BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS pages_accessed ON pages(accessed_at);
+"""
+
+
+def canonical_url(url: str) -> str:
+    """Канонический вид URL для ключа кэша."""
+    parts = urlsplit((url or "").strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if host.startswith("www."):
+        host = host[4:]
+    port = parts.port
+    if port and not ((scheme == "http" and port == 80) or (scheme == "https" and port == 443)):
+        host = f"{host}:{port}"
+    path = parts.path or "/"
+    if len(path) > 1 and path.endswith("/"):
+        path = path.rstrip("/")
+    query = [
+        (k, v)
+        for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if not k.lower().startswith(TRACKING_PARAMS)
+    ]
+    return urlunsplit((scheme, host, path, urlencode(sorted(query)), ""))
+
+
+@dataclass
+class CachedPage:
+    page: dict
+    etag: str
+    last_modified: str
+    fresh: bool
+
+    def validators(self) -> dict[str, str]:
+        """Заголовки для условного запроса."""
+        h: dict[str, str] = {}
+        if self.etag:
+            h["If-None-Match"] = self.etag
+        if self.last_modified:
+            h["If-Modified-Since"] = self.last_modified
+        return h
+
+
+class PageCache:
+    def __init__(
+        self, path: str, ttl: int = PAGE_CACHE_TTL_SECONDS, max_bytes: int = PAGE_CACHE_MAX_BYTES
+    ):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        # файл делят процессы-шарды: запись другого процесса ждём, а не падаем с «locked»
+        self._db.execute("PRAGMA busy_timeout=5000")
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(CREATE_SQL)
+        self._db.commit()
+
+    def get(self, url: str) -> CachedPage | None:
+        key = canonical_url(url)
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT etag, last_modified, fetched_at, payload FROM pages WHERE key=?", (key,)
+            ).fetchone()
+            if not row:
+                return None
+            etag, last_modified, fetched_at, payload = row
+            self._db.execute("UPDATE pages SET accessed_at=? WHERE key=?", (now, key))
+            self._db.commit()
+        try:
+            page = json.loads(zlib.decompress(payload))
+        except Exception as e:
+            log.warning("page cache: corrupt entry %s: %s", key, e)
+            self.delete(url)
+            return None
+        return CachedPage(
+            page, etag or "", last_modified or "", fresh=(now - fetched_at) < self.ttl
+        )
+
+    def put(self, url: str, page: dict, etag: str = "", last_modified: str = "") -> None:
+        key = canonical_url(url)
+        now = time.time()
+        payload = zlib.compress(json.dumps(page, ensure_ascii=False).encode("utf-8"), 6)
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO pages"
+                "(key, etag, last_modified, fetched_at, accessed_at, size, payload) "
+                "VALUES(?, ?, ?, ?, ?, ?, ?)",
+                (key, etag or "", last_modified or "", now, now, len(payload), payload),
+            )
+            self._evict_locked()
+            self._db.commit()
+
+    def touch(self, url: str) -> None:
+        """Ревалидация прошла (304): запись снова свежая."""
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "UPDATE pages SET fetched_at=?, accessed_at=? WHERE key=?",
+                (now, now, canonical_url(url)),
+            )
+            self._db.commit()
+
+    def delete(self, url: str) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM pages WHERE key=?", (canonical_url(url),))
+            self._db.commit()
+
+    def _evict_locked(self) -> None:
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM pages").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        freed = 0
+        victims = []
+        for key, size in self._db.execute("SELECT key, size FROM pages ORDER BY accessed_at"):
+            victims.append((key,))
+            freed += size
+            if total - freed <= self.max_bytes:
+                break
+        self._db.executemany("DELETE FROM pages WHERE key=?", victims)
+        log.info("page cache: evicted %d entries (%d bytes)", len(victims), freed)
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+_cache: PageCache | None = None
+_cache_failed = False
+
+
+def page_cache() -> PageCache | None:
+    """Общий кэш процесса; None, если отключён (PAGE_CACHE_PATH пуст) или не открылся."""
+    global _cache, _cache_failed
+    if _cache is None and PAGE_CACHE_PATH and not _cache_failed:
+        try:
+            _cache = PageCache(PAGE_CACHE_PATH)
+        except Exception as e:
+            _cache_failed = True
+            log.warning("page cache disabled: %s", e)
+    return _cache
@@ -0,0 +1,129 @@
+"""
+Выделение фрагмента страницы под целевые нормы (QUAL) вместо text[:1800].
+
+Один проход составного регулярного выражения по тексту находит сразу:
+  - заголовки целевых статей «Статья N»,
+  - заголовки любых других статей (граница региона статьи),
+  - отметки о редакции ФЗ.
+Из нескольких вхождений целевой статьи берём то, за которым идёт самый длинный текст до
+следующей «Статья …» (в оглавлении/навигации вхождения короткие). Внутри региона ищем
+часть «M. …» и отдаём окно: заголовок статьи + текст части.
+"""
+
+from __future__ import annotations
+
+import re
+from typing import Sequence
+
+SNIPPET_CHARS = 1800
+HEADING_CHARS = 200
+
+# как в law_fetcher/validator + формулировка КонсультантПлюс
+# «в ред. Федерального закона от … N …-ФЗ»
+FZ_EDITION = (
+    r"ФЗ[\--]\d{1,4}[\--]ФЗ\s+от\s+\d{2}\.\d{2}\.\d{4}"
+    r"|Федеральн\w+\s+закон\w*\s+от\s+\d{2}\.\d{2}\.\d{4}\s+N\s*\d{1,4}-ФЗ"
+)
+ANY_ARTICLE = r"Статья\s+\d+(?:\.\d+)*"
+
+
+def _article_rx(article: str) -> str:
+    # «Статья 20.1», но не «Статья 20.10» и не «Статья 20.1.1»
+    return r"Статья\s+" + re.escape(article) + r"(?![\d]|\.\d)"
+
+
+def build_matcher(
+    targets: Sequence[tuple[str, str, str]]
+) -> tuple[re.Pattern, list[tuple[str, str]]]:
+    """
+    targets [(code, article, part)] ->
+    (составной паттерн, [(article, part)] по номеру группы t{i}).
+    """
+    wanted: list[tuple[str, str]] = []
+    for _, art, part in targets:
+        if art and (art, part) not in wanted:
+            wanted.append((art, part))
+    alts = [f"(?P<fz>{FZ_EDITION})"]
+    alts += [f"(?P<t{i}>{_article_rx(art)})" for i, (art, _) in enumerate(wanted)]
+    alts.append(f"(?P<any>{ANY_ARTICLE})")
+    return re.compile("|".join(alts), re.IGNORECASE), wanted
+
+
+def _part_span(region: str, part: str) -> int | None:
+    """Начало части «M. Текст» (или «часть M») внутри региона статьи."""
+    m = re.search(r"(?<![\d.])" + re.escape(part) + r"\.\s+[А-ЯЁA-Z]", region)
+    if not m:
+        m = re.search(r"\b[Чч]асть\s+" + re.escape(part) + r"\b", region)
+    return m.start() if m else None
+
+
+def extract_passage(
+    text: str,
+    targets: Sequence[tuple[str, str, str]],
+    max_chars: int = SNIPPET_CHARS,
+) -> dict | None:
+    """
+    -> {"snippet", "article", "part", "edition", "region_len", "complete"} или None,
+    если целевых статей в тексте нет. snippet уже содержит префикс редакции ФЗ
+    (как прежний сниппет fetch_page); complete — регион статьи закрыт следующей «Статья …».
+    """
+    if not text or not targets:
+        return None
+    rx, wanted = build_matcher(targets)
+    if not wanted:
+        return None
+
+    headings: list[tuple[int, int | None]] = []  # (pos, target idx | None)
+    editions: list[tuple[int, str]] = []
+    for m in rx.finditer(text):
+        kind = m.lastgroup
+        if kind == "fz":
+            editions.append((m.start(), m.group(0)))
+        elif kind == "any":
+            headings.append((m.start(), None))
+        else:
+            headings.append((m.start(), int(kind[1:])))
+
+    best: tuple[int, int, int, int] | None = None  # (length, -target_idx, start, end)
+    for i, (pos, t_idx) in enumerate(headings):
+        if t_idx is None:
+            continue
+        end = headings[i + 1][0] if i + 1 < len(headings) else len(text)
+        cand = (end - pos, -t_idx, pos, end)
+        if best is None or cand > best:
+            best = cand
+    if best is None:
+        return None
+
+    _, neg_idx, start, end = best
+    article, part = wanted[-neg_idx]
+    region = text[start:end]
+
+    snippet = region[:max_chars]
+    if part:
+        off = _part_span(region, part)
+        if off is not None and off > HEADING_CHARS:
+            head = region[:HEADING_CHARS].rsplit(" ", 1)[0]
+            snippet = f"{head} … {region[off:off + max(0, max_chars - len(head) - 3)]}"
+
+    in_region = [e for p, e in editions if start <= p < end]
+    edition = in_region[-1] if in_region else (editions[0][1] if editions else "")
+    if edition:
+        snippet = f"{edition} — {snippet}"
+    return {
+        "snippet": snippet,
+        "article": article,
+        "part": part,
+        "edition": edition,
+        "region_len": end - start,
+        "complete": end < len(text),
+    }
+
+
+def passage_is_enough(passage: dict | None, max_chars: int = SNIPPET_CHARS) -> bool:
+    """Для потоковой загрузки: нужный фрагмент уже собран, дальше страницу можно не читать."""
+    if not passage:
+        return False
+    return passage["region_len"] >= max_chars or (
+        passage["complete"] and passage["region_len"] >= 400
+    )
@@ -0,0 +1,227 @@
+"""
+Здоровье поисковых провайдеров: скользящая статистика и предохранители (circuit breaker).
+
+По последним PROVIDER_HEALTH_WINDOW вызовам провайдера считаем среднюю задержку, долю
+ошибок и долю полезных ответов (непустая выдача). Отсюда:
+
+  - порядок опроса: дешевле тот, у кого меньше «ожидаемое время до полезной выдачи»
+    (задержка / доля полезных); провайдеры без статистики сохраняют исходный приоритет
+    и идут первыми, чтобы её набрать;
+  - предохранитель: при доле ошибок >= PROVIDER_ERROR_RATE или доле полезных
+    <= PROVIDER_MIN_USEFUL_RATE (от PROVIDER_MIN_CALLS вызовов) провайдер выключается на
+    PROVIDER_OPEN_SECONDS. Потом — полуоткрытое состояние: пропускаем один пробный запрос;
+    удачный (непустой) возвращает провайдера, неудачный снова выключает с удвоенной
+    паузой (до PROVIDER_OPEN_MAX_SECONDS).
+
+Если выключены все провайдеры, запросы всё равно идут — без поиска ответ хуже, чем
+с медленным поиском.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from collections import deque
+from typing import Any, Iterator, Sequence
+
+import core.config as cfg
+from core.logger import log
+from core.metrics import Sample, registry
+
+PROVIDER_HEALTH_WINDOW = int(getattr(cfg, "PROVIDER_HEALTH_WINDOW", 20))
+PROVIDER_MIN_CALLS = int(getattr(cfg, "PROVIDER_MIN_CALLS", 5))
+PROVIDER_ERROR_RATE = float(getattr(cfg, "PROVIDER_ERROR_RATE", 0.5))
+PROVIDER_MIN_USEFUL_RATE = float(getattr(cfg, "PROVIDER_MIN_USEFUL_RATE", 0.1))
+PROVIDER_OPEN_SECONDS = float(getattr(cfg, "PROVIDER_OPEN_SECONDS", 60))
+PROVIDER_OPEN_MAX_SECONDS = float(getattr(cfg, "PROVIDER_OPEN_MAX_SECONDS", 900))
+PROVIDER_ADAPTIVE_ORDER = bool(getattr(cfg, "PROVIDER_ADAPTIVE_ORDER", True))
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class ProviderHealth:
+    def __init__(
+        self,
+        name: str,
+        window: int = PROVIDER_HEALTH_WINDOW,
+        min_calls: int = PROVIDER_MIN_CALLS,
+        error_rate: float = PROVIDER_ERROR_RATE,
+        min_useful_rate: float = PROVIDER_MIN_USEFUL_RATE,
+        open_seconds: float = PROVIDER_OPEN_SECONDS,
+        open_max_seconds: float = PROVIDER_OPEN_MAX_SECONDS,
+    ):
+        self.name = name
+        self.min_calls = max(1, min_calls)
+        self.error_rate_limit = error_rate
+        self.min_useful_rate = min_useful_rate
+        self.open_seconds = open_seconds
+        self.open_max_seconds = max(open_seconds, open_max_seconds)
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.cooldown = open_seconds
+        self.probing = False
+        self.skipped = 0
+        self.trips = 0
+        self._calls: deque[tuple[float, str]] = deque(maxlen=max(1, window))
+
+    # ---- статистика ----
+    def _rate(self, outcome: str) -> float:
+        if not self._calls:
+            return 0.0
+        return sum(1 for _, o in self._calls if o == outcome) / len(self._calls)
+
+    @property
+    def error_rate(self) -> float:
+        return self._rate("error")
+
+    @property
+    def useful_rate(self) -> float:
+        return self._rate("hit")
+
+    @property
+    def latency(self) -> float:
+        if not self._calls:
+            return 0.0
+        return sum(t for t, _ in self._calls) / len(self._calls)
+
+    def cost(self) -> float:
+        """Ожидаемое время до полезной выдачи; 0 — статистики пока мало."""
+        if len(self._calls) < self.min_calls:
+            return 0.0
+        return max(self.latency, 0.01) / max(self.useful_rate, 0.05)
+
+    # ---- предохранитель ----
+    def available(self, now: float) -> bool:
+        """Можно ли ставить провайдера в план (без захвата пробного запроса)."""
+        if self.state == OPEN:
+            return now >= self.opened_at + self.cooldown
+        return not (self.state == HALF_OPEN and self.probing)
+
+    def acquire(self, now: float) -> bool:
+        """Пропустить запрос? В полуоткрытом состоянии — только один пробный за раз."""
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN and now >= self.opened_at + self.cooldown:
+            self.state = HALF_OPEN
+            log.info("provider %s: half-open, probing", self.name)
+        if self.state == HALF_OPEN and not self.probing:
+            self.probing = True
+            return True
+        self.skipped += 1
+        return False
+
+    def release(self) -> None:
+        """Запрос отменён до результата (fan-out/дедлайн) — пробный слот освобождается."""
+        self.probing = False
+
+    def record(self, latency: float, outcome: str, now: float) -> None:
+        self._calls.append((latency, outcome))
+        if self.state != CLOSED:
+            # пробный запрос (или вынужденный, когда выключены все): удача — провайдер вернулся
+            probe, self.probing = self.probing, False
+            if outcome == "hit":
+                log.info("provider %s: recovered (%.2fs)", self.name, latency)
+                self.state = CLOSED
+                self.cooldown = self.open_seconds
+                self._calls.clear()
+            elif probe:
+                self._open(now, min(self.cooldown * 2, self.open_max_seconds))
+            return
+        if len(self._calls) < self.min_calls:
+            return
+        if self.error_rate >= self.error_rate_limit or self.useful_rate <= self.min_useful_rate:
+            self._open(now, self.open_seconds)
+
+    def _open(self, now: float, cooldown: float) -> None:
+        self.state = OPEN
+        self.opened_at = now
+        self.cooldown = cooldown
+        self.trips += 1
+        log.warning(
+            "provider %s: circuit open for %.0fs (errors %.0f%%, useful %.0f%%, %.2fs avg)",
+            self.name,
+            cooldown,
+            self.error_rate * 100,
+            self.useful_rate * 100,
+            self.latency,
+        )
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "state": self.state,
+            "calls": len(self._calls),
+            "latency": round(self.latency, 3),
+            "error_rate": round(self.error_rate, 3),
+            "useful_rate": round(self.useful_rate, 3),
+            "skipped": self.skipped,
+            "trips": self.trips,
+        }
+
+
+class ProviderHealthRegistry:
+    def __init__(self, adaptive: bool = PROVIDER_ADAPTIVE_ORDER, **kwargs):
+        self.adaptive = adaptive
+        self._kwargs = kwargs
+        self._providers: dict[str, ProviderHealth] = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str) -> ProviderHealth:
+        with self._lock:
+            h = self._providers.get(name)
+            if h is None:
+                h = self._providers[name] = ProviderHealth(name, **self._kwargs)
+            return h
+
+    def order(self, providers: Sequence[str], now: float | None = None) -> list[str]:
+        """
+        Провайдеры в порядке опроса: доступные — по cost() (при равенстве — исходный
+        приоритет), выключенные отбрасываются. Если выключены все — исходный порядок.
+        """
+        now = time.monotonic() if now is None else now
+        health = [self.get(p) for p in providers]
+        with self._lock:
+            ready = [h for h in health if h.available(now)]
+            if not ready:
+                return list(providers)
+            if self.adaptive:
+                ready.sort(key=lambda h: h.cost())  # sort стабилен — приоритет сохраняется
+        return [h.name for h in ready]
+
+    def acquire(self, name: str, now: float | None = None) -> bool:
+        now = time.monotonic() if now is None else now
+        h = self.get(name)
+        with self._lock:
+            if h.acquire(now):
+                return True
+            # последний шанс: остальные тоже выключены — не оставляем вопрос без поиска
+            if all(not o.available(now) for o in self._providers.values() if o is not h):
+                h.skipped -= 1
+                return True
+            return False
+
+    def release(self, name: str) -> None:
+        h = self.get(name)
+        with self._lock:
+            h.release()
+
+    def record(self, name: str, latency: float, outcome: str, now: float | None = None) -> None:
+        h = self.get(name)
+        with self._lock:
+            h.record(latency, outcome, time.monotonic() if now is None else now)
+
+    def stats(self) -> dict[str, dict[str, Any]]:
+        with self._lock:
+            return {name: h.stats() for name, h in self._providers.items()}
+
+
+provider_health = ProviderHealthRegistry()
+
+
+@registry.collector
+def _health_samples() -> Iterator[Sample]:
+    for name, stats in provider_health.stats().items():
+        for key, value in stats.items():
+            if key == "state":
+                key, value = "open", float(value != CLOSED)
+            labels = {"provider": name, "stat": key}
+            yield "bot_search_provider_health", "Search provider rolling health", labels, value
@@ -0,0 +1,301 @@
+"""
+Локальный полнотекстовый индекс кодексов (SQLite FTS5) с гранулярностью «статья / часть».
+
+Источник — локальные текстовые выгрузки (UTF-8), по файлу на кодекс (или на часть кодекса):
+  koap*.txt, uk*.txt, gk*.txt, tk*.txt, nk*.txt, upk*.txt
+Первая строка файла может задать ссылку на официальный текст: `# source: https://...`.
+Статьи распознаются по заголовкам «Статья N. Название», части — по абзацам «1. ...».
+
+Сборка:  python -m legal.statute_index build <dump_dir> [--db statutes.db]
+Поиск:   python -m legal.statute_index search "мелкое хулиганство" [--code "КоАП РФ"]
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import re
+import sqlite3
+import threading
+from typing import Iterable
+
+import core.config as cfg
+from core.logger import log
+
+STATUTE_INDEX_PATH = getattr(cfg, "STATUTE_INDEX_PATH", "")
+DEFAULT_SOURCE = "http://pravo.gov.ru/"
+SNIPPET_MAX_CHARS = 2500
+
+# (каноническое имя, префикс файла выгрузки, шаблон в свободном тексте); УПК раньше УК
+CODES: list[tuple[str, str, re.Pattern]] = [
+    ("КоАП РФ", "koap", re.compile(r"коап|административн\w*\s+правонаруш", re.IGNORECASE)),
+    ("УПК РФ", "upk", re.compile(r"\bупк\b|уголовно[\s-]*процессуальн", re.IGNORECASE)),
+    ("УК РФ", "uk", re.compile(r"\bук\b|уголовн\w*\s+кодекс", re.IGNORECASE)),
+    ("ГК РФ", "gk", re.compile(r"\bгк\b|гражданск\w*\s+кодекс", re.IGNORECASE)),
+    ("ТК РФ", "tk", re.compile(r"\bтк\b|трудов\w*\s+кодекс", re.IGNORECASE)),
+    ("НК РФ", "nk", re.compile(r"\bнк\b|налогов\w*\s+кодекс", re.IGNORECASE)),
+]
+
+RE_ARTICLE = re.compile(r"^\s*Статья\s+(\d+(?:\.\d+)*)\.?\s*(.*)$")
+RE_PART = re.compile(r"^\s*(\d+)\.\s+\S")
+RE_NUM = re.compile(r"\d+(?:\.\d+)*")
+RE_SOURCE = re.compile(r"^#\s*source:\s*(\S+)", re.IGNORECASE)
+
+CREATE_SQL = """
+CREATE TABLE IF NOT EXISTS articles (
+  code TEXT NOT NULL,
+  article TEXT NOT NULL,
+  title TEXT NOT NULL,
+  text TEXT NOT NULL,
+  source TEXT NOT NULL,
+  PRIMARY KEY (code, article)
+);
+CREATE TABLE IF NOT EXISTS parts (
+  code TEXT NOT NULL,
+  article TEXT NOT NULL,
+  part TEXT NOT NULL,
+  text TEXT NOT NULL,
+  PRIMARY KEY (code, article, part)
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS articles_fts USING fts5(
+  code UNINDEXED, article UNINDEXED, title, text, tokenize = 'unicode61'
+);
+"""
+
+
+def norm_code(s: str) -> str:
+    """«КоАП», «коап рф», «Уголовный кодекс» → каноническое имя; '' если не распознали."""
+    for name, _, rx in CODES:
+        if rx.search(s or ""):
+            return name
+    return ""
+
+
+def _code_for_file(filename: str) -> str:
+    stem = os.path.splitext(os.path.basename(filename))[0].lower()
+    for name, prefix, _ in CODES:
+        if stem.startswith(prefix):
+            return name
+    return ""
+
+
+def parse_dump(lines: Iterable[str]) -> tuple[str, list[dict]]:
+    """
+    Разбор выгрузки кодекса -> (source_url, [{article, title, text, parts: {N: text}}]).
+    Текст до первой «Статья N» (оглавление, разделы) пропускаем.
+    """
+    source = ""
+    articles: list[dict] = []
+    cur: dict | None = None
+    part_no = ""
+    for raw in lines:
+        line = raw.rstrip("\n")
+        if not articles and cur is None and not source:
+            m = RE_SOURCE.match(line)
+            if m:
+                source = m.group(1)
+                continue
+        m = RE_ARTICLE.match(line)
+        if m:
+            cur = {
+                "article": m.group(1),
+                "title": m.group(2).strip(),
+                "lines": [line.strip()],
+                "parts": {},
+            }
+            articles.append(cur)
+            part_no = ""
+            continue
+        if cur is None or not line.strip():
+            continue
+        cur["lines"].append(line.strip())
+        mp = RE_PART.match(line)
+        if mp:
+            part_no = mp.group(1)
+        if part_no:
+            cur["parts"].setdefault(part_no, []).append(line.strip())
+
+    out = []
+    for a in articles:
+        out.append(
+            {
+                "article": a["article"],
+                "title": a["title"],
+                "text": "\n".join(a["lines"]),
+                "parts": {k: "\n".join(v) for k, v in a["parts"].items()},
+            }
+        )
+    return source, out
+
+
+def build_index(dump_dir: str, path: str) -> int:
+    """Пересобирает индекс из выгрузок в dump_dir. Возвращает число статей."""
+    db = sqlite3.connect(path)
+    try:
+        db.executescript(CREATE_SQL)
+        db.execute("DELETE FROM articles")
+        db.execute("DELETE FROM parts")
+        db.execute("DELETE FROM articles_fts")
+        total = 0
+        for fn in sorted(os.listdir(dump_dir)):
+            code = _code_for_file(fn)
+            if not code or not fn.lower().endswith(".txt"):
+                continue
+            with open(os.path.join(dump_dir, fn), encoding="utf-8") as f:
+                source, articles = parse_dump(f)
+            for a in articles:
+                db.execute(
+                    "INSERT OR REPLACE INTO articles(code, article, title, text, source) "
+                    "VALUES(?, ?, ?, ?, ?)",
+                    (code, a["article"], a["title"], a["text"], source or DEFAULT_SOURCE),
+                )
+                db.executemany(
+                    "INSERT OR REPLACE INTO parts(code, article, part, text) VALUES(?, ?, ?, ?)",
+                    [(code, a["article"], p, t) for p, t in a["parts"].items()],
+                )
+                db.execute(
+                    "INSERT INTO articles_fts(code, article, title, text) VALUES(?, ?, ?, ?)",
+                    (code, a["article"], a["title"], a["text"]),
+                )
+            log.info("statute index: %s — %d articles from %s", code, len(articles), fn)
+            total += len(articles)
+        db.commit()
+        return total
+    finally:
+        db.close()
+
+
+def targets_from_qual(qual: list[str]) -> list[tuple[str, str, str]]:
+    """QUAL («Кодекс;Статья;Часть;Термин») -> [(code, article, part)] с каноническим кодексом."""
+    targets: list[tuple[str, str, str]] = []
+    for rec in qual or []:
+        parts = [p.strip() for p in rec.split(";")]
+        if len(parts) < 2:
+            continue
+        art = RE_NUM.search(parts[1])
+        part = RE_NUM.search(parts[2]) if len(parts) >= 3 else None
+        targets.append(
+            (norm_code(parts[0]), art.group(0) if art else "", part.group(0) if part else "")
+        )
+    return targets
+
+
+class StatuteIndex:
+    def __init__(self, path: str):
+        self._db = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+        self._lock = threading.Lock()
+
+    def lookup(self, code: str, article: str, part: str = "") -> dict | None:
+        """
+        Точный текст нормы: {code, article, part, title, text, source} или None.
+        Если часть указана, но в индексе её нет — None (цель не покрыта).
+        """
+        code = norm_code(code)
+        if not code or not article:
+            return None
+        with self._lock:
+            row = self._db.execute(
+                "SELECT title, text, source FROM articles WHERE code=? AND article=?",
+                (code, article),
+            ).fetchone()
+            if not row:
+                return None
+            title, text, source = row
+            if part:
+                prow = self._db.execute(
+                    "SELECT text FROM parts WHERE code=? AND article=? AND part=?",
+                    (code, article, part),
+                ).fetchone()
+                if not prow:
+                    return None
+                text = f"Статья {article}. {title}\n{prow[0]}"
+        return {
+            "code": code,
+            "article": article,
+            "part": part,
+            "title": title,
+            "text": text,
+            "source": source,
+        }
+
+    def search(self, query: str, code: str = "", limit: int = 5) -> list[dict]:
+        """Полнотекстовый поиск по статьям (FTS5, bm25)."""
+        terms = " ".join(f'"{w}"' for w in re.findall(r"\w+", query or ""))
+        if not terms:
+            return []
+        sql = (
+            "SELECT code, article, title, snippet(articles_fts, 3, '', '', '…', 32) "
+            "FROM articles_fts WHERE articles_fts MATCH ?"
+        )
+        args: list = [terms]
+        if code:
+            sql += " AND code=?"
+            args.append(norm_code(code))
+        sql += " ORDER BY bm25(articles_fts) LIMIT ?"
+        args.append(limit)
+        with self._lock:
+            rows = self._db.execute(sql, args).fetchall()
+        return [{"code": c, "article": a, "title": t, "snippet": s} for c, a, t, s in rows]
+
+    def resolve_targets(self, targets: list[tuple[str, str, str]]) -> list[dict] | None:
+        """
+        [(code, article, part)] -> страницы в формате контекста LLM
+        ({source, title, snippet}), только если покрыты ВСЕ цели; иначе None.
+        """
+        if not targets:
+            return None
+        pages: list[dict] = []
+        for code, article, part in targets:
+            hit = self.lookup(code, article, part)
+            if hit is None:
+                return None
+            label = f"{hit['code']} ст. {article}" + (f" ч. {part}" if part else "")
+            pages.append(
+                {
+                    "source": hit["source"],
+                    "title": f"{label}. {hit['title']}".strip(),
+                    "snippet": hit["text"][:SNIPPET_MAX_CHARS],
+                }
+            )
+        return pages
+
+    def close(self) -> None:
+        self._db.close()
+
+
+_index: StatuteIndex | None = None
+
+
+def statute_index() -> StatuteIndex | None:
+    """Общий индекс процесса; None, если STATUTE_INDEX_PATH не задан или файла нет."""
+    global _index
+    if _index is None and STATUTE_INDEX_PATH and os.path.exists(STATUTE_INDEX_PATH):
+        try:
+            _index = StatuteIndex(STATUTE_INDEX_PATH)
+        except Exception as e:
+            log.warning("statute index unavailable: %s", e)
+    return _index
+
+
+def main(argv: list[str] | None = None) -> None:
+    ap = argparse.ArgumentParser(prog="python -m legal.statute_index")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("build", help="собрать индекс из текстовых выгрузок")
+    b.add_argument("dump_dir")
+    b.add_argument("--db", default=STATUTE_INDEX_PATH or "statutes.db")
+    s = sub.add_parser("search", help="полнотекстовый поиск")
+    s.add_argument("query")
+    s.add_argument("--code", default="")
+    s.add_argument("--db", default=STATUTE_INDEX_PATH or "statutes.db")
+    args = ap.parse_args(argv)
+
+    if args.cmd == "build":
+        n = build_index(args.dump_dir, args.db)
+        print(f"indexed {n} articles -> {args.db}")
+    else:
+        for r in StatuteIndex(args.db).search(args.query, args.code):
+            print(f"{r['code']} ст. {r['article']} {r['title']}: {r['snippet']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -15,7 +15,7 @@
 
 from typing import Literal
 import os, re
-from nlp.openai_client import chat_answer
+from nlp.openai_client import chat_answer, chat_answer_async
 from core.logger import log
 
 Intent = Literal["LEGAL", "PARALEGAL", "OFFTOPIC"]
@@ -76,46 +76,92 @@ LLM_INTENT_SYSTEM = (
     "OFFTOPIC (приветствия, «кто ты», бытовые темы). "
     "Ответь ТОЛЬКО меткой без пояснений."
 )
+# метка — одно слово; 700 токенов полного ответа тут не нужны
+LLM_INTENT_MAX_TOKENS = 5
+
+def _compile(patterns: list[str]) -> re.Pattern:
+    """
+    Одна альтернация на категорию; группа f{i} — номер сработавшего шаблона.
+    Общий ведущий \\b выносим за скобки: движок не перебирает альтернативы внутри слов.
+    """
+    if all(p.startswith(r"\b") for p in patterns):
+        body = "|".join(f"(?P<f{i}>{p[2:]})" for i, p in enumerate(patterns))
+        return re.compile(rf"\b(?:{body})")
+    return re.compile("|".join(f"(?P<f{i}>{p})" for i, p in enumerate(patterns)))
+
+# Порядок = приоритет шагов 1–4; собираем один раз при импорте
+_MATCHERS: list[tuple[Intent, str, re.Pattern]] = [
+    ("OFFTOPIC", "meta", _compile(OFFTOPIC_PATTERNS)),
+    ("LEGAL", "heuristics strong", _compile(LEGAL_KEYWORDS)),
+    ("LEGAL", "short trigger", _compile(LEGAL_SHORT_TRIGGERS)),
+    ("PARALEGAL", "paralegal hints", _compile(PARALEGAL_HINTS)),
+]
 
-def _m(text: str, patterns: list[str]) -> bool:
-    t = (text or "").lower()
-    return any(re.search(p, t) for p in patterns)
-
-def classify_intent(text: str) -> Intent:
+def match_intent(text: str) -> tuple[Intent, str] | None:
+    """
+    Шаги 1–4 без сети: (метка, сработавший признак) или None, если эвристики не решили.
+    Текст приводится к нижнему регистру один раз; на категорию — один проход regex.
+    """
     t = (text or "").strip()
     if not t:
-        if INTENT_DEBUG: log.info("INTENT=OFFTOPIC (empty)")
-        return "OFFTOPIC"
+        return "OFFTOPIC", ""
+    low = t.lower()
+    for label, reason, rx in _MATCHERS:
+        m = rx.search(low)
+        if m:
+            if INTENT_DEBUG:
+                log.info("INTENT=%s (%s: %r)", label, reason, m.group(0))
+            return label, m.group(0)
+    return None
+
+def _classify_heuristic(t: str) -> Intent | None:
+    """Шаги 1–4: эвристики без сети. None — эвристики не решили."""
+    hit = match_intent(t)
+    return hit[0] if hit else None
+
+def _llm_label(raw: str | None) -> Intent | None:
+    lab = (raw or "").strip().upper()
+    if lab in ("LEGAL", "PARALEGAL", "OFFTOPIC"):
+        if INTENT_DEBUG:
+            log.info("INTENT=%s (LLM)", lab)
+        return lab  # type: ignore
+    return None
 
-    # 1) OFFTOPIC (мета/общение)
-    if _m(t, OFFTOPIC_PATTERNS):
-        if INTENT_DEBUG: log.info("INTENT=OFFTOPIC (meta)")
-        return "OFFTOPIC"
+def classify_intent(text: str) -> Intent:
+    t = (text or "").strip()
+    lab = _classify_heuristic(t)
+    if lab:
+        return lab
 
-    # 2) Сильные юридические признаки
-    if _m(t, LEGAL_KEYWORDS):
-        if INTENT_DEBUG: log.info("INTENT=LEGAL (heuristics strong)")
-        return "LEGAL"
+    # 5) LLM-классификатор как страховка
+    try:
+        lab = _llm_label(chat_answer(LLM_INTENT_SYSTEM, t, [], max_tokens=LLM_INTENT_MAX_TOKENS))
+        if lab:
+            return lab
+    except Exception as e:
+        if INTENT_DEBUG: log.warning("INTENT LLM failed: %s", e)
 
-    # 3) Короткие триггеры LEGAL (что будет/штраф/км/ч и т.п.)
-    if _m(t, LEGAL_SHORT_TRIGGERS):
-        if INTENT_DEBUG: log.info("INTENT=LEGAL (short trigger)")
-        return "LEGAL"
+    # 6) Дефолт — LEGAL (лучше «попробовать помочь», чем отфутболить)
+    if INTENT_DEBUG: log.info("INTENT=LEGAL (default)")
+    return "LEGAL"
 
-    # 4) Околоправовые только если нет юр.признаков
-    if _m(t, PARALEGAL_HINTS):
-        if INTENT_DEBUG: log.info("INTENT=PARALEGAL (paralegal hints)")
-        return "PARALEGAL"
+async def classify_intent_async(text: str) -> Intent:
+    """Асинхронный вариант classify_intent: LLM-страховка не блокирует event loop."""
+    t = (text or "").strip()
+    lab = _classify_heuristic(t)
+    if lab:
+        return lab
 
-    # 5) LLM-классификатор как страховка
     try:
-        lab = (chat_answer(LLM_INTENT_SYSTEM, t, context=[]) or "").strip().upper()
-        if lab in ("LEGAL", "PARALEGAL", "OFFTOPIC"):
-            if INTENT_DEBUG: log.info("INTENT=%s (LLM)", lab)
-            return lab  # type: ignore
+        lab = _llm_label(
+            await chat_answer_async(
+                LLM_INTENT_SYSTEM, t, [], max_tokens=LLM_INTENT_MAX_TOKENS, call="intent"
+            )
+        )
+        if lab:
+            return lab
     except Exception as e:
         if INTENT_DEBUG: log.warning("INTENT LLM failed: %s", e)
 
-    # 6) Дефолт — LEGAL (лучше «попробовать помочь», чем отфутболить)
     if INTENT_DEBUG: log.info("INTENT=LEGAL (default)")
-    return "LEGAL"
\ No newline at end of file
+    return "LEGAL"
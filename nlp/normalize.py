@@ -0,0 +1,39 @@
+"""
+Нормализация вопроса для ключей кэшей.
+
+normalize_question — для плана поиска: регистр, ё/е, пунктуация, пробелы, стоп-слова.
+Отрицания («не», «нет», «ни», «без»), местоимения (кто кому что сделал) и предлоги
+«с», «от», «до» (сроки: «до 3 лет») НЕ выкидываем — они меняют юридический смысл.
+
+normalize_exact — для кэша готовых ответов: только регистр, пунктуация и пробелы,
+слова не выкидываются.
+"""
+
+import re
+
+STOPWORDS_RU = frozenset(
+    """
+а и или но да же ли бы вот ну то это этот эта эти тот та те так там тут здесь
+в во на над под по к ко у о об обо из за для при про через между
+как что чтобы чем кто где когда если уже еще очень просто только
+был была было были быть есть будет будут может
+пожалуйста подскажите скажите здравствуйте
+""".split()
+)
+
+_PUNCT_RE = re.compile(r"[^\w\s.]+")
+_LOOSE_DOT_RE = re.compile(r"(?<!\d)\.|\.(?!\d)")
+
+
+def normalize_question(text: str) -> str:
+    t = (text or "").lower().replace("ё", "е")
+    t = _PUNCT_RE.sub(" ", t)
+    # точки оставляем только внутри номеров статей (20.1, 12.8)
+    t = _LOOSE_DOT_RE.sub(" ", t)
+    return " ".join(w for w in t.split() if w not in STOPWORDS_RU)
+
+
+def normalize_exact(text: str) -> str:
+    t = _PUNCT_RE.sub(" ", (text or "").lower())
+    t = _LOOSE_DOT_RE.sub(" ", t)
+    return " ".join(t.split())
@@ -1,9 +1,16 @@
-from typing import List, Dict
-from openai import OpenAI
+import time
+from typing import AsyncIterator, List, Dict
+import httpx
+from openai import OpenAI, AsyncOpenAI, DefaultAsyncHttpxClient
 from core.config import OPENAI_API_KEY, OPENAI_MODEL
+from core.http import transport_wrapper
+from core.limits import llm_limit
 from core.logger import log
+from core.metrics import llm_ttft_seconds, record_usage
 
 _client = None
+_aclient = None
+_aclient_wrap = None
 
 def client():
     global _client
@@ -11,6 +18,18 @@ def client():
         _client = OpenAI(api_key=OPENAI_API_KEY)
     return _client
 
+def aclient():
+    global _aclient, _aclient_wrap
+    wrap = transport_wrapper()
+    if _aclient is None or _aclient_wrap is not wrap:
+        # обёртка транспорта (bench/replay) действует и на запросы к OpenAI
+        http_client = None
+        if wrap:
+            http_client = DefaultAsyncHttpxClient(transport=wrap(httpx.AsyncHTTPTransport()))
+        _aclient = AsyncOpenAI(api_key=OPENAI_API_KEY, http_client=http_client)
+        _aclient_wrap = wrap
+    return _aclient
+
 def refine_query(user_question: str) -> str:
     """
     Переформулировка в краткий поисковый запрос (<=120 знаков).
@@ -56,7 +75,9 @@ def qualify_issue(user_question: str) -> str:
         log.warning("qualify_issue failed: %s", e)
         return ""
 
-def chat_answer(system_prompt: str, user_question: str, context_chunks: List[Dict]) -> str:
+def _answer_messages(
+    system_prompt: str, user_question: str, context_chunks: List[Dict]
+) -> List[Dict]:
     # context_chunks: [{"source": url, "title": str, "snippet": str}]
     ctx_lines = []
     for c in context_chunks:
@@ -69,11 +90,56 @@ def chat_answer(system_prompt: str, user_question: str, context_chunks: List[Dic
         {"role": "user", "content": f"Вопрос: {user_question}\n\nКонтекст:\n{ctx_text}"},
     ]
     log.info("Sending to OpenAI with %d context chunks", len(context_chunks))
+    return messages
+
+def chat_answer(
+    system_prompt: str, user_question: str, context_chunks: List[Dict], max_tokens: int = 700
+) -> str:
+    messages = _answer_messages(system_prompt, user_question, context_chunks)
     resp = client().chat.completions.create(
-        model=OPENAI_MODEL, messages=messages, temperature=0.2, max_tokens=700
+        model=OPENAI_MODEL, messages=messages, temperature=0.2, max_tokens=max_tokens
     )
     return (resp.choices[0].message.content or "").strip()
 
+async def chat_answer_async(
+    system_prompt: str, user_question: str, context_chunks: List[Dict], max_tokens: int = 700,
+    call: str = "answer",
+) -> str:
+    """call — метка вызова в метриках токенов (answer, intent)."""
+    messages = _answer_messages(system_prompt, user_question, context_chunks)
+    async with llm_limit:
+        resp = await aclient().chat.completions.create(
+            model=OPENAI_MODEL, messages=messages, temperature=0.2, max_tokens=max_tokens
+        )
+    record_usage(call, resp.usage)
+    return (resp.choices[0].message.content or "").strip()
+
+async def chat_answer_stream(
+    system_prompt: str, user_question: str, context_chunks: List[Dict], max_tokens: int = 700
+) -> AsyncIterator[str]:
+    """Как chat_answer_async, но отдаёт текст кусками по мере генерации."""
+    messages = _answer_messages(system_prompt, user_question, context_chunks)
+    # слот LLM держим до конца генерации
+    async with llm_limit:
+        started = time.perf_counter()
+        first = True
+        stream = await aclient().chat.completions.create(
+            model=OPENAI_MODEL,
+            messages=messages,
+            temperature=0.2,
+            max_tokens=max_tokens,
+            stream=True,
+            stream_options={"include_usage": True},
+        )
+        async for chunk in stream:
+            # последний чанк с include_usage — без choices, только usage
+            record_usage("answer", getattr(chunk, "usage", None))
+            if chunk.choices and chunk.choices[0].delta.content:
+                if first:
+                    llm_ttft_seconds.observe(time.perf_counter() - started, model=OPENAI_MODEL)
+                    first = False
+                yield chunk.choices[0].delta.content
+
 def transcribe_ogg_pcm16(file_path: str) -> str:
     try:
         with open(file_path, "rb") as f:
@@ -82,3 +148,15 @@ def transcribe_ogg_pcm16(file_path: str) -> str:
     except Exception as e:
         log.warning("whisper transcription failed: %s", e)
         return ""
+
+async def transcribe_ogg_async(data: bytes) -> str:
+    """Whisper по OGG/Opus из памяти (как пришёл из Telegram, без перекодирования)."""
+    try:
+        async with llm_limit:
+            tr = await aclient().audio.transcriptions.create(
+                model="whisper-1", file=("voice.ogg", data)
+            )
+        return (tr.text or "").strip()
+    except Exception as e:
+        log.warning("whisper transcription failed: %s", e)
+        return ""
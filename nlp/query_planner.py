@@ -1,8 +1,16 @@
 # coding: utf-8
-from typing import Dict
+import copy
+import json
+from typing import Dict, List
 from openai import OpenAI
-from core.config import OPENAI_API_KEY, OPENAI_MODEL
+from core.cache import TTLCache
+from core.config import OPENAI_API_KEY, OPENAI_MODEL, PLAN_CACHE_SIZE, PLAN_CACHE_TTL_SECONDS
+from core.limits import llm_limit
 from core.logger import log
+from core.metrics import record_usage
+from core.singleflight import SingleFlight
+from nlp.normalize import normalize_question
+from nlp.openai_client import aclient
 
 _client = None
 def client():
@@ -31,34 +39,147 @@ SYSTEM_FORCE = SYSTEM_BASE + (
     "в QUAL (например, КоАП РФ ст. 20.1 ч.1; КоАП РФ ст. 12.27 ч.2; УК РФ ст. 213 и т.д.)."
 )
 
+# Кэш планов: ключ — (force, нормализованный вопрос); провальные планы не кэшируем
+plan_cache = TTLCache("plan", maxsize=PLAN_CACHE_SIZE, ttl=PLAN_CACHE_TTL_SECONDS)
+plan_flight = SingleFlight("plan")
+
+SYSTEM_FUSED = (
+    "Сначала классифицируй запрос одной меткой INTENT: "
+    "LEGAL (строго правовой вопрос по праву РФ), "
+    "PARALEGAL (справочный/около-правовой: банки, курсы, инструкции), "
+    "OFFTOPIC (приветствия, «кто ты», бытовые темы).\n"
+    "Если INTENT=LEGAL — выполни задачу ниже. Если нет — верни только {\"INTENT\":\"...\"}.\n\n"
+) + SYSTEM_BASE.replace(
+    "{\"Q_STRICT\"", "{\"INTENT\":\"LEGAL\",\"Q_STRICT\""
+)
+
+INTENT_LABELS = ("LEGAL", "PARALEGAL", "OFFTOPIC")
+
+def _plan_key(user_question: str, force: bool) -> str:
+    return f"{int(bool(force))}|{normalize_question(user_question)}"
+
+def _cached_plan(user_question: str, force: bool) -> Dict | None:
+    data = plan_cache.get(_plan_key(user_question, force))
+    if data is None:
+        return None
+    log.info("plan cache hit (%s)", plan_cache.stats())
+    return copy.deepcopy(data)
+
+def _plan_messages(user_question: str, force: bool) -> List[Dict]:
+    system = SYSTEM_FORCE if force else SYSTEM_BASE
+    return [
+        {"role": "system", "content": system},
+        {"role": "user", "content": user_question.strip()[:600]},
+    ]
+
+def _sanitize_plan(data: Dict, user_question: str) -> Dict:
+    # Санити-значения
+    data.setdefault("Q_STRICT", user_question)
+    data.setdefault("Q_SEMI", user_question)
+    data.setdefault("Q_BROAD", user_question)
+    data.setdefault("Q_ALT", [])
+    data.setdefault("QUAL", [])
+    return data
+
+def _finish_plan(data: Dict, user_question: str, force: bool) -> Dict:
+    ok = bool(data)
+    data = _sanitize_plan(data, user_question)
+    if ok:
+        plan_cache.set(_plan_key(user_question, force), copy.deepcopy(data))
+    return data
+
 def plan_queries(user_question: str, force: bool = False) -> Dict:
     """
     Возвращает словарь:
     {Q_STRICT:str, Q_SEMI:str, Q_BROAD:str, Q_ALT:list[str], QUAL:list[str]}
     """
-    system = SYSTEM_FORCE if force else SYSTEM_BASE
-    messages = [
-        {"role": "system", "content": system},
-        {"role": "user", "content": user_question.strip()[:600]},
-    ]
+    cached = _cached_plan(user_question, force)
+    if cached is not None:
+        return cached
     try:
         resp = client().chat.completions.create(
             model=OPENAI_MODEL,
-            messages=messages,
+            messages=_plan_messages(user_question, force),
             temperature=0.1,
             max_tokens=400,
             response_format={"type": "json_object"},
         )
-        import json
         data = json.loads(resp.choices[0].message.content or "{}")
     except Exception as e:
         log.warning("plan_queries failed: %s", e)
         data = {}
 
-    # Санити-значения
-    data.setdefault("Q_STRICT", user_question)
-    data.setdefault("Q_SEMI", user_question)
-    data.setdefault("Q_BROAD", user_question)
-    data.setdefault("Q_ALT", [])
-    data.setdefault("QUAL", [])
-    return data
\ No newline at end of file
+    return _finish_plan(data, user_question, force)
+
+async def plan_queries_async(user_question: str, force: bool = False) -> Dict:
+    """
+    Асинхронный вариант plan_queries (тот же формат ответа).
+    Одинаковые вопросы, пришедшие одновременно, делят один вызов LLM.
+    """
+    cached = _cached_plan(user_question, force)
+    if cached is not None:
+        return cached
+    plan = await plan_flight.do(
+        _plan_key(user_question, force), lambda: _plan_queries_llm(user_question, force)
+    )
+    return copy.deepcopy(plan)
+
+async def _plan_queries_llm(user_question: str, force: bool) -> Dict:
+    try:
+        async with llm_limit:
+            resp = await aclient().chat.completions.create(
+                model=OPENAI_MODEL,
+                messages=_plan_messages(user_question, force),
+                temperature=0.1,
+                max_tokens=400,
+                response_format={"type": "json_object"},
+            )
+        record_usage("plan", resp.usage)
+        data = json.loads(resp.choices[0].message.content or "{}")
+    except Exception as e:
+        log.warning("plan_queries failed: %s", e)
+        data = {}
+
+    return _finish_plan(data, user_question, force)
+
+async def plan_with_intent_async(user_question: str) -> Dict:
+    """
+    Совмещённый режим: метка намерения и план поиска одним JSON-ответом.
+    Возвращает план (как plan_queries) с дополнительным ключом INTENT.
+    Для OFFTOPIC/PARALEGAL план — заглушка, поиск по нему не нужен.
+    """
+    cached = _cached_plan(user_question, False)
+    if cached is not None:
+        # план в кэше бывает только у LEGAL-вопросов
+        return {**cached, "INTENT": "LEGAL"}
+    plan = await plan_flight.do(
+        "fused|" + _plan_key(user_question, False), lambda: _plan_with_intent_llm(user_question)
+    )
+    return copy.deepcopy(plan)
+
+async def _plan_with_intent_llm(user_question: str) -> Dict:
+    try:
+        async with llm_limit:
+            resp = await aclient().chat.completions.create(
+                model=OPENAI_MODEL,
+                messages=[
+                    {"role": "system", "content": SYSTEM_FUSED},
+                    {"role": "user", "content": user_question.strip()[:600]},
+                ],
+                temperature=0.1,
+                max_tokens=420,
+                response_format={"type": "json_object"},
+            )
+        record_usage("plan_intent", resp.usage)
+        data = json.loads(resp.choices[0].message.content or "{}")
+    except Exception as e:
+        log.warning("plan_with_intent failed: %s", e)
+        data = {}
+
+    intent = str(data.pop("INTENT", "") or "").strip().upper()
+    if intent not in INTENT_LABELS:
+        # как и classify_intent: в сомнении — LEGAL
+        intent = "LEGAL"
+    if intent != "LEGAL":
+        return {**_sanitize_plan({}, user_question), "INTENT": intent}
+    return {**_finish_plan(data, user_question, False), "INTENT": "LEGAL"}
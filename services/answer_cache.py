@@ -0,0 +1,63 @@
+"""
+Кэш итоговых ответов handle_question.
+
+Ключ — исходный вопрос (normalize_exact: без учёта регистра, пунктуации и пробелов, но
+без выбрасывания слов — «он ударил меня» ≠ «я ударил его») + набор QUAL + дата в
+системном промпте (__TODAY__) + модель. QUAL известен после планирования (план сам
+берётся из кэша), поэтому запись проверяется до поиска и загрузки страниц: попадание
+обходится без сети и без LLM.
+Рядом с ответом хранится отпечаток источников (URL и текст выдержек). Если источники
+уже на руках (локальный индекс кодексов), несовпадение отпечатка — промах; ответ по
+веб-источникам до истечения TTL отдаётся без их повторной проверки.
+"""
+
+from __future__ import annotations
+
+import hashlib
+
+import core.config as cfg
+from core.cache import TTLCache
+from core.logger import log
+from nlp.normalize import normalize_exact
+
+answer_cache = TTLCache(
+    "answer",
+    maxsize=int(getattr(cfg, "ANSWER_CACHE_SIZE", 1000)),
+    ttl=int(getattr(cfg, "ANSWER_CACHE_TTL_SECONDS", 6 * 3600)),
+    path=getattr(cfg, "ANSWER_CACHE_PATH", ""),
+)
+
+
+def sources_fingerprint(pages: list[dict]) -> str:
+    h = hashlib.sha1()
+    for p in pages:
+        h.update((p.get("source") or "").encode("utf-8"))
+        h.update(b"\0")
+        h.update(hashlib.sha1((p.get("snippet") or "").encode("utf-8")).digest())
+    return h.hexdigest()
+
+
+def answer_key(question: str, qual: list[str], prompt_date: str, model: str) -> str:
+    parts = [
+        normalize_exact(question),
+        "|".join(sorted(q.strip().lower() for q in qual or [])),
+        prompt_date,
+        model,
+    ]
+    return hashlib.sha1("\n".join(parts).encode("utf-8")).hexdigest()
+
+
+def get_answer(key: str, pages: list[dict] | None = None) -> str | None:
+    """Готовый ответ или None. pages — уже известные источники: ответ по другим не отдаём."""
+    entry = answer_cache.get(key)
+    if entry is None:
+        return None
+    if pages is not None and entry["sources"] != sources_fingerprint(pages):
+        log.info("ANSWER cache stale %s: sources changed", key[:12])
+        return None
+    log.info("ANSWER cache hit %s (%s)", key[:12], answer_cache.stats())
+    return entry["reply"]
+
+
+def put_answer(key: str, reply: str, pages: list[dict]) -> None:
+    answer_cache.set(key, {"reply": reply, "sources": sources_fingerprint(pages)})
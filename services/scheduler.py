@@ -0,0 +1,170 @@
+"""
+Допуск вопросов в конвейер handle_question.
+
+  - не больше SCHED_MAX_ACTIVE вопросов одновременно на процесс;
+  - не больше SCHED_PER_USER_ACTIVE на пользователя (следующий его вопрос ждёт предыдущий);
+  - очередь с приоритетами: оплатившие (баланс в core.credits > 0: успешная оплата
+    пополняет его, ответ в приоритетной полосе списывает) идут в свою полосу раньше
+    бесплатных, внутри полосы — по порядку поступления;
+  - сброс нагрузки: когда глубина очереди ≥ SCHED_NOTIFY_DEPTH, пользователю сразу
+    отправляется «занято, вы в очереди»; бесплатные вопросы сверх SCHED_QUEUE_MAX
+    отклоняются (SchedulerBusy), платные ставятся в очередь всегда.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+from typing import Any, Awaitable, Callable
+
+import core.config as cfg
+from core.credits import get_balance
+from core.logger import log
+
+SCHED_MAX_ACTIVE = int(getattr(cfg, "SCHED_MAX_ACTIVE", 8))
+SCHED_PER_USER_ACTIVE = int(getattr(cfg, "SCHED_PER_USER_ACTIVE", 1))
+SCHED_NOTIFY_DEPTH = int(getattr(cfg, "SCHED_NOTIFY_DEPTH", 4))
+SCHED_QUEUE_MAX = int(getattr(cfg, "SCHED_QUEUE_MAX", 50))
+
+PRIORITY_PAID = 0
+PRIORITY_FREE = 1
+
+
+class SchedulerBusy(Exception):
+    """Очередь переполнена — вопрос не принят."""
+
+
+class Scheduler:
+    def __init__(
+        self,
+        max_active: int = SCHED_MAX_ACTIVE,
+        per_user: int = SCHED_PER_USER_ACTIVE,
+        notify_depth: int = SCHED_NOTIFY_DEPTH,
+        queue_max: int = SCHED_QUEUE_MAX,
+    ):
+        self.max_active = max(1, max_active)
+        self.per_user = max(1, per_user)
+        self.notify_depth = notify_depth
+        self.queue_max = queue_max
+        self.active = 0
+        self.shed = 0
+        self._heap: list[tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._users: dict[int, int] = {}
+        self._user_waiters: dict[int, list[asyncio.Future]] = {}
+
+    @property
+    def depth(self) -> int:
+        return sum(1 for _, _, f in self._heap if not f.done())
+
+    async def run(
+        self,
+        user_id: int,
+        priority: int,
+        fn: Callable[[], Awaitable[Any]],
+        on_queued: Callable[[int], Awaitable[None]] | None = None,
+    ) -> Any:
+        """
+        Выполнить fn() после допуска. on_queued(position) вызывается, если вопрос встал
+        в очередь при глубине ≥ notify_depth. SchedulerBusy — очередь переполнена.
+        """
+        if priority != PRIORITY_PAID and self.depth >= self.queue_max:
+            self.shed += 1
+            log.warning("SCHED shed: user=%s depth=%d", user_id, self.depth)
+            raise SchedulerBusy()
+        await self._acquire_user(user_id)
+        try:
+            await self._acquire_slot(user_id, priority, on_queued)
+            try:
+                return await fn()
+            finally:
+                self._release_slot()
+        finally:
+            self._release_user(user_id)
+
+    # ---- per-user ----
+    async def _acquire_user(self, user_id: int) -> None:
+        while self._users.get(user_id, 0) >= self.per_user:
+            fut = asyncio.get_running_loop().create_future()
+            self._user_waiters.setdefault(user_id, []).append(fut)
+            try:
+                await fut
+            finally:
+                waiters = self._user_waiters.get(user_id, [])
+                if fut in waiters:
+                    waiters.remove(fut)
+        self._users[user_id] = self._users.get(user_id, 0) + 1
+
+    def _release_user(self, user_id: int) -> None:
+        n = self._users.get(user_id, 0) - 1
+        if n > 0:
+            self._users[user_id] = n
+        else:
+            self._users.pop(user_id, None)
+        waiters = self._user_waiters.get(user_id)
+        while waiters:
+            fut = waiters.pop(0)
+            if not fut.done():
+                fut.set_result(None)
+                break
+        if not waiters:
+            self._user_waiters.pop(user_id, None)
+
+    # ---- global, по приоритету ----
+    async def _acquire_slot(self, user_id: int, priority: int, on_queued) -> None:
+        if self.active < self.max_active and not self.depth:
+            self.active += 1
+            return
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._heap, (priority, next(self._seq), fut))
+        position = self.depth
+        log.info(
+            "SCHED queued: user=%s priority=%d position=%d active=%d",
+            user_id,
+            priority,
+            position,
+            self.active,
+        )
+        if on_queued is not None and position >= self.notify_depth:
+            try:
+                await on_queued(position)
+            except Exception as e:
+                log.warning("SCHED on_queued failed: %s", e)
+        try:
+            await fut
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                # слот уже выдан, но задачу отменили — возвращаем
+                self._release_slot()
+            else:
+                fut.cancel()
+            raise
+
+    def _release_slot(self) -> None:
+        self.active -= 1
+        while self._heap and self.active < self.max_active:
+            _, _, fut = heapq.heappop(self._heap)
+            if not fut.done():
+                self.active += 1
+                fut.set_result(None)
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "active": self.active,
+            "queued": self.depth,
+            "users": len(self._users),
+            "shed": self.shed,
+        }
+
+
+scheduler = Scheduler()
+
+
+async def user_priority(user_id: int) -> int:
+    """Полоса пользователя: есть оплаченный баланс — приоритетная."""
+    try:
+        return PRIORITY_PAID if await get_balance(user_id) > 0 else PRIORITY_FREE
+    except Exception as e:
+        log.warning("SCHED balance lookup failed for %s: %s", user_id, e)
+        return PRIORITY_FREE
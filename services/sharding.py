@@ -0,0 +1,273 @@
+"""
+Многопроцессный режим: ingress-процесс принимает обновления (polling или webhook) и
+раскладывает их по SHARD_WORKERS процессам-воркерам по хэшу chat_id.
+
+  - каждый воркер — отдельный процесс (spawn) со своим event loop, bot/dp и всем
+    конвейером handle_question; обновления получает через свою multiprocessing.Queue;
+  - один чат всегда попадает в один воркер, а внутри воркера обновления чата
+    обрабатываются строго по очереди (разные чаты — параллельно, до
+    SHARD_WORKER_CONCURRENCY);
+  - воркер сообщает ingress о начале и конце обработки каждого обновления. Упавший
+    воркер перезапускается; обновления, которые он ещё не начал, отправляются новому
+    воркеру в прежнем порядке, теряются только те, что были в работе.
+
+Лимиты планировщика и пулов (core/limits, services/scheduler) действуют внутри
+воркера: суммарный лимит процесса умножается на число воркеров.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import importlib
+import multiprocessing
+import os
+import zlib
+from collections import OrderedDict
+from typing import Any
+
+import core.config as cfg
+from core.logger import log
+
+SHARD_WORKERS = int(getattr(cfg, "SHARD_WORKERS", 0))
+SHARD_WORKER_CONCURRENCY = int(getattr(cfg, "SHARD_WORKER_CONCURRENCY", 16))
+SUPERVISE_INTERVAL = 0.2
+POLL_TIMEOUT = 30
+
+
+def update_chat_id(update: dict[str, Any]) -> int:
+    """chat_id обновления (для callback/pre_checkout без чата — id пользователя), иначе 0."""
+    for key, payload in update.items():
+        if key == "update_id" or not isinstance(payload, dict):
+            continue
+        chat = payload.get("chat") or (payload.get("message") or {}).get("chat")
+        if chat and "id" in chat:
+            return int(chat["id"])
+        user = payload.get("from") or payload.get("user")
+        if user and "id" in user:
+            return int(user["id"])
+    return 0
+
+
+def shard_for(chat_id: int, shards: int) -> int:
+    return zlib.crc32(str(chat_id).encode()) % max(1, shards)
+
+
+# ---------------- worker ----------------
+def _load_app(app: str):
+    module = importlib.import_module(app)
+    return module.bot, module.dp
+
+
+def worker_main(index: int, app: str, inbox, outbox, concurrency: int) -> None:
+    os.environ["SHARD_INDEX"] = str(
+        index
+    )  # до импорта приложения: по нему, например, порт /metrics
+    bot, dp = _load_app(app)
+    asyncio.run(_worker_loop(index, bot, dp, inbox, outbox, concurrency))
+
+
+async def _worker_loop(index: int, bot, dp, inbox, outbox, concurrency: int) -> None:
+    loop = asyncio.get_running_loop()
+    sem = asyncio.Semaphore(max(1, concurrency))
+    chains: dict[int, asyncio.Task] = {}
+
+    async def run(update: dict[str, Any], prev: asyncio.Task | None) -> None:
+        if prev is not None:
+            await asyncio.wait({prev})
+        async with sem:
+            uid = update.get("update_id")
+            outbox.put(("start", uid))
+            try:
+                await dp.feed_raw_update(bot, update)
+            except Exception as e:
+                log.exception("shard %d: update %s failed: %s", index, uid, e)
+            outbox.put(("done", uid))
+
+    def forget(chat: int, task: asyncio.Task) -> None:
+        if chains.get(chat) is task:
+            del chains[chat]
+
+    await dp.emit_startup(bot=bot, dispatcher=dp)
+    log.info("shard %d started", index)
+    try:
+        while True:
+            update = await loop.run_in_executor(None, inbox.get)
+            if update is None:
+                break
+            chat = update_chat_id(update)
+            task = asyncio.create_task(run(update, chains.get(chat)))
+            chains[chat] = task
+            task.add_done_callback(lambda t, c=chat: forget(c, t))
+        if chains:
+            await asyncio.wait(set(chains.values()))
+    finally:
+        await dp.emit_shutdown(bot=bot, dispatcher=dp)
+        await bot.session.close()
+
+
+# ---------------- ingress side ----------------
+class _Shard:
+    def __init__(self, index: int):
+        self.index = index
+        self.proc: multiprocessing.Process | None = None
+        self.inbox = None
+        self.outbox = None
+        self.pending: OrderedDict[int, dict[str, Any]] = OrderedDict()
+        self.started: set[int] = set()
+        self.restarts = 0
+        self.lost = 0
+
+
+class ShardRouter:
+    def __init__(self, workers: int, app: str = "bot", concurrency: int = SHARD_WORKER_CONCURRENCY):
+        self.app = app
+        self.concurrency = concurrency
+        self._ctx = multiprocessing.get_context("spawn")
+        self._shards: list[_Shard] = [_Shard(i) for i in range(max(1, workers))]
+        self._supervisor: asyncio.Task | None = None
+
+    def _spawn(self, shard: _Shard) -> None:
+        shard.inbox = self._ctx.Queue()
+        # SimpleQueue пишет в pipe синхронно: «start» дойдёт, даже если воркер тут же упадёт
+        shard.outbox = self._ctx.SimpleQueue()
+        shard.proc = self._ctx.Process(
+            target=worker_main,
+            args=(shard.index, self.app, shard.inbox, shard.outbox, self.concurrency),
+            name=f"shard-{shard.index}",
+            daemon=True,
+        )
+        shard.proc.start()
+
+    async def start(self) -> None:
+        for shard in self._shards:
+            self._spawn(shard)
+        self._supervisor = asyncio.create_task(self._supervise())
+        log.info("sharded runtime: %d workers", len(self._shards))
+
+    async def route(self, update: dict[str, Any]) -> None:
+        shard = self._shards[shard_for(update_chat_id(update), len(self._shards))]
+        shard.pending[update["update_id"]] = update
+        shard.inbox.put(update)
+
+    def _drain_events(self, shard: _Shard) -> None:
+        while True:
+            try:
+                if shard.outbox.empty():
+                    return
+                kind, uid = shard.outbox.get()
+            except (OSError, EOFError, ValueError):
+                return
+            if kind == "start":
+                shard.started.add(uid)
+            else:
+                shard.started.discard(uid)
+                shard.pending.pop(uid, None)
+
+    def _restart(self, shard: _Shard) -> None:
+        self._drain_events(shard)
+        lost = [uid for uid in shard.pending if uid in shard.started]
+        resend = [u for uid, u in shard.pending.items() if uid not in shard.started]
+        shard.lost += len(lost)
+        shard.restarts += 1
+        log.error(
+            "shard %d died (exit %s): %d in-flight updates lost, %d re-queued",
+            shard.index,
+            shard.proc.exitcode,
+            len(lost),
+            len(resend),
+        )
+        shard.pending = OrderedDict((u["update_id"], u) for u in resend)
+        shard.started = set()
+        self._spawn(shard)
+        for u in resend:
+            shard.inbox.put(u)
+
+    async def _supervise(self) -> None:
+        while True:
+            for shard in self._shards:
+                self._drain_events(shard)
+                if shard.proc is not None and not shard.proc.is_alive():
+                    self._restart(shard)
+            await asyncio.sleep(SUPERVISE_INTERVAL)
+
+    def stats(self) -> list[dict[str, int]]:
+        return [
+            {
+                "shard": s.index,
+                "pending": len(s.pending),
+                "in_flight": len(s.started),
+                "restarts": s.restarts,
+                "lost": s.lost,
+            }
+            for s in self._shards
+        ]
+
+    async def stop(self, timeout: float = 20) -> None:
+        if self._supervisor is not None:
+            self._supervisor.cancel()
+        for shard in self._shards:
+            shard.inbox.put(None)
+        loop = asyncio.get_running_loop()
+        for shard in self._shards:
+            await loop.run_in_executor(None, shard.proc.join, timeout)
+            if shard.proc.is_alive():
+                shard.proc.terminate()
+            self._drain_events(shard)
+
+
+async def poll_updates(bot, allowed_updates: list[str], feed) -> None:
+    """Long polling в ingress: getUpdates -> сырые dict -> feed (маршрутизация по воркерам)."""
+    offset: int | None = None
+    backoff = 1.0
+    while True:
+        try:
+            updates = await bot.get_updates(
+                offset=offset, timeout=POLL_TIMEOUT, allowed_updates=allowed_updates
+            )
+            backoff = 1.0
+        except Exception as e:
+            log.warning("getUpdates failed: %s (retry in %.0fs)", e, backoff)
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 30)
+            continue
+        for u in updates:
+            offset = u.update_id + 1
+            await feed(u.model_dump(mode="json", by_alias=True, exclude_none=True))
+
+
+def run_sharded(
+    dp, bot, workers: int = SHARD_WORKERS, webhook: bool = False, app: str = "bot"
+) -> None:
+    """Запуск ingress + воркеров. dp ingress-процесса нужен только для списка типов обновлений."""
+    router = ShardRouter(workers, app=app)
+    if webhook:
+        from aiohttp import web
+
+        from services.webhook import WEBHOOK_HOST, WEBHOOK_PORT, WebhookIngress, register_webhook
+
+        ingress = WebhookIngress(dp, bot, feed=router.route)
+        web_app = ingress.app(lifecycle=False)
+
+        async def on_startup(_app):
+            await router.start()
+            await register_webhook(dp, bot)
+
+        async def on_cleanup(_app):
+            await router.stop()
+            await bot.session.close()
+
+        web_app.on_startup.append(on_startup)
+        web_app.on_cleanup.append(on_cleanup)
+        web.run_app(web_app, host=WEBHOOK_HOST, port=WEBHOOK_PORT, print=None)
+        return
+
+    async def polling() -> None:
+        await router.start()
+        try:
+            await bot.delete_webhook(drop_pending_updates=False)
+            await poll_updates(bot, dp.resolve_used_update_types(), router.route)
+        finally:
+            await router.stop()
+            await bot.session.close()
+
+    asyncio.run(polling())
@@ -0,0 +1,100 @@
+"""
+Потоковый ответ в Telegram: плейсхолдер + редактирование по мере генерации.
+
+Telegram ограничивает частоту правок (~1 в секунду на чат, при превышении — 429 RetryAfter),
+поэтому правим не чаще STREAM_EDIT_INTERVAL_SECONDS и пропускаем правки во время RetryAfter.
+Финальная правка — полный ответ с источниками и дисклеймером (длинный — продолжаем
+новыми сообщениями).
+"""
+
+import asyncio
+import time
+
+from aiogram.exceptions import TelegramAPIError, TelegramBadRequest, TelegramRetryAfter
+from aiogram.types import Message
+
+from core.config import STREAM_EDIT_INTERVAL_SECONDS
+from core.logger import log
+from core.metrics import histogram
+
+TG_MAX_CHARS = 4096
+FINAL_RETRY_MAX_WAIT = 5
+PLACEHOLDER = "⏳ Подбираю нормы и готовлю ответ…"
+
+# от плейсхолдера до первой правки с текстом ответа — то, что видит пользователь
+# (bot_llm_ttft_seconds — только первый токен от OpenAI)
+stream_first_text_seconds = histogram(
+    "bot_stream_first_text_seconds", "Time to first answer text visible in Telegram"
+)
+
+
+class StreamingReply:
+    def __init__(self, message: Message, interval: float = STREAM_EDIT_INTERVAL_SECONDS):
+        self.message = message
+        self.interval = interval
+        self.started_at = time.monotonic()
+        self.ttft: float | None = None  # время до первого видимого текста ответа, с
+        self._sent: Message | None = None
+        self._last_text = ""
+        self._next_edit_at = 0.0
+
+    async def start(self) -> None:
+        self._sent = await self.message.answer(PLACEHOLDER)
+        self._last_text = PLACEHOLDER
+
+    async def update(self, text: str) -> None:
+        """Промежуточный текст; лишние правки отбрасываются троттлингом."""
+        now = time.monotonic()
+        if now < self._next_edit_at:
+            return
+        text = text.strip()
+        if not text or text == self._last_text:
+            return
+        if await self._edit(
+            text[: TG_MAX_CHARS - 1] + "…" if len(text) >= TG_MAX_CHARS else text + " …"
+        ):
+            if self.ttft is None:
+                self.ttft = time.monotonic() - self.started_at
+                stream_first_text_seconds.observe(self.ttft)
+                log.info("STREAM time-to-first-text: %.2fs", self.ttft)
+
+    async def finish(self, text: str) -> None:
+        """
+        Финальный ответ: правим плейсхолдер, хвост сверх лимита — отдельными сообщениями.
+        Правка не удалась (в т. ч. сбой API/сети) — весь ответ отправляем новыми сообщениями.
+        """
+        chunks = [text[i : i + TG_MAX_CHARS] for i in range(0, len(text), TG_MAX_CHARS)] or [""]
+        if self._sent is None or not await self._edit(chunks[0], final=True):
+            await self.message.answer(chunks[0])
+        for chunk in chunks[1:]:
+            await self.message.answer(chunk)
+        log.info(
+            "STREAM done in %.2fs (ttft=%s)",
+            time.monotonic() - self.started_at,
+            f"{self.ttft:.2f}s" if self.ttft is not None else "-",
+        )
+
+    async def _edit(self, text: str, final: bool = False) -> bool:
+        if self._sent is None:
+            return False
+        try:
+            await self._sent.edit_text(text)
+        except TelegramRetryAfter as e:
+            self._next_edit_at = time.monotonic() + e.retry_after
+            if not final or e.retry_after > FINAL_RETRY_MAX_WAIT:
+                return False
+            # финальную правку не теряем: дожидаемся окна и пробуем ещё раз
+            await asyncio.sleep(e.retry_after)
+            return await self._edit(text, final=False)
+        except TelegramBadRequest as e:
+            if "not modified" in str(e):
+                return True
+            log.warning("STREAM edit failed: %s", e)
+            return False
+        except (TelegramAPIError, asyncio.TimeoutError, OSError) as e:
+            # сбой API/сети: промежуточную правку пропускаем, финал уйдёт новым сообщением
+            log.warning("STREAM edit failed: %r", e)
+            return False
+        self._last_text = text
+        self._next_edit_at = time.monotonic() + self.interval
+        return True
@@ -1,35 +1,160 @@
-import os, tempfile, subprocess
-from core.config import USE_VOSK
-from pydub import AudioSegment
+"""
+Локальное распознавание голоса (Vosk).
 
-def ogg_to_wav(ogg_path: str) -> str:
-    # Convert OGG/OPUS -> WAV PCM16 using ffmpeg via pydub
-    audio = AudioSegment.from_file(ogg_path, format="ogg")
-    wav_path = tempfile.mktemp(suffix=".wav")
-    audio.export(wav_path, format="wav")
-    return wav_path
+Голос не касается диска: OGG/Opus из памяти декодируется пайпом ffmpeg в PCM16 16 кГц
+моно (наличие ffmpeg проверяется один раз, на старте бота). Модель грузится один раз на
+процесс (при старте, если VOSK_PRELOAD, иначе на первом сообщении). Распознаватели
+KaldiRecognizer переиспользуются через пул (по одному на поток-воркер, не больше
+VOSK_POOL_SIZE). PCM подаётся фиксированными кусками — с промежуточными результатами.
+"""
+
+import asyncio
+import json
+import queue
+import subprocess
+import threading
+from contextlib import contextmanager
+from typing import Callable, Iterator, List, Optional
+
+from core.config import USE_VOSK, VOSK_MODEL_PATH, VOSK_POOL_SIZE
+from core.logger import log
+from core.workers import run_audio
+
+SAMPLE_RATE = 16000
+CHUNK_BYTES = 8000  # 0.25 с PCM16 моно 16 кГц
+# OGG/Opus со stdin -> сырой PCM16 16 кГц моно в stdout
+FFMPEG_DECODE = [
+    "ffmpeg", "-nostdin", "-loglevel", "error", "-i", "pipe:0",
+    "-f", "s16le", "-acodec", "pcm_s16le", "-ac", "1", "-ar", str(SAMPLE_RATE), "pipe:1",
+]
+
+_model = None
+_model_lock = threading.Lock()
+_ffmpeg_ok: Optional[bool] = None
+
+
+def check_ffmpeg() -> bool:
+    """Есть ли ffmpeg в PATH. Проверяем один раз за процесс (на старте бота)."""
+    global _ffmpeg_ok
+    if _ffmpeg_ok is None:
+        try:
+            subprocess.run(["ffmpeg", "-version"], check=True, capture_output=True)
+            _ffmpeg_ok = True
+        except Exception:
+            _ffmpeg_ok = False
+    return _ffmpeg_ok
 
 def ensure_ffmpeg() -> None:
-    try:
-        subprocess.run(["ffmpeg", "-version"], check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    except Exception:
+    if not check_ffmpeg():
         raise RuntimeError("FFmpeg is required. Install it and ensure it's in PATH.")
 
-def transcribe(ogg_path: str) -> str:
+def decode_ogg(ogg: bytes) -> bytes:
     ensure_ffmpeg()
-    wav_path = ogg_to_wav(ogg_path)
+    p = subprocess.run(FFMPEG_DECODE, input=ogg, capture_output=True)
+    if p.returncode != 0:
+        raise RuntimeError(f"ffmpeg decode failed: {p.stderr.decode(errors='replace').strip()}")
+    return p.stdout
+
+async def decode_ogg_async(ogg: bytes) -> bytes:
+    """OGG/Opus в памяти -> PCM16 16 кГц моно через пайп ffmpeg, без временных файлов."""
+    ensure_ffmpeg()
+    proc = await asyncio.create_subprocess_exec(
+        *FFMPEG_DECODE,
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    pcm, err = await proc.communicate(ogg)
+    if proc.returncode != 0:
+        raise RuntimeError(f"ffmpeg decode failed: {err.decode(errors='replace').strip()}")
+    return pcm
+
+def get_model():
+    """Модель Vosk процесса (VOSK_MODEL_PATH или стандартная русская)."""
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                from vosk import Model  # lazy import
+                _model = Model(VOSK_MODEL_PATH) if VOSK_MODEL_PATH else Model(lang="ru")
+                log.info("Vosk model loaded (%s)", VOSK_MODEL_PATH or "lang=ru")
+    return _model
+
+def preload() -> None:
+    """Загрузить модель заранее (на старте бота), чтобы первое сообщение не ждало."""
+    if USE_VOSK:
+        get_model()
+
+
+class RecognizerPool:
+    """Пул KaldiRecognizer: создаём лениво до size штук, дальше ждём освободившийся."""
+
+    def __init__(self, size: int, factory: Callable):
+        self.size = max(1, size)
+        self._factory = factory
+        self._idle: queue.Queue = queue.Queue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def acquire(self) -> Iterator:
+        try:
+            rec = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                create = self._created < self.size
+                if create:
+                    self._created += 1
+            rec = self._create() if create else self._idle.get()
+        try:
+            yield rec
+        finally:
+            # сбрасываем состояние, чтобы следующий запрос начинал с чистого листа
+            rec.Reset()
+            self._idle.put(rec)
+
+    def _create(self):
+        try:
+            return self._factory()
+        except Exception:
+            with self._lock:
+                self._created -= 1
+            raise
+
+
+def _new_recognizer():
+    from vosk import KaldiRecognizer  # lazy import
+    rec = KaldiRecognizer(get_model(), SAMPLE_RATE)
+    rec.SetWords(True)
+    return rec
+
+recognizers = RecognizerPool(VOSK_POOL_SIZE, _new_recognizer)
+
+
+def recognize_pcm(pcm: bytes, on_partial: Optional[Callable[[str], None]] = None) -> str:
+    """PCM16 16 кГц моно -> текст. on_partial получает промежуточную гипотезу."""
+    texts: List[str] = []
+    with recognizers.acquire() as rec:
+        for i in range(0, len(pcm), CHUNK_BYTES):
+            if rec.AcceptWaveform(pcm[i:i + CHUNK_BYTES]):
+                texts.append(json.loads(rec.Result()).get("text", ""))
+            elif on_partial is not None:
+                partial = json.loads(rec.PartialResult()).get("partial", "")
+                if partial:
+                    on_partial(" ".join([*texts, partial]).strip())
+        texts.append(json.loads(rec.FinalResult()).get("text", ""))
+    return " ".join(t for t in texts if t).strip()
+
+def transcribe(ogg: bytes, on_partial: Optional[Callable[[str], None]] = None) -> str:
     if USE_VOSK:
-        from vosk import Model, KaldiRecognizer  # lazy import
-        import json as _json
-        model = Model(lang="ru")
-        rec = KaldiRecognizer(model, 16000)
-        rec.SetWords(True)
-        # Downsample to 16k mono if needed is handled by pydub export default
-        with open(wav_path, "rb") as f:
-            data = f.read()
-        rec.AcceptWaveform(data)
-        result = _json.loads(rec.Result())
-        return result.get("text", "").strip()
+        return recognize_pcm(decode_ogg(ogg), on_partial)
     else:
         # The higher-level orchestrator (bot.py) will call OpenAI Whisper via nlp.openai_client
         return "__USE_OPENAI_WHISPER__"
+
+async def transcribe_async(ogg: bytes, on_partial: Optional[Callable[[str], None]] = None) -> str:
+    if USE_VOSK:
+        pcm = await decode_ogg_async(ogg)
+        return await run_audio(recognize_pcm, pcm, on_partial)
+    else:
+        return "__USE_OPENAI_WHISPER__"
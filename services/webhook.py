@@ -0,0 +1,151 @@
+"""
+Приём обновлений Telegram через webhook (альтернатива long polling).
+
+aiohttp-сервер на WEBHOOK_PATH:
+  - проверяет заголовок X-Telegram-Bot-Api-Secret-Token (WEBHOOK_SECRET);
+  - сразу отвечает 200, а обновление обрабатывает фоновой задачей через
+    dp.feed_raw_update — Telegram не ждёт ответа LLM;
+  - одновременно обрабатывается не больше WEBHOOK_CONCURRENCY обновлений; если
+    в работе и в ожидании уже WEBHOOK_MAX_PENDING, отвечаем 503 — Telegram повторит
+    доставку позже.
+Старт/остановка диспетчера (dp.startup / dp.shutdown) — через setup_application aiogram.
+Вместо dp.feed_raw_update можно передать свой feed (services/sharding раздаёт
+обновления по процессам-воркерам).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hmac
+from typing import Any, Awaitable, Callable
+
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import setup_application
+from aiohttp import web
+
+import core.config as cfg
+from core.logger import log
+
+WEBHOOK_URL = getattr(cfg, "WEBHOOK_URL", "")
+WEBHOOK_PATH = getattr(cfg, "WEBHOOK_PATH", "/telegram/webhook")
+WEBHOOK_SECRET = getattr(cfg, "WEBHOOK_SECRET", "")
+WEBHOOK_HOST = getattr(cfg, "WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(getattr(cfg, "WEBHOOK_PORT", 8080))
+WEBHOOK_CONCURRENCY = int(getattr(cfg, "WEBHOOK_CONCURRENCY", 32))
+WEBHOOK_MAX_PENDING = int(getattr(cfg, "WEBHOOK_MAX_PENDING", 500))
+WEBHOOK_DRAIN_SECONDS = float(getattr(cfg, "WEBHOOK_DRAIN_SECONDS", 20))
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class WebhookIngress:
+    def __init__(
+        self,
+        dp: Dispatcher,
+        bot: Bot,
+        secret: str = WEBHOOK_SECRET,
+        concurrency: int = WEBHOOK_CONCURRENCY,
+        max_pending: int = WEBHOOK_MAX_PENDING,
+        feed: Callable[[dict[str, Any]], Awaitable[Any]] | None = None,
+    ):
+        self.dp = dp
+        self.bot = bot
+        self.feed = feed or (lambda update: dp.feed_raw_update(bot, update))
+        self.secret = secret
+        self.concurrency = max(1, concurrency)
+        self.max_pending = max(self.concurrency, max_pending)
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+        self._tasks: set[asyncio.Task] = set()
+        self._sem: asyncio.Semaphore | None = None
+
+    async def handle(self, request: web.Request) -> web.Response:
+        if self.secret and not hmac.compare_digest(
+            request.headers.get(SECRET_HEADER, ""), self.secret
+        ):
+            log.warning("WEBHOOK: bad secret token from %s", request.remote)
+            return web.Response(status=401)
+        try:
+            update: dict[str, Any] = await request.json()
+        except Exception:
+            return web.Response(status=400)
+        if len(self._tasks) >= self.max_pending:
+            self.rejected += 1
+            log.warning("WEBHOOK: %d updates pending, asking Telegram to retry", len(self._tasks))
+            return web.Response(status=503)
+        task = asyncio.create_task(self._process(update))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return web.Response(status=200)
+
+    async def _process(self, update: dict[str, Any]) -> None:
+        if self._sem is None:
+            self._sem = asyncio.Semaphore(self.concurrency)
+        async with self._sem:
+            try:
+                await self.feed(update)
+                self.processed += 1
+            except Exception as e:
+                self.failed += 1
+                log.exception("WEBHOOK: update %s failed: %s", update.get("update_id"), e)
+
+    async def drain(self, timeout: float = WEBHOOK_DRAIN_SECONDS) -> None:
+        """Дождаться фоновых обновлений (при остановке), не успевшие — отменить."""
+        if not self._tasks:
+            return
+        done, pending = await asyncio.wait(set(self._tasks), timeout=timeout)
+        for t in pending:
+            t.cancel()
+        if pending:
+            log.warning("WEBHOOK: %d updates cancelled on shutdown", len(pending))
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "pending": len(self._tasks),
+            "processed": self.processed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+        }
+
+    def app(self, path: str = WEBHOOK_PATH, lifecycle: bool = True) -> web.Application:
+        app = web.Application()
+        app.router.add_post(path, self.handle)
+
+        async def on_shutdown(_app):
+            await self.drain()
+
+        # drain раньше dp.shutdown, чтобы обработчики доработали с живыми клиентами
+        app.on_shutdown.append(on_shutdown)
+        if lifecycle:
+            setup_application(app, self.dp, bot=self.bot)
+        return app
+
+
+async def register_webhook(dp: Dispatcher, bot: Bot) -> None:
+    if WEBHOOK_URL:
+        await bot.set_webhook(
+            WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+            secret_token=WEBHOOK_SECRET or None,
+            allowed_updates=dp.resolve_used_update_types(),
+            max_connections=min(100, WEBHOOK_CONCURRENCY),
+        )
+        log.info("WEBHOOK registered: %s%s", WEBHOOK_URL.rstrip("/"), WEBHOOK_PATH)
+    else:
+        log.warning("WEBHOOK_URL not set: expecting the webhook to be registered externally")
+
+
+def run_webhook(dp: Dispatcher, bot: Bot) -> None:
+    """Запуск бота в режиме webhook (регистрирует WEBHOOK_URL + WEBHOOK_PATH в Telegram)."""
+    ingress = WebhookIngress(dp, bot)
+    app = ingress.app()
+
+    async def register(_app):
+        await register_webhook(dp, bot)
+
+    async def close_session(_app):
+        await bot.session.close()
+
+    app.on_startup.append(register)
+    app.on_cleanup.append(close_session)
+    web.run_app(app, host=WEBHOOK_HOST, port=WEBHOOK_PORT, print=None)
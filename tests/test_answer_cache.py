@@ -0,0 +1,91 @@
+import asyncio
+
+import core.config as cfg
+from services import answer_cache
+from services.answer_cache import answer_key, get_answer, put_answer
+
+PAGES = [{"source": "https://www.consultant.ru/a", "title": "t", "snippet": "Статья 20.1 ..."}]
+QUAL = ["КоАП РФ;20.1;1;хулиганство"]
+
+
+def test_answer_key_stable_for_same_inputs():
+    a = answer_key("Что грозит за мелкое хулиганство?", QUAL, "01.01.2025", "m")
+    b = answer_key("что грозит за мелкое  хулиганство", list(QUAL), "01.01.2025", "m")
+    assert a == b
+
+
+def test_answer_key_changes_with_date_model_and_qual():
+    base = answer_key("вопрос про штраф", QUAL, "01.01.2025", "m")
+    assert base != answer_key("вопрос про штраф", QUAL, "02.01.2025", "m")
+    assert base != answer_key("вопрос про штраф", QUAL, "01.01.2025", "m2")
+    assert base != answer_key("вопрос про штраф", ["УК РФ;158;1;кража"], "01.01.2025", "m")
+
+
+def test_answer_key_keeps_pronouns():
+    assert answer_key("Он ударил меня", QUAL, "01.01.2025", "m") != answer_key(
+        "Я ударил его", QUAL, "01.01.2025", "m"
+    )
+    assert answer_key("Штраф до 5000?", QUAL, "01.01.2025", "m") != answer_key(
+        "Штраф 5000?", QUAL, "01.01.2025", "m"
+    )
+
+
+def test_known_sources_must_match():
+    answer_cache.answer_cache.clear()
+    key = answer_key("вопрос про штраф", QUAL, "01.01.2025", "m")
+    put_answer(key, "ответ", PAGES)
+    assert get_answer(key) == "ответ"
+    assert get_answer(key, [dict(PAGES[0])]) == "ответ"
+    assert get_answer(key, [{**PAGES[0], "snippet": "Статья 20.1 (новая редакция)"}]) is None
+
+
+def test_handle_question_served_from_cache(monkeypatch):
+    monkeypatch.setattr(cfg, "TELEGRAM_BOT_TOKEN", "123456:AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA")
+    import bot
+
+    calls = {"search": 0, "llm": 0}
+
+    async def intent_and_plan(q_raw, q):
+        return "LEGAL", {"Q_STRICT": "хулиганство коап", "QUAL": QUAL}
+
+    async def search_and_fetch(queries, qual):
+        calls["search"] += 1
+        return [{**p, "source": f"{p['source']}{i}"} for i, p in enumerate(PAGES * 3)]
+
+    async def chat_answer(prompt, q, pages):
+        calls["llm"] += 1
+        return f"Ответ {calls['llm']} по ст. 20.1 КоАП РФ"
+
+    monkeypatch.setattr(bot, "_intent_and_plan", intent_and_plan)
+    monkeypatch.setattr(bot, "_search_and_fetch", search_and_fetch)
+    monkeypatch.setattr(bot, "chat_answer_async", chat_answer)
+    monkeypatch.setattr(bot, "statute_index", lambda: None)
+    monkeypatch.setattr(bot, "OPENAI_MODEL", "m")
+    today = {"date": "01.01.2025"}
+    monkeypatch.setattr(bot, "system_prompt", lambda: (today["date"], f"Дата: {today['date']}"))
+    answer_cache.answer_cache.clear()
+    cached_before = bot.answers_total.value(kind="cached")
+    legal_before = bot.answers_total.value(kind="legal")
+
+    def ask() -> str:
+        return asyncio.run(bot.handle_question("Что грозит за мелкое хулиганство?"))
+
+    first = ask()
+    outcome = {}
+    assert (
+        asyncio.run(bot.handle_question("Что грозит за мелкое хулиганство?", outcome=outcome))
+        == first
+    )
+    assert outcome == {"intent": "LEGAL", "billable": True}
+    # повтор — ни поиска, ни LLM; попадание посчитано один раз и только как cached
+    assert calls == {"search": 1, "llm": 1}
+    assert bot.answers_total.value(kind="cached") == cached_before + 1
+    assert bot.answers_total.value(kind="legal") == legal_before + 1
+
+    monkeypatch.setattr(bot, "OPENAI_MODEL", "m2")
+    assert ask() != first
+    assert calls == {"search": 2, "llm": 2}
+
+    today["date"] = "02.01.2025"
+    ask()
+    assert calls == {"search": 3, "llm": 3}
@@ -0,0 +1,34 @@
+import time
+
+from core.cache import TTLCache
+from legal.law_search import _search_key, _with_sites
+
+
+def test_lru_and_ttl():
+    c = TTLCache("t", maxsize=2, ttl=60)
+    c.set("a", 1)
+    c.set("b", 2)
+    assert c.get("a") == 1
+    c.set("c", 3)  # вытесняет b (давно не читали)
+    assert c.get("b") is None and c.get("c") == 3
+    assert c.stats() == {"hits": 2, "misses": 1, "size": 2}
+
+    c.ttl = 0.01
+    c.set("d", 4)
+    time.sleep(0.02)
+    assert c.get("d") is None
+
+
+def test_persistence(tmp_path):
+    path = str(tmp_path / "kv.db")
+    TTLCache("t", maxsize=10, ttl=60, path=path).set("k", [{"url": "u"}])
+    assert TTLCache("t", maxsize=10, ttl=60, path=path).get("k") == [{"url": "u"}]
+    assert TTLCache("other", maxsize=10, ttl=60, path=path).get("k") is None
+
+
+def test_search_key_normalization():
+    a = _search_key("ddg", _with_sites("Штраф  за пьяную езду, КоАП ст. 12.8!"))
+    b = _search_key("ddg", _with_sites("штраф за пьяную езду КоАП ст. 12.8"))
+    assert a == b
+    assert a != _search_key("ddg", "штраф за пьяную езду КоАП ст. 12.8")
+    assert a != _search_key("google", _with_sites("штраф за пьяную езду КоАП ст. 12.8"))
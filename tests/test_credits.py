@@ -0,0 +1,28 @@
+import asyncio
+
+from core.credits import CreditsStore
+
+
+def test_concurrent_consume_never_overdraws(tmp_path):
+    async def run():
+        store = CreditsStore(str(tmp_path / "c.db"))
+        await store.add(1, 10)
+        results = await asyncio.gather(*(store.consume(1) for _ in range(25)))
+        balance = await store.get_balance(1)
+        await store.close()
+        return results, balance
+
+    results, balance = asyncio.run(run())
+    assert results.count(True) == 10
+    assert balance == 0
+
+
+def test_concurrent_topups_are_batched_without_lost_updates(tmp_path):
+    async def run():
+        store = CreditsStore(str(tmp_path / "c.db"))
+        await asyncio.gather(*(store.add(u % 7, 1) for u in range(700)))
+        balances = [await store.get_balance(u) for u in range(7)]
+        await store.close()
+        return balances
+
+    assert asyncio.run(run()) == [100] * 7
@@ -0,0 +1,131 @@
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from core import http
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        body = b"ok"
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def test_async_client_reuses_connection():
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    url = f"http://localhost:{srv.server_address[1]}/"
+
+    async def run():
+        c = http.get_async_client()
+        for _ in range(5):
+            r = await c.get(url)
+            assert r.text == "ok"
+        assert http.get_async_client() is c
+        stats = http.pool_stats()
+        await http.aclose_clients()
+        return stats
+
+    try:
+        stats = asyncio.run(run())
+    finally:
+        srv.shutdown()
+    assert stats["async"]["connects_total"] == 1
+    assert stats["async"]["connections"] == 1
+    assert stats["dns"]["size"] >= 1
+
+
+def test_async_client_closed_with_its_loop():
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    url = f"http://localhost:{srv.server_address[1]}/"
+
+    async def run():
+        c = http.get_async_client()
+        assert (await c.get(url)).text == "ok"
+        return c
+
+    try:
+        first = asyncio.run(run())
+        # keep-alive соединение закрыто до закрытия loop, а не брошено
+        assert first.is_closed
+        second = asyncio.run(run())
+    finally:
+        srv.shutdown()
+        srv.server_close()
+    assert second is not first and second.is_closed
+    assert http.pool_stats()["async"] == {}
+
+
+def _clear_proxy_env(monkeypatch):
+    for name in ("http_proxy", "https_proxy", "all_proxy", "no_proxy"):
+        monkeypatch.delenv(name, raising=False)
+        monkeypatch.delenv(name.upper(), raising=False)
+
+
+def test_env_proxies(monkeypatch):
+    _clear_proxy_env(monkeypatch)
+    assert http.env_proxies() == {}
+    monkeypatch.setenv("HTTPS_PROXY", "proxy.local:3128")
+    monkeypatch.setenv("NO_PROXY", "localhost,.internal")
+    assert http.env_proxies() == {
+        "https://": "http://proxy.local:3128",
+        "all://*localhost": None,
+        "all://*internal": None,
+    }
+
+
+def test_clients_honour_env_proxy(monkeypatch):
+    _clear_proxy_env(monkeypatch)
+    seen = []
+
+    class Proxy(_Handler):
+        def do_GET(self):
+            seen.append(self.path)  # прокси получает абсолютный URL
+            super().do_GET()
+
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), Proxy)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    monkeypatch.setenv("HTTP_PROXY", f"http://127.0.0.1:{srv.server_address[1]}")
+
+    async def run():
+        return (await http.get_async_client().get("http://upstream.invalid/a")).text
+
+    try:
+        assert asyncio.run(run()) == "ok"
+        http.get_client().close()  # пересоздать с прокси из окружения
+        assert http.get_client().get("http://upstream.invalid/b").text == "ok"
+        http.get_client().close()
+    finally:
+        srv.shutdown()
+        srv.server_close()
+    assert seen == ["http://upstream.invalid/a", "http://upstream.invalid/b"]
+
+
+def test_connect_falls_back_to_next_address():
+    dns = http.DNSCache(60)
+    dns._put(
+        "svc.example", 80, [(0, 0, 0, "", ("2001:db8::1", 80)), (0, 0, 0, "", ("127.0.0.1", 80))]
+    )
+    tried = []
+
+    class Inner:
+        async def connect_tcp(self, host, port, **kw):
+            tried.append(host)
+            if host == "2001:db8::1":
+                raise OSError("network unreachable")
+            return "stream"
+
+    backend = http._AsyncBackend(dns)
+    backend._inner = Inner()
+    assert asyncio.run(backend.connect_tcp("svc.example", 80)) == "stream"
+    assert tried == ["2001:db8::1", "127.0.0.1"]
+    assert dns.resolve("svc.example", 80) == ["2001:db8::1", "127.0.0.1"]
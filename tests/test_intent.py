@@ -0,0 +1,47 @@
+import os
+import re
+
+from nlp import intent
+from nlp.intent import LEGAL_KEYWORDS, LEGAL_SHORT_TRIGGERS, OFFTOPIC_PATTERNS, PARALEGAL_HINTS
+
+CORPUS = os.path.join(os.path.dirname(__file__), "data", "intent_samples.txt")
+
+
+def load_samples() -> list[str]:
+    with open(CORPUS, encoding="utf-8") as f:
+        return [ln.strip() for ln in f if ln.strip() and not ln.startswith("#")]
+
+
+def reference_heuristic(text: str):
+    """Прежняя реализация шагов 1–4: отдельный re.search на каждый шаблон."""
+
+    def m(patterns):
+        t = (text or "").lower()
+        return any(re.search(p, t) for p in patterns)
+
+    t = (text or "").strip()
+    if not t:
+        return "OFFTOPIC"
+    if m(OFFTOPIC_PATTERNS):
+        return "OFFTOPIC"
+    if m(LEGAL_KEYWORDS):
+        return "LEGAL"
+    if m(LEGAL_SHORT_TRIGGERS):
+        return "LEGAL"
+    if m(PARALEGAL_HINTS):
+        return "PARALEGAL"
+    return None
+
+
+def test_compiled_matcher_equivalent_to_reference():
+    samples = load_samples() + ["", "   "]
+    assert len(samples) > 50
+    for s in samples:
+        hit = intent.match_intent(s)
+        assert (hit[0] if hit else None) == reference_heuristic(s), s
+
+
+def test_matched_feature():
+    assert intent.match_intent("Штраф за превышение скорости на 40 км/ч") == ("LEGAL", "штраф")
+    assert intent.match_intent("Ехал 95 км/ч в городе") == ("LEGAL", "95 км/ч")
+    assert intent.match_intent("Посоветуй фильм") is None
@@ -0,0 +1,134 @@
+from legal import law_fetcher
+from legal.law_fetcher import _StreamExtractor
+
+HTML = (
+    "<html><head><title>КоАП РФ</title><script>var s = '</p>';</script></head><body>"
+    "<p>Статья 20.1. Мелкое хулиганство</p><style>p{}</style><p>1. Мелкое хулиганство, то есть</p>"
+    "</body></html>"
+).encode()
+
+
+def test_stream_extractor_small_chunks():
+    ex = _StreamExtractor("https://consultant.ru/a", "text/html; charset=utf-8", "utf-8")
+    for i in range(0, len(HTML), 5):
+        ex.feed(HTML[i : i + 5])
+    page = ex.page()
+    assert page["title"] == "КоАП РФ"
+    assert page["text"] == "КоАП РФ Статья 20.1. Мелкое хулиганство 1. Мелкое хулиганство, то есть"
+
+
+def test_stream_extractor_byte_cap(monkeypatch):
+    monkeypatch.setattr(law_fetcher, "FETCH_MAX_BYTES", 100)
+    ex = _StreamExtractor("https://consultant.ru/a", "text/html", None)
+    assert ex.feed(HTML) is True
+    assert ex.received == 100 and ex.truncated
+    assert ex.page()["title"] == "КоАП РФ"
+
+
+def test_stream_extractor_rejects_binary():
+    try:
+        _StreamExtractor("https://consultant.ru/a.pdf", "application/pdf", None)
+    except ValueError:
+        return
+    assert False, "expected ValueError"
+
+
+def test_partial_page_cached_without_validators(tmp_path, monkeypatch):
+    from legal.page_cache import PageCache
+
+    cache = PageCache(str(tmp_path / "pages.db"))
+    monkeypatch.setattr(law_fetcher, "page_cache", lambda: cache)
+    monkeypatch.setattr(law_fetcher, "FETCH_MAX_BYTES", 100)
+    url, targets = "https://consultant.ru/a", [("КоАП", "20.1", "1")]
+    ex = _StreamExtractor(url, "text/html", None, targets)
+    ex.feed(HTML)
+    r = law_fetcher.httpx.Response(
+        200, headers={"ETag": '"v1"', "Last-Modified": "Mon, 01 Jan 2024"}
+    )
+    law_fetcher._cache_store(url, ex.page(), r, ex)
+
+    hit = cache.get(url)
+    assert hit.validators() == {}
+    assert law_fetcher._cache_usable(hit, targets)
+    assert not law_fetcher._cache_usable(hit, [("КоАП", "12.27", "")])
+    assert "partial" not in law_fetcher._from_cache(url, hit, targets)
+
+    full = _StreamExtractor(url, "text/html", None)
+    monkeypatch.setattr(law_fetcher, "FETCH_MAX_BYTES", 10_000)
+    full.feed(HTML)
+    law_fetcher._cache_store(url, full.page(), r, full)
+    hit = cache.get(url)
+    assert hit.etag == '"v1"' and law_fetcher._cache_usable(hit, [("КоАП", "12.27", "")])
+
+
+def test_target_check_throttled(monkeypatch):
+    calls = []
+    monkeypatch.setattr(
+        law_fetcher, "extract_passage", lambda text, targets: calls.append(len(text))
+    )
+    ex = _StreamExtractor("https://consultant.ru/a", "text/html", "utf-8", [("КоАП", "20.1", "")])
+    ex.feed(b"<html><body>")
+    for _ in range(400):
+        ex.feed(b"<p>" + "слово ".encode() * 10 + b"</p>")
+    # ~24000 символов текста: проверка раз в TARGET_CHECK_CHARS, а не на каждом куске
+    assert 0 < len(calls) <= 24000 // law_fetcher.TARGET_CHECK_CHARS + 1
+
+
+def test_fetch_async_feeds_in_batches(monkeypatch):
+    import asyncio
+
+    class Body(law_fetcher.httpx.AsyncByteStream):
+        async def __aiter__(self):
+            yield b"<html><head><title>t</title></head><body>"
+            for _ in range(3000):
+                yield b"<p>abc</p>"
+            yield b"</body></html>"
+
+    def handler(request):
+        return law_fetcher.httpx.Response(200, headers={"content-type": "text/html"}, stream=Body())
+
+    client = law_fetcher.httpx.AsyncClient(transport=law_fetcher.httpx.MockTransport(handler))
+    monkeypatch.setattr(law_fetcher, "get_async_client", lambda: client)
+    monkeypatch.setattr(law_fetcher, "page_cache", lambda: None)
+    fed = []
+    real_feed = _StreamExtractor.feed
+    monkeypatch.setattr(
+        _StreamExtractor, "feed", lambda self, chunk: fed.append(chunk) or real_feed(self, chunk)
+    )
+
+    page = asyncio.run(law_fetcher.fetch_page_async("https://consultant.ru/b"))
+    assert page["title"] == "t" and page["text"].count("abc") == 3000
+    assert len(fed) == 1
+
+
+def test_fetch_pages_caps_and_deadline(monkeypatch):
+    import asyncio
+
+    active = {"all": 0}
+    peak = {"all": 0}
+
+    async def handler(request):
+        host = request.url.host
+        active["all"] += 1
+        active[host] = active.get(host, 0) + 1
+        peak["all"] = max(peak["all"], active["all"])
+        peak[host] = max(peak.get(host, 0), active[host])
+        try:
+            await asyncio.sleep(5 if host == "slow.example" else 0.02)
+        finally:
+            active["all"] -= 1
+            active[host] -= 1
+        body = f"<html><head><title>{request.url.path}</title></head><body>x</body></html>"
+        return law_fetcher.httpx.Response(200, headers={"content-type": "text/html"}, text=body)
+
+    client = law_fetcher.httpx.AsyncClient(transport=law_fetcher.httpx.MockTransport(handler))
+    monkeypatch.setattr(law_fetcher, "get_async_client", lambda: client)
+    monkeypatch.setattr(law_fetcher, "page_cache", lambda: None)
+    urls = [f"https://{h}.example/{i}" for h in ("a", "b", "c") for i in range(4)]
+    urls.append("https://slow.example/late")
+
+    pages = asyncio.run(law_fetcher.fetch_pages(urls, concurrency=4, per_host=2, deadline=0.5))
+    assert [p["title"] for p in pages] == [u.split(".example")[1] for u in urls[:-1]]
+    assert peak["all"] <= 4 and max(peak[h] for h in ("a.example", "b.example", "c.example")) <= 2
+    assert peak["all"] >= 3  # хосты действительно качаются параллельно
+    assert active["all"] == 0  # не успевшая к дедлайну страница отменена
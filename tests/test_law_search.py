@@ -0,0 +1,87 @@
+import asyncio
+import time
+
+import legal.law_search as ls
+from legal.provider_health import ProviderHealthRegistry
+
+
+def _setup(monkeypatch, providers, max_results):
+    monkeypatch.setattr(ls, "provider_health", ProviderHealthRegistry(adaptive=False))
+    monkeypatch.setattr(ls, "_providers", lambda: providers)
+    monkeypatch.setattr(ls, "SEARCH_FANOUT", True)
+    monkeypatch.setattr(ls, "SEARCH_FANOUT_CONCURRENCY", 4)
+    monkeypatch.setattr(ls, "SEARCH_HEDGE_DELAY_SECONDS", 2.0)
+    monkeypatch.setattr(ls, "SEARCH_MAX_RESULTS", max_results)
+    ls.search_cache.clear()
+
+
+def test_fanout_overlaps_phases_and_cancels_stragglers(monkeypatch):
+    state = {"active": 0, "peak": 0, "cancelled": 0, "started": []}
+
+    def provider(name, delay):
+        async def fn(q):
+            state["started"].append(f"{name}:{'strict' if 'site:' in q else 'broad'}")
+            state["active"] += 1
+            state["peak"] = max(state["peak"], state["active"])
+            try:
+                await asyncio.sleep(delay)
+            except asyncio.CancelledError:
+                state["cancelled"] += 1
+                raise
+            finally:
+                state["active"] -= 1
+            return [
+                {
+                    "title": name,
+                    "url": f"https://{name}.example/{'s' if 'site:' in q else 'b'}",
+                    "snippet": "",
+                }
+            ]
+
+        return fn
+
+    _setup(
+        monkeypatch,
+        [
+            ("dead", "Dead", provider("dead", 30)),
+            ("a", "A", provider("a", 0.05)),
+            ("b", "B", provider("b", 0.1)),
+        ],
+        max_results=2,
+    )
+
+    started = time.monotonic()
+    res = asyncio.run(ls.multi_query_search_async(["fanout-q"]))
+    elapsed = time.monotonic() - started
+
+    # окно сразу покрывает strict у всех провайдеров, мёртвый не задерживает остальных
+    assert state["started"][:3] == ["dead:strict", "a:strict", "b:strict"]
+    assert state["peak"] >= 3
+    assert elapsed < 1.0
+    assert [r["url"] for r in res] == ["https://a.example/s", "https://b.example/s"]
+    # висящие запросы мёртвого провайдера отменены
+    assert state["cancelled"] >= 1 and state["active"] == 0
+
+
+def test_fanout_hedges_when_window_is_stuck(monkeypatch):
+    started = []
+
+    def provider(name, delay):
+        async def fn(q):
+            started.append(name)
+            await asyncio.sleep(delay)
+            return [{"title": name, "url": f"https://{name}.example/{len(started)}", "snippet": ""}]
+
+        return fn
+
+    _setup(
+        monkeypatch,
+        [("slow", "Slow", provider("slow", 30)), ("fast", "Fast", provider("fast", 0.01))],
+        1,
+    )
+    monkeypatch.setattr(ls, "SEARCH_FANOUT_CONCURRENCY", 1)
+    monkeypatch.setattr(ls, "SEARCH_HEDGE_DELAY_SECONDS", 0.05)
+
+    res = asyncio.run(ls.multi_query_search_async(["hedge-q"]))
+    assert started == ["slow", "fast"]
+    assert res and res[0]["title"] == "fast"
@@ -0,0 +1,77 @@
+import asyncio
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+from core.cache import TTLCache
+from core.metrics import Registry, metrics_handler, span, stage_seconds, trace
+
+
+def test_counter_and_histogram_exposition():
+    reg = Registry()
+    hits = reg.counter("t_hits_total", "Hits", ("provider",))
+    lat = reg.histogram("t_seconds", "Latency", ("host",), buckets=(0.1, 1))
+    hits.inc(provider="ddg")
+    hits.inc(2, provider='we"ird')
+    lat.observe(0.05, host="a")
+    lat.observe(0.5, host="a")
+    lat.observe(5, host="a")
+    reg.collector(lambda: [("t_queue", "Queue", {"pool": "parse"}, 3)])
+
+    text = reg.render()
+    assert "# TYPE t_hits_total counter" in text
+    assert 't_hits_total{provider="ddg"} 1' in text
+    assert 't_hits_total{provider="we\\"ird"} 2' in text
+    assert 't_seconds_bucket{host="a",le="0.1"} 1' in text
+    assert 't_seconds_bucket{host="a",le="1"} 2' in text
+    assert 't_seconds_bucket{host="a",le="+Inf"} 3' in text
+    assert 't_seconds_count{host="a"} 3' in text
+    assert "# TYPE t_queue gauge" in text and 't_queue{pool="parse"} 3' in text
+    # повторная регистрация отдаёт ту же метрику
+    assert reg.counter("t_hits_total", "Hits", ("provider",)) is hits
+
+
+def test_span_records_status_and_trace():
+    before_ok = stage_seconds.count(stage="t_stage", status="ok")
+    before_err = stage_seconds.count(stage="t_stage", status="error")
+
+    async def run():
+        with trace() as spans:
+            with span("t_stage"):
+                await asyncio.sleep(0.01)
+            with pytest.raises(ValueError):
+                with span("t_stage"):
+                    raise ValueError
+        return spans
+
+    spans = asyncio.run(run())
+    assert set(spans) == {"t_stage"} and spans["t_stage"] >= 0.01
+    assert stage_seconds.count(stage="t_stage", status="ok") == before_ok + 1
+    assert stage_seconds.count(stage="t_stage", status="error") == before_err + 1
+
+
+def test_metrics_endpoint_includes_runtime_state():
+    cache = TTLCache("t_metrics", maxsize=4, ttl=60)
+    cache.set("k", 1)
+    cache.get("k")
+    cache.get("missing")
+
+    async def run():
+        app = web.Application()
+        app.router.add_get("/metrics", metrics_handler)
+        client = TestClient(TestServer(app))
+        await client.start_server()
+        try:
+            r = await client.get("/metrics")
+            return r.status, r.headers["Content-Type"], await r.text()
+        finally:
+            await client.close()
+
+    status, ctype, text = asyncio.run(run())
+    assert status == 200 and ctype.startswith("text/plain")
+    assert 'bot_cache{cache="t_metrics",stat="hits"} 1' in text
+    assert 'bot_cache{cache="t_metrics",stat="misses"} 1' in text
+    assert 'bot_stage_limit{stage="llm",stat="limit"}' in text
+    assert 'bot_scheduler{stat="active"} 0' in text
+    assert 'bot_http_pool{pool="dns",stat="' in text
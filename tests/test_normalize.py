@@ -0,0 +1,14 @@
+from nlp.normalize import normalize_question
+
+
+def test_drops_filler_and_punctuation():
+    assert (
+        normalize_question("Подскажите, пожалуйста: что грозит по ст. 20.1 КоАП?")
+        == "грозит ст 20.1 коап"
+    )
+
+
+def test_keeps_pronouns_negations_and_limits():
+    assert normalize_question("Он ударил меня") != normalize_question("Я ударил его")
+    assert normalize_question("штраф до 5000 рублей") != normalize_question("штраф от 5000 рублей")
+    assert "не" in normalize_question("Можно ли не платить штраф?").split()
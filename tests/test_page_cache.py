@@ -0,0 +1,36 @@
+from legal.page_cache import PageCache, canonical_url
+
+
+def test_canonical_url():
+    assert (
+        canonical_url("HTTPS://www.Consultant.ru:443/doc/?b=2&a=1&utm_source=x#frag")
+        == "https://consultant.ru/doc?a=1&b=2"
+    )
+
+
+def test_put_get_and_evict(tmp_path):
+    cache = PageCache(str(tmp_path / "pages.db"), ttl=60, max_bytes=10_000)
+    page = {
+        "url": "https://consultant.ru/a",
+        "title": "КоАП",
+        "text": "Статья 20.1",
+        "snippet": "Статья 20.1",
+    }
+    cache.put(page["url"], page, etag='"v1"')
+    hit = cache.get("https://www.consultant.ru/a/")
+    assert hit and hit.fresh and hit.page["title"] == "КоАП"
+    assert hit.validators() == {"If-None-Match": '"v1"'}
+
+    import os
+
+    for i in range(20):
+        cache.put(f"https://garant.ru/{i}", {"text": os.urandom(800).hex()})
+    assert cache.get(page["url"]) is None
+    assert cache.get("https://garant.ru/19") is not None
+
+
+def test_creates_data_dir_and_waits_for_locks(tmp_path):
+    cache = PageCache(str(tmp_path / "data" / "pages.db"))
+    assert cache._db.execute("PRAGMA busy_timeout").fetchone()[0] == 5000
+    cache.put("https://consultant.ru/a", {"text": "x"})
+    assert cache.get("https://consultant.ru/a").page == {"text": "x"}
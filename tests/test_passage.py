@@ -0,0 +1,30 @@
+from legal.passage import extract_passage, passage_is_enough
+
+NAV = (
+    "КонсультантПлюс Главная Кодексы Статья 20.1. Мелкое хулиганство "
+    "Статья 20.2. Нарушение порядка "
+)
+BODY = (
+    "Статья 20.1. Мелкое хулиганство (в ред. Федерального закона от 01.01.2020 N 123-ФЗ) "
+    "1. Мелкое хулиганство, то есть нарушение общественного порядка, "
+    + "влечет штраф. " * 30
+    + "2. Те же действия, сопряженные с неповиновением законному требованию, влекут штраф. "
+    "Статья 20.2. Нарушение установленного порядка"
+)
+
+
+def test_picks_article_body_not_navigation():
+    p = extract_passage(NAV + BODY, [("КоАП РФ", "20.1", "")])
+    assert p["article"] == "20.1"
+    assert p["snippet"].startswith(
+        "Федерального закона от 01.01.2020 N 123-ФЗ — Статья 20.1. Мелкое хулиганство (в ред."
+    )
+    assert "Статья 20.2" not in p["snippet"]
+    assert p["complete"]
+
+
+def test_part_window_and_no_match():
+    p = extract_passage(NAV + BODY, [("КоАП РФ", "20.1", "2")])
+    assert "… 2. Те же действия" in p["snippet"]
+    assert extract_passage(NAV + BODY, [("КоАП РФ", "20.10", "")]) is None
+    assert not passage_is_enough(extract_passage("Статья 20.1. Мелкое", [("", "20.1", "")]))
@@ -0,0 +1,101 @@
+import asyncio
+
+import legal.law_search as ls
+from legal.provider_health import CLOSED, HALF_OPEN, OPEN, ProviderHealthRegistry
+
+
+def _registry(**kw) -> ProviderHealthRegistry:
+    opts = dict(
+        window=10,
+        min_calls=3,
+        error_rate=0.5,
+        min_useful_rate=0.1,
+        open_seconds=10,
+        open_max_seconds=40,
+    )
+    opts.update(kw)
+    return ProviderHealthRegistry(**opts)
+
+
+def test_breaker_opens_probes_and_recovers():
+    reg = _registry()
+    h = reg.get("ddg")
+    for _ in range(3):
+        assert reg.acquire("ddg", now=0)
+        reg.record("ddg", 1.0, "error", now=0)
+    assert h.state == OPEN
+    reg.get("other")  # есть живой провайдер — выключенный пропускаем
+    assert not reg.acquire("ddg", now=5)
+
+    # пауза прошла: один пробный запрос, второй одновременно — нет
+    assert reg.acquire("ddg", now=11) and h.state == HALF_OPEN
+    assert not reg.acquire("ddg", now=11)
+    reg.record("ddg", 1.0, "empty", now=11)
+    assert h.state == OPEN and h.cooldown == 20  # неудачная проба — пауза вдвое
+
+    assert not reg.acquire("ddg", now=25)
+    assert reg.acquire("ddg", now=32)
+    reg.record("ddg", 0.2, "hit", now=32)
+    assert h.state == CLOSED and h.cooldown == 10
+    assert h.stats()["skipped"] == 3 and h.stats()["trips"] == 2
+
+
+def test_empty_results_trip_breaker_and_cancel_releases_probe():
+    reg = _registry()
+    reg.get("other")
+    for _ in range(3):
+        reg.record("startpage", 0.1, "empty", now=0)
+    assert reg.get("startpage").state == OPEN
+    assert reg.acquire("startpage", now=10)
+    reg.release("startpage")  # пробный запрос отменили — слот снова свободен
+    assert reg.acquire("startpage", now=10)
+
+
+def test_order_by_cost_and_skip_open():
+    reg = _registry()
+    for _ in range(3):
+        reg.record("google", 2.0, "hit", now=0)
+        reg.record("ddg", 0.5, "hit", now=0)
+    assert reg.order(["google", "ddg", "startpage"], now=1) == ["startpage", "ddg", "google"]
+    for _ in range(3):
+        reg.record("ddg", 0.5, "error", now=1)
+    assert reg.order(["google", "ddg"], now=2) == ["google"]
+
+
+def test_all_open_falls_back_to_configured_order():
+    reg = _registry()
+    for name in ("google", "ddg"):
+        for _ in range(3):
+            reg.record(name, 1.0, "error", now=0)
+    # выключены все — идём в исходном порядке, запрос пропускаем как последний шанс
+    assert reg.order(["google", "ddg"], now=1) == ["google", "ddg"]
+    assert reg.acquire("ddg", now=1)
+    reg.record("ddg", 0.3, "hit", now=1)
+    assert reg.get("ddg").state == CLOSED
+
+
+def test_search_skips_broken_provider(monkeypatch):
+    calls = {"bad": 0, "good": 0}
+
+    async def bad(q):
+        calls["bad"] += 1
+        raise RuntimeError("429")
+
+    async def good(q):
+        calls["good"] += 1
+        return [{"title": q, "url": f"https://example.org/{q}", "snippet": ""}]
+
+    monkeypatch.setattr(ls, "provider_health", _registry(adaptive=False))
+    monkeypatch.setattr(ls, "_providers", lambda: [("bad", "Bad", bad), ("good", "Good", good)])
+    monkeypatch.setattr(ls, "SEARCH_FANOUT", False)
+    monkeypatch.setattr(ls, "SEARCH_MAX_RESULTS", 1)
+    ls.search_cache.clear()
+
+    async def run():
+        return [await ls.multi_query_search_async([f"q{i}"]) for i in range(6)]
+
+    results = asyncio.run(run())
+    assert all(len(r) == 1 for r in results)
+    # после 3 ошибок (min_calls) плохой провайдер больше не опрашивается
+    assert calls == {"bad": 3, "good": 6}
+    assert ls.provider_health.stats()["bad"]["state"] == OPEN
@@ -0,0 +1,70 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from nlp import query_planner as qp
+
+PLAN = {
+    "Q_STRICT": "КоАП 20.1",
+    "Q_SEMI": "хулиганство КоАП",
+    "Q_BROAD": "мелкое хулиганство",
+    "Q_ALT": [],
+    "QUAL": ["КоАП РФ;20.1;1;хулиганство"],
+}
+
+
+@pytest.fixture
+def llm(monkeypatch):
+    """Подменяет OpenAI: state["reply"] — dict для JSON-ответа или исключение."""
+    state = {"reply": {}, "calls": 0}
+
+    async def create(**kw):
+        state["calls"] += 1
+        if isinstance(state["reply"], Exception):
+            raise state["reply"]
+        msg = SimpleNamespace(content=json.dumps(state["reply"], ensure_ascii=False))
+        return SimpleNamespace(choices=[SimpleNamespace(message=msg)], usage=None)
+
+    fake = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    monkeypatch.setattr(qp, "aclient", lambda: fake)
+    qp.plan_cache.clear()
+    return state
+
+
+def _ask(question: str) -> dict:
+    return asyncio.run(qp.plan_with_intent_async(question))
+
+
+def test_legal_label_returns_plan_and_caches(llm):
+    llm["reply"] = {"INTENT": "LEGAL", **PLAN}
+    plan = _ask("Что грозит за мелкое хулиганство?")
+    assert plan["INTENT"] == "LEGAL" and plan["QUAL"] == PLAN["QUAL"]
+    assert _ask("Что грозит за мелкое хулиганство?") == plan
+    assert llm["calls"] == 1
+
+
+@pytest.mark.parametrize("label", ["OFFTOPIC", "paralegal"])
+def test_non_legal_label_returns_stub(llm, label):
+    llm["reply"] = {"INTENT": label}
+    plan = _ask("Какой курс доллара сегодня?")
+    assert plan["INTENT"] == label.upper()
+    assert plan["QUAL"] == [] and plan["Q_ALT"] == []
+    assert qp.plan_cache.stats()["size"] == 0
+
+
+@pytest.mark.parametrize("reply", [PLAN, {"INTENT": "SPAM", **PLAN}])
+def test_missing_or_invalid_label_falls_back_to_legal(llm, reply):
+    llm["reply"] = reply
+    plan = _ask("Сосед шумит ночью")
+    assert plan["INTENT"] == "LEGAL" and plan["Q_STRICT"] == PLAN["Q_STRICT"]
+
+
+def test_llm_failure_is_not_cached(llm):
+    llm["reply"] = RuntimeError("timeout")
+    plan = _ask("Уехал с места ДТП")
+    assert plan["INTENT"] == "LEGAL" and plan["Q_STRICT"] == "Уехал с места ДТП"
+    llm["reply"] = {"INTENT": "LEGAL", **PLAN}
+    assert _ask("Уехал с места ДТП")["QUAL"] == PLAN["QUAL"]
+    assert llm["calls"] == 2
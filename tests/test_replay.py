@@ -0,0 +1,117 @@
+import asyncio
+import json
+import time
+
+import httpx
+import pytest
+
+from bench.pipeline_bench import SAMPLE_FIXTURES, percentile
+from bench.replay import FixtureStore, RecordingTransport, ReplayTransport
+from core.http import get_async_client, set_transport_wrapper
+
+
+def _upstream(request: httpx.Request) -> httpx.Response:
+    if request.url.path == "/v1/chat/completions":
+        user = json.loads(request.content)["messages"][-1]["content"]
+        return httpx.Response(200, json={"answer": user.upper()})
+    return httpx.Response(200, text=f"page {request.url.params.get('q')}", headers={"ETag": '"v1"'})
+
+
+def _chat(system: str, user: str) -> dict:
+    return {
+        "model": "m",
+        "messages": [{"role": "system", "content": system}, {"role": "user", "content": user}],
+    }
+
+
+def test_record_then_replay_offline(tmp_path):
+    path = str(tmp_path / "fx.jsonl")
+
+    async def record():
+        store = FixtureStore(path)
+        set_transport_wrapper(
+            lambda inner: RecordingTransport(httpx.MockTransport(_upstream), store)
+        )
+        try:
+            client = get_async_client()
+            r1 = await client.get(
+                "https://search.example/html", params={"q": "коап", "key": "SECRET"}
+            )
+            r2 = await client.post(
+                "https://api.openai.com/v1/chat/completions", json=_chat("Дата: 01.01", "вопрос")
+            )
+            return r1.text, r2.json()
+        finally:
+            set_transport_wrapper(None)
+
+    assert asyncio.run(record()) == ("page коап", {"answer": "ВОПРОС"})
+    assert "SECRET" not in open(path, encoding="utf-8").read()
+
+    async def replay(transport: ReplayTransport):
+        async with httpx.AsyncClient(transport=transport) as client:
+            started = time.perf_counter()
+            page = await client.get(
+                "https://search.example/html", params={"q": "коап", "key": "OTHER"}
+            )
+            # системный промпт (с датой) поменялся — запись всё равно находится
+            chat = await client.post(
+                "https://api.openai.com/v1/chat/completions", json=_chat("Дата: 02.01", "вопрос")
+            )
+            missing = await client.get("https://search.example/html", params={"q": "другое"})
+            return page, chat, missing, time.perf_counter() - started
+
+    transport = ReplayTransport(FixtureStore.load(path), latency=0.05, loose=False)
+    page, chat, missing, elapsed = asyncio.run(replay(transport))
+    assert page.text == "page коап" and page.headers["etag"] == '"v1"'
+    assert chat.json() == {"answer": "ВОПРОС"}
+    assert missing.status_code == 404
+    assert elapsed >= 0.15
+    assert transport.stats == {"replayed": 2, "missing": 1}
+
+
+def test_failure_injection(tmp_path):
+    store = FixtureStore(str(tmp_path / "fx.jsonl"))
+
+    async def run(failure: str):
+        transport = ReplayTransport(
+            store, latency=0, fail_rate=1.0, failure=failure, fail_hosts=["bad.example"]
+        )
+        async with httpx.AsyncClient(transport=transport) as client:
+            ok = await client.get("https://good.example/")
+            if failure == "503":
+                return ok, await client.get("https://bad.example/")
+            with pytest.raises(httpx.TransportError):
+                await client.get("https://bad.example/")
+            return ok, None
+
+    ok, bad = asyncio.run(run("503"))
+    assert ok.status_code == 404 and bad.status_code == 503
+    asyncio.run(run("error"))
+    asyncio.run(run("timeout"))
+
+
+def test_sample_fixtures_cover_pipeline():
+    # офлайн-прогон из коробки: у каждого внешнего вызова конвейера есть запись
+    from nlp.intent import LLM_INTENT_MAX_TOKENS
+
+    store = FixtureStore.load(SAMPLE_FIXTURES)
+    chat = "POST api.openai.com/v1/chat/completions stream=False"
+    for endpoint in (
+        "GET html.duckduckgo.com/html/",
+        "GET www.startpage.com/sp/search",
+        f"{chat} format= max_tokens={LLM_INTENT_MAX_TOKENS}",
+        f"{chat} format=json_object max_tokens=400",
+        f"{chat} format=json_object max_tokens=420",
+        f"{chat} format= max_tokens=700",
+    ):
+        rec = store.find("", endpoint, loose=True)
+        assert rec is not None and rec["status"] == 200, endpoint
+    assert "api_key" not in open(SAMPLE_FIXTURES, encoding="utf-8").read()
+
+
+def test_percentile_nearest_rank():
+    values = [i / 100 for i in range(1, 101)]
+    assert percentile(values, 50) == 0.5
+    assert percentile(values, 95) == 0.95
+    assert percentile(values, 99) == 0.99
+    assert percentile([0.3], 99) == 0.3
@@ -0,0 +1,112 @@
+import asyncio
+
+import pytest
+
+from services.scheduler import PRIORITY_FREE, PRIORITY_PAID, Scheduler, SchedulerBusy
+
+
+def test_paid_lane_first_and_shedding():
+    async def run():
+        s = Scheduler(max_active=1, per_user=1, notify_depth=2, queue_max=2)
+        gate = asyncio.Event()
+        order = []
+        notified = []
+
+        async def job(name, wait=False):
+            if wait:
+                await gate.wait()
+            order.append(name)
+            return name
+
+        async def on_queued(pos):
+            notified.append(pos)
+
+        first = asyncio.create_task(s.run(1, PRIORITY_FREE, lambda: job("first", True)))
+        await asyncio.sleep(0)
+        free = asyncio.create_task(s.run(2, PRIORITY_FREE, lambda: job("free"), on_queued))
+        await asyncio.sleep(0)
+        paid = asyncio.create_task(s.run(3, PRIORITY_PAID, lambda: job("paid"), on_queued))
+        await asyncio.sleep(0)
+        assert s.stats()["queued"] == 2
+        with pytest.raises(SchedulerBusy):
+            await s.run(4, PRIORITY_FREE, lambda: job("shed"))
+        gate.set()
+        await asyncio.gather(first, free, paid)
+        return order, notified, s.stats()
+
+    order, notified, stats = asyncio.run(run())
+    assert order == ["first", "paid", "free"]
+    assert notified == [2]
+    assert stats == {"active": 0, "queued": 0, "users": 0, "shed": 1}
+
+
+def test_per_user_questions_run_one_at_a_time():
+    async def run():
+        s = Scheduler(max_active=4, per_user=1)
+        running = 0
+        peak = 0
+
+        async def job():
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+
+        await asyncio.gather(*(s.run(7, PRIORITY_FREE, job) for _ in range(3)))
+        return peak
+
+    assert asyncio.run(run()) == 1
+
+
+def test_payment_tops_up_priority_lane(monkeypatch, tmp_path):
+    from types import SimpleNamespace
+
+    import core.config as cfg
+    import core.credits as credits
+    from services.scheduler import user_priority
+
+    monkeypatch.setattr(cfg, "TELEGRAM_BOT_TOKEN", "123456:AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA")
+    import bot
+
+    monkeypatch.setattr(credits, "_store", credits.CreditsStore(str(tmp_path / "c.db")))
+
+    class FakeScheduler:
+        priorities = []
+
+        async def run(self, user_id, priority, fn, on_queued=None):
+            self.priorities.append(priority)
+            return await fn()
+
+    monkeypatch.setattr(bot, "scheduler", FakeScheduler())
+    sent = []
+
+    async def answer(text):
+        sent.append(text)
+
+    m = SimpleNamespace(
+        from_user=SimpleNamespace(id=77), chat=SimpleNamespace(id=77), answer=answer
+    )
+
+    async def offtopic(outcome):
+        outcome.update(intent="OFFTOPIC", billable=False)
+        return "я юридический помощник"
+
+    async def legal(outcome):
+        outcome.update(intent="LEGAL", billable=True)
+        return "ответ"
+
+    async def run():
+        assert await user_priority(77) == PRIORITY_FREE
+        await bot.successful_payment_handler(m)
+        assert await user_priority(77) == PRIORITY_PAID
+        await bot._scheduled(m, offtopic)  # приоритет есть, но не юридический ответ — не списываем
+        await bot._scheduled(m, legal)  # юридический ответ — кредит списан
+        await bot._scheduled(m, legal)
+        balance = await credits.get_balance(77)
+        await credits.close_db()
+        return balance
+
+    assert asyncio.run(run()) == 0
+    assert FakeScheduler.priorities == [PRIORITY_PAID, PRIORITY_PAID, PRIORITY_FREE]
+    assert sent == ["Спасибо за оплату ✅"]
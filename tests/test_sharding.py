@@ -0,0 +1,93 @@
+import asyncio
+import os
+import time
+
+from aiogram import Bot, Dispatcher, F
+from aiogram.types import Message
+
+from services.sharding import ShardRouter, shard_for, update_chat_id
+
+TOKEN = "123456:AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA"
+
+# этот же модуль — приложение воркера: воркеры импортируют его и берут bot/dp
+bot = Bot(TOKEN)
+dp = Dispatcher()
+
+
+@dp.message(F.text)
+async def record(m: Message):
+    if m.text == "crash":
+        os._exit(3)
+    await asyncio.sleep(0.01)
+    with open(os.environ["SHARD_TEST_OUT"], "a") as f:
+        f.write(f"{m.chat.id} {m.text} {os.getpid()}\n")
+
+
+def _update(update_id: int, chat_id: int, text: str) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 0,
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "u"},
+            "text": text,
+        },
+    }
+
+
+async def _settle(router: ShardRouter) -> None:
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline and any(s["pending"] for s in router.stats()):
+        await asyncio.sleep(0.1)
+
+
+def test_update_chat_id_and_stable_shard():
+    assert update_chat_id(_update(1, 42, "x")) == 42
+    cb = {
+        "update_id": 2,
+        "callback_query": {"id": "1", "from": {"id": 7}, "message": {"chat": {"id": 9}}},
+    }
+    assert update_chat_id(cb) == 9
+    assert update_chat_id({"update_id": 3, "pre_checkout_query": {"from": {"id": 5}}}) == 5
+    assert shard_for(42, 4) == shard_for(42, 4)
+    assert {shard_for(c, 4) for c in range(100)} == {0, 1, 2, 3}
+
+
+def test_per_chat_order_and_crash_recovery(tmp_path, monkeypatch):
+    out = tmp_path / "out.txt"
+    monkeypatch.setenv("SHARD_TEST_OUT", str(out))
+    chats = [101, 202, 303, 404]
+
+    async def run():
+        router = ShardRouter(2, app="test_sharding", concurrency=4)
+        await router.start()
+        try:
+            uid = 0
+            for i in range(5):
+                for chat in chats:
+                    uid += 1
+                    await router.route(_update(uid, chat, f"m{i}"))
+            await _settle(router)
+            # падение посреди очереди чата: «crash» теряется, следующие — доставляются
+            await router.route(_update(1000, 101, "crash"))
+            await router.route(_update(1001, 101, "after1"))
+            await router.route(_update(1002, 101, "after2"))
+            await _settle(router)
+            return router.stats()
+        finally:
+            await router.stop()
+
+    stats = asyncio.run(run())
+    rows = [line.split() for line in out.read_text().splitlines()]
+    by_chat = {}
+    for chat, text, pid in rows:
+        by_chat.setdefault(int(chat), []).append((text, pid))
+    for chat in chats:
+        texts = [t for t, _ in by_chat[chat]]
+        expected = [f"m{i}" for i in range(5)] + (["after1", "after2"] if chat == 101 else [])
+        assert texts == expected
+    for chat in chats[1:]:
+        assert len({pid for _, pid in by_chat[chat]}) == 1
+    assert sum(s["restarts"] for s in stats) == 1
+    assert sum(s["lost"] for s in stats) == 1
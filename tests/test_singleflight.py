@@ -0,0 +1,107 @@
+import asyncio
+
+import pytest
+
+from core.singleflight import SingleFlight
+
+
+def test_concurrent_callers_share_one_call():
+    sf = SingleFlight("t")
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {"v": 1}
+
+    async def run():
+        return await asyncio.gather(*(sf.do("k", work) for _ in range(5)))
+
+    results = asyncio.run(run())
+    assert len(calls) == 1
+    assert all(r == {"v": 1} for r in results)
+    assert sf.stats() == {"calls": 5, "shared": 4, "inflight": 0}
+
+
+def test_error_propagates_to_all_callers():
+    sf = SingleFlight("t")
+
+    async def boom():
+        await asyncio.sleep(0.01)
+        raise ValueError("x")
+
+    async def run():
+        return await asyncio.gather(*(sf.do("k", boom) for _ in range(3)), return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert all(isinstance(r, ValueError) for r in results)
+
+
+def test_cancelling_one_waiter_keeps_work_for_others():
+    sf = SingleFlight("t")
+    done = []
+
+    async def work():
+        await asyncio.sleep(0.02)
+        done.append(1)
+        return 42
+
+    async def run():
+        a = asyncio.create_task(sf.do("k", work))
+        b = asyncio.create_task(sf.do("k", work))
+        await asyncio.sleep(0)
+        a.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await a
+        return await b
+
+    assert asyncio.run(run()) == 42
+    assert done == [1]
+
+
+def test_cancelling_all_waiters_cancels_work():
+    sf = SingleFlight("t")
+    done = []
+
+    async def work():
+        await asyncio.sleep(0.05)
+        done.append(1)
+
+    async def run():
+        a = asyncio.create_task(sf.do("k", work))
+        await asyncio.sleep(0)
+        a.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await a
+        await asyncio.sleep(0.07)
+        return sf.stats()["inflight"]
+
+    assert asyncio.run(run()) == 0
+    assert done == []
+
+
+def test_new_caller_after_last_waiter_cancelled_starts_fresh():
+    sf = SingleFlight("t")
+    calls = []
+
+    async def work():
+        calls.append(1)
+        try:
+            await asyncio.sleep(0.02)
+        except asyncio.CancelledError:
+            await asyncio.sleep(0.01)  # отмена не мгновенная (закрытие соединения и т. п.)
+            raise
+        return len(calls)
+
+    async def run():
+        a = asyncio.create_task(sf.do("k", work))
+        await asyncio.sleep(0)
+        a.cancel()
+        await asyncio.sleep(0.001)  # последний ожидающий ушёл, работа ещё отменяется
+        b = asyncio.create_task(sf.do("k", work))
+        with pytest.raises(asyncio.CancelledError):
+            await a
+        return await b
+
+    assert asyncio.run(run()) == 2
+    assert len(calls) == 2
@@ -0,0 +1,37 @@
+from legal.statute_index import StatuteIndex, build_index, norm_code, targets_from_qual
+
+KOAP = """# source: http://pravo.gov.ru/koap
+Раздел I. Общие положения
+Статья 20.1. Мелкое хулиганство
+1. Мелкое хулиганство, то есть нарушение общественного порядка, -
+влечет наложение административного штрафа в размере от пятисот до одной тысячи рублей.
+2. Те же действия, сопряженные с неповиновением законному требованию представителя власти, -
+влечет наложение административного штрафа в размере от одной тысячи до двух тысяч пятисот рублей.
+Статья 20.2. Нарушение установленного порядка организации публичного мероприятия
+1. Нарушение порядка организации публичного мероприятия -
+"""
+
+
+def test_build_and_resolve(tmp_path):
+    (tmp_path / "koap.txt").write_text(KOAP, encoding="utf-8")
+    db = str(tmp_path / "statutes.db")
+    assert build_index(str(tmp_path), db) == 2
+
+    idx = StatuteIndex(db)
+    hit = idx.lookup("коап рф", "20.1", "2")
+    assert hit["source"] == "http://pravo.gov.ru/koap"
+    assert "неповиновением" in hit["text"] and "пятисот до одной" not in hit["text"]
+
+    pages = idx.resolve_targets(targets_from_qual(["КоАП РФ;ст. 20.1;ч.1;мелкое хулиганство"]))
+    assert pages and pages[0]["title"].startswith("КоАП РФ ст. 20.1 ч. 1")
+    assert (
+        idx.resolve_targets(targets_from_qual(["КоАП РФ;20.1;1;x", "УК РФ;119;1;угроза"])) is None
+    )
+
+    assert idx.search("хулиганство")[0]["article"] == "20.1"
+
+
+def test_norm_code():
+    assert norm_code("Уголовно-процессуальный кодекс") == "УПК РФ"
+    assert norm_code("УК РФ") == "УК РФ"
+    assert norm_code("коап") == "КоАП РФ"
@@ -0,0 +1,68 @@
+import asyncio
+
+from aiogram.exceptions import TelegramNetworkError
+
+from services.telegram_stream import PLACEHOLDER, StreamingReply, stream_first_text_seconds
+
+
+class _Sent:
+    def __init__(self, log, fail):
+        self.log = log
+        self.fail = fail
+
+    async def edit_text(self, text):
+        if self.fail:
+            raise TelegramNetworkError(method=None, message="connection reset")
+        self.log.append(text)
+
+
+class _Message:
+    def __init__(self, fail_edits=False):
+        self.log = []
+        self.fail_edits = fail_edits
+
+    async def answer(self, text):
+        self.log.append(text)
+        return _Sent(self.log, self.fail_edits)
+
+
+def test_first_visible_text_observed_once():
+    before = stream_first_text_seconds.count()
+    m = _Message()
+    reply = StreamingReply(m, interval=0)
+
+    async def run():
+        await reply.start()
+        await reply.update("Статья 20.1")
+        await reply.update("Статья 20.1 КоАП")
+        await reply.finish("Статья 20.1 КоАП РФ")
+
+    asyncio.run(run())
+    assert m.log == [PLACEHOLDER, "Статья 20.1 …", "Статья 20.1 КоАП …", "Статья 20.1 КоАП РФ"]
+    assert reply.ttft is not None
+    assert stream_first_text_seconds.count() == before + 1
+
+
+def test_failed_edit_does_not_abort_update():
+    m = _Message(fail_edits=True)
+    reply = StreamingReply(m, interval=0)
+
+    async def run():
+        await reply.start()
+        await reply.update("Статья 20.1")  # сбой сети не обрывает генерацию
+
+    asyncio.run(run())
+    assert reply.ttft is None
+    assert m.log == [PLACEHOLDER]
+
+
+def test_failed_final_edit_falls_back_to_new_message():
+    m = _Message(fail_edits=True)
+    reply = StreamingReply(m, interval=0)
+
+    async def run():
+        await reply.start()
+        await reply.finish("Статья 20.1 КоАП РФ")
+
+    asyncio.run(run())
+    assert m.log == [PLACEHOLDER, "Статья 20.1 КоАП РФ"]
@@ -0,0 +1,63 @@
+import asyncio
+import json
+import sys
+
+from services import voice
+
+
+class _FakeRecognizer:
+    def __init__(self):
+        self.chunks = []
+        self.resets = 0
+
+    def AcceptWaveform(self, data):
+        self.chunks.append(len(data))
+        return len(self.chunks) % 3 == 0
+
+    def Result(self):
+        return json.dumps({"text": f"фраза{len(self.chunks) // 3}"})
+
+    def PartialResult(self):
+        return json.dumps({"partial": "..."})
+
+    def FinalResult(self):
+        return json.dumps({"text": "конец"})
+
+    def Reset(self):
+        self.resets += 1
+
+
+def test_recognize_pcm_chunks_and_reuses_recognizer(monkeypatch):
+    created = []
+
+    def factory():
+        created.append(_FakeRecognizer())
+        return created[-1]
+
+    monkeypatch.setattr(voice, "recognizers", voice.RecognizerPool(1, factory))
+    partials = []
+    pcm = b"\0" * (voice.CHUNK_BYTES * 7 + 10)
+
+    text = voice.recognize_pcm(pcm, partials.append)
+    assert text == "фраза1 фраза2 конец"
+    assert created[0].chunks == [voice.CHUNK_BYTES] * 7 + [10]
+    assert partials and partials[0] == "..."
+
+    voice.recognize_pcm(pcm)
+    assert len(created) == 1
+    assert created[0].resets == 2
+
+
+def test_decode_ogg_async_pipes_bytes(monkeypatch):
+    # ffmpeg подменяем процессом, который отдаёт stdin задом наперёд
+    monkeypatch.setattr(voice, "_ffmpeg_ok", True)
+    monkeypatch.setattr(
+        voice,
+        "FFMPEG_DECODE",
+        [
+            sys.executable,
+            "-c",
+            "import sys; sys.stdout.buffer.write(sys.stdin.buffer.read()[::-1])",
+        ],
+    )
+    assert asyncio.run(voice.decode_ogg_async(b"OggS123")) == b"321SggO"
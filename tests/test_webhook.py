@@ -0,0 +1,95 @@
+import asyncio
+
+from aiogram import Bot, Dispatcher, F
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.types import Message
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+from services.webhook import SECRET_HEADER, WebhookIngress
+
+TOKEN = "123456:AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA"
+
+
+def _update(update_id: int, text: str) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 0,
+            "chat": {"id": 42, "type": "private"},
+            "from": {"id": 42, "is_bot": False, "first_name": "u"},
+            "text": text,
+        },
+    }
+
+
+async def _fake_telegram(sent: list) -> TestServer:
+    """Заглушка Bot API: принимает sendMessage и запоминает текст."""
+
+    async def send_message(request: web.Request) -> web.Response:
+        data = dict(await request.post()) or await request.json()
+        sent.append(data["text"])
+        return web.json_response(
+            {
+                "ok": True,
+                "result": {
+                    "message_id": len(sent),
+                    "date": 0,
+                    "chat": {"id": int(data["chat_id"]), "type": "private"},
+                    "text": data["text"],
+                },
+            }
+        )
+
+    app = web.Application()
+    app.router.add_post("/bot{token}/sendMessage", send_message)
+    server = TestServer(app)
+    await server.start_server()
+    return server
+
+
+def test_webhook_acks_immediately_and_processes_in_background():
+    async def run():
+        sent: list = []
+        tg = await _fake_telegram(sent)
+        api = TelegramAPIServer.from_base(str(tg.make_url("")).rstrip("/"))
+        bot = Bot(TOKEN, session=AiohttpSession(api=api))
+        dp = Dispatcher()
+        release = asyncio.Event()
+
+        @dp.message(F.text)
+        async def echo(m: Message):
+            await release.wait()
+            await m.answer("echo: " + m.text)
+
+        ingress = WebhookIngress(dp, bot, secret="s3cret", concurrency=2, max_pending=3)
+        client = TestClient(TestServer(ingress.app("/hook")))
+        await client.start_server()
+        try:
+            bad = await client.post("/hook", json=_update(1, "x"), headers={SECRET_HEADER: "wrong"})
+            assert bad.status == 401
+
+            # ответ 200 приходит, пока обработчик ещё ждёт
+            for i in range(3):
+                r = await client.post(
+                    "/hook", json=_update(10 + i, f"q{i}"), headers={SECRET_HEADER: "s3cret"}
+                )
+                assert r.status == 200
+            assert sent == []
+            # очередь заполнена — просим Telegram повторить позже
+            r = await client.post("/hook", json=_update(20, "q"), headers={SECRET_HEADER: "s3cret"})
+            assert r.status == 503
+
+            release.set()
+            await ingress.drain(timeout=5)
+            return sorted(sent), ingress.stats()
+        finally:
+            await client.close()
+            await bot.session.close()
+            await tg.close()
+
+    sent, stats = asyncio.run(run())
+    assert sent == ["echo: q0", "echo: q1", "echo: q2"]
+    assert stats == {"pending": 0, "processed": 3, "failed": 0, "rejected": 1}
@@ -0,0 +1,46 @@
+import asyncio
+import threading
+import time
+
+from core.workers import WorkerPool
+
+
+def test_thread_pool_bounds_and_stats():
+    pool = WorkerPool("t", "thread", size=1, queue_size=0)
+    running = []
+    peak = []
+    lock = threading.Lock()
+
+    def work(x):
+        with lock:
+            running.append(x)
+            peak.append(len(running))
+        time.sleep(0.02)
+        with lock:
+            running.remove(x)
+        return x * 2
+
+    async def run():
+        return await asyncio.gather(*(pool.run(work, i) for i in range(4)))
+
+    try:
+        assert asyncio.run(run()) == [0, 2, 4, 6]
+    finally:
+        pool.shutdown()
+    assert max(peak) == 1
+    s = pool.stats()["test_thread_pool_bounds_and_stats.<locals>.work"]
+    assert s["count"] == 4
+    assert s["run_max"] >= 0.02
+    assert s["wait_total"] > 0
+
+
+def test_process_pool_runs_picklable_functions():
+    pool = WorkerPool("p", "process", size=1, queue_size=2)
+    try:
+        assert asyncio.run(pool.run(sum, [1, 2, 3])) == 6
+        # состояние в процесс не передаётся — такие задачи идут в потоки
+        box = []
+        asyncio.run(pool.run(box.append, 1, threads_only=True))
+        assert box == [1]
+    finally:
+        pool.shutdown()